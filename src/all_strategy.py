@@ -1,2 +1,3 @@
 from kdj_strategy import KDJ_Strategy
 import macd_strategy
+from portfolio_strategy import PortfolioKDJ
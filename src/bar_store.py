@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_ROOT = '../data/bar_store'
+KTYPE_DAY = 'K_DAY'  # same values as futu KLType
+KTYPE_WEEK = 'K_WEEK'
+KTYPE_MON = 'K_MON'
+KTYPE_1M = 'K_1M'
+KTYPE_60M = 'K_60M'
+
+# pandas grouping of the higher timeframes, buckets closed on the right like kline time_keys
+RESAMPLE_RULES = {
+    KTYPE_WEEK: dict(freq='W-FRI'),
+    KTYPE_MON: dict(freq='ME'),
+    # 港股 9:30 开盘，60 分钟线从 9:30 起算
+    KTYPE_60M: dict(freq='60min', origin='start_day', offset='30min'),
+}
+# 周期从短到长，只能由短周期重采样出长周期
+KTYPE_ORDER = (KTYPE_1M, KTYPE_60M, KTYPE_DAY, KTYPE_WEEK, KTYPE_MON)
+BAR_AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum', 'turnover': 'sum'}
+
+META_FILE = 'meta.json'
+SOURCES_FILE = 'sources.json'
+
+
+def _hash_file(path, chunk_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _replace(path, write):
+    '''Write ``path`` through ``write(f)`` on a temp file moved over it once complete.
+
+    Readers holding the old file memory-mapped keep their (now unlinked)
+    copy, an in-place rewrite would cut the pages from under them (SIGBUS).
+    '''
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _save_npy(path, values):
+    _replace(path, lambda f: np.save(f, values))
+
+
+def _append_npy(path, values, rows):
+    '''Append ``values`` to a 1-d ``.npy`` file holding ``rows - len(values)`` items'''
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_offset = f.tell()
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+            np.lib.format.dtype_to_descr(dtype), rows)
+        prefix = 10 if version == (1, 0) else 12  # magic, version and header length
+        padding = data_offset - prefix - len(header) - 1
+        if padding < 0 or (dtype.kind == 'U' and values.dtype.itemsize > dtype.itemsize):
+            # wider strings or no room left in the header, fall back to a rewrite
+            f.seek(0)
+            old = np.lib.format.read_array(f)
+            f.close()
+            _save_npy(path, np.concatenate([old, values]))
+            return
+
+        values = np.ascontiguousarray(values, dtype=dtype)
+        f.seek(0, os.SEEK_END)
+        f.write(values.tobytes())
+        # 数据写完后才改头部的长度
+        f.seek(prefix)
+        f.write((header + ' ' * padding + '\n').encode('latin1'))
+
+
+class BarStore(object):
+    '''Columnar on-disk bar cache, one directory per code/ktype.
+
+    Every column is saved as its own ``.npy`` file and loaded back with
+    ``mmap_mode='r'``, so a read costs no parsing and no copy of the bars.
+    '''
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+
+    def path_for(self, code, ktype=KTYPE_DAY):
+        return os.path.join(self.root, code, str(ktype))
+
+    def exists(self, code, ktype=KTYPE_DAY):
+        return os.path.exists(os.path.join(self.path_for(code, ktype), META_FILE))
+
+    def read_meta(self, code, ktype=KTYPE_DAY):
+        with open(os.path.join(self.path_for(code, ktype), META_FILE)) as f:
+            return json.load(f)
+
+    def write(self, df, code, ktype=KTYPE_DAY, meta=None):
+        path = self.path_for(code, ktype)
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+        # 先删掉 meta，写到一半中断时该条目会被视为不存在
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        columns = []
+        for name in df.columns:
+            if str(name).startswith('Unnamed'):
+                continue  # index column left behind by DataFrame.to_excel
+            values = df[name].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)  # fixed width, so it can be memory-mapped
+            _save_npy(os.path.join(path, '%s.npy' % name), values)
+            columns.append(name)
+
+        meta = json.dumps(dict(meta or {}, columns=columns, rows=len(df))).encode('utf-8')
+        _replace(meta_path, lambda f: f.write(meta))
+
+    def append(self, df, code, ktype=KTYPE_DAY):
+        '''Add bars after the stored ones without rewriting the existing data.
+
+        Each column file grows in place: the new rows go to the end of the
+        ``.npy`` and only its header is patched with the new length. The meta
+        file is updated last, so an interrupted append leaves the previous
+        rows readable.
+        '''
+        if not self.exists(code, ktype):
+            return self.write(df, code, ktype)
+        path = self.path_for(code, ktype)
+        meta = self.read_meta(code, ktype)
+        rows = meta['rows'] + len(df)
+        for name in meta['columns']:
+            values = df[name].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            _append_npy(os.path.join(path, '%s.npy' % name), values, rows)
+
+        meta['rows'] = rows
+        meta = json.dumps(meta).encode('utf-8')
+        _replace(os.path.join(path, META_FILE), lambda f: f.write(meta))
+
+    def write_pages(self, pages, code, ktype=KTYPE_DAY):
+        '''``write`` from an iterable of frames (e.g. kline pages), one page in
+        memory at a time. Returns the number of rows written.
+
+        The pages go to a staging directory that replaces the stored bars
+        only once the last page is in, a download failing half way keeps
+        the previous bars whole.
+        '''
+        os.makedirs(self.root, exist_ok=True)
+        staging = BarStore(tempfile.mkdtemp(prefix='.staging-', dir=self.root))
+        try:
+            rows = 0
+            for page in pages:
+                if rows:
+                    staging.append(page, code, ktype)
+                else:
+                    staging.write(page, code, ktype)
+                rows += len(page)
+            path = self.path_for(code, ktype)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                # 目录不能 replace 到非空目录上，旧目录先挪开；已 mmap 的读者不受影响
+                os.replace(path, os.path.join(staging.root, 'replaced'))
+            os.replace(staging.path_for(code, ktype), path)
+        finally:
+            shutil.rmtree(staging.root, ignore_errors=True)
+        return rows
+
+    def resampled(self, code, ktype, base_ktype=KTYPE_DAY):
+        '''``ktype`` bars of ``code`` resampled from its stored ``base_ktype`` bars.
+
+        The result is stored next to the base series (under
+        ``derived_ktype``) and read back as long as the base has the same
+        number of rows, so it is computed again only after the base grew.
+        '''
+        check_higher(ktype, base_ktype)
+        derived = derived_ktype(ktype, base_ktype)
+        rows = self.read_meta(code, base_ktype)['rows']
+        if self.exists(code, derived) and self.read_meta(code, derived).get('source_rows') == rows:
+            return self.read(code, derived)
+        base = self.read(code, base_ktype)
+        base.index = parse_time_key(base['time_key'])
+        data = resample_bars(base, ktype).reset_index(drop=True)
+        self.write(data, code, derived, meta={'source_ktype': base_ktype, 'source_rows': rows})
+        return self.read(code, derived)
+
+    def codes(self, ktype=KTYPE_DAY):
+        '''Codes stored with bars of ``ktype``, without the copies of xlsx exports'''
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(code for code in os.listdir(self.root) if '@' not in code and self.exists(code, ktype))
+
+    def read_columns(self, code, ktype=KTYPE_DAY, columns=None):
+        '''Memory-mapped column arrays by name, without building a DataFrame'''
+        path = self.path_for(code, ktype)
+        if columns is None:
+            columns = self.read_meta(code, ktype)['columns']
+        return dict((name, np.load(os.path.join(path, '%s.npy' % name), mmap_mode='r')) for name in columns)
+
+    def read(self, code, ktype=KTYPE_DAY, columns=None):
+        return pd.DataFrame(self.read_columns(code, ktype, columns), copy=False)
+
+    def _load_sources(self):
+        path = os.path.join(self.root, SOURCES_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_sources(self, sources):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, SOURCES_FILE), 'w') as f:
+            json.dump(sources, f, indent=1)
+
+    def read_excel(self, xlsx_path, ktype=KTYPE_DAY):
+        '''Cached replacement for ``pd.read_excel`` on a Futu kline export.
+
+        The xlsx is only parsed again when its mtime/size changed *and* its
+        content hash no longer matches the one recorded at conversion time.
+        Each export gets its own entry (``source_code``), two exports of the
+        same code (other dates, other ktype) never overwrite each other.
+        '''
+        key = os.path.abspath(xlsx_path)
+        stat = os.stat(xlsx_path)
+        sources = self._load_sources()
+        entry = sources.get(key)
+
+        if entry is not None and entry['ktype'] == ktype and 'store_code' in entry \
+                and self.exists(entry['store_code'], ktype):
+            if entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                return self.read(entry['store_code'], ktype)
+            digest = _hash_file(xlsx_path)
+            if entry['sha1'] == digest:
+                # touched but unchanged, just remember the new mtime
+                entry['mtime'], entry['size'] = stat.st_mtime, stat.st_size
+                self._save_sources(sources)
+                return self.read(entry['store_code'], ktype)
+        else:
+            digest = _hash_file(xlsx_path)
+
+        data = pd.read_excel(xlsx_path)
+        if 'code' in data.columns and len(data):
+            code = str(data['code'].iloc[0])
+        else:
+            code = os.path.splitext(os.path.basename(xlsx_path))[0]
+        store_code = source_code(code, key)
+        self.write(data, store_code, ktype)
+
+        sources[key] = {'code': code, 'store_code': store_code, 'ktype': ktype, 'mtime': stat.st_mtime,
+                        'size': stat.st_size, 'sha1': digest}
+        self._save_sources(sources)
+        return self.read(store_code, ktype)
+
+
+def source_code(code, xlsx_path):
+    '''Store key of the bars of ``code`` converted from the export at ``xlsx_path``'''
+    return '%s@%s' % (code, hashlib.sha1(os.path.abspath(xlsx_path).encode('utf-8')).hexdigest()[:12])
+
+
+def read_excel(xlsx_path, ktype=KTYPE_DAY, root=DEFAULT_ROOT):
+    return BarStore(root).read_excel(xlsx_path, ktype)
+
+
+def parse_time_key(time_key):
+    '''Vectorized parse of Futu ``time_key`` strings ('YYYY-MM-DD HH:MM:SS').
+
+    Daily bars come back at midnight, intraday bars keep their time part.
+    '''
+    return pd.DatetimeIndex(pd.to_datetime(time_key, format='ISO8601'), name='datetime')
+
+
+def clip_window(data, start=None, end=None):
+    '''Inclusive [start, end] slice on a datetime index.'''
+    if not data.index.is_monotonic_increasing:
+        data = data.sort_index(kind='stable')
+    return data.loc[start:end]
+
+
+def derived_ktype(ktype, base_ktype):
+    '''Store key of ``ktype`` bars resampled from ``base_ktype``, apart from downloaded ones'''
+    return '%s@%s' % (ktype, base_ktype)
+
+
+def check_higher(ktype, base_ktype):
+    '''ValueError unless ``ktype`` is a longer period than ``base_ktype``'''
+    if KTYPE_ORDER.index(ktype) <= KTYPE_ORDER.index(base_ktype):
+        raise ValueError('cannot resample %s bars to %s, it is not a higher timeframe' % (base_ktype, ktype))
+
+
+def resample_bars(data, ktype):
+    '''Vectorized resample of datetime indexed bars to the higher timeframe ``ktype``.
+
+    Each bar is stamped with the time of the last base bar in it, so it
+    only shows up once all of them closed. The columns stay those of a
+    kline export (``last_close`` is the previous resampled close).
+    '''
+    if ktype not in RESAMPLE_RULES:
+        raise ValueError('cannot resample to %r, expected one of %s' % (ktype, ', '.join(RESAMPLE_RULES)))
+    grouper = pd.Grouper(closed='right', label='right', **RESAMPLE_RULES[ktype])
+    agg = dict((name, how) for name, how in BAR_AGG.items() if name in data.columns)
+    if 'code' in data.columns:
+        agg['code'] = 'first'
+    groups = data.groupby(grouper)
+    bars = groups.agg(agg)
+    bars['stamp'] = pd.Series(data.index, index=data.index).groupby(grouper).max()
+    bars = bars[bars['close'].notna()]
+    bars.index = pd.DatetimeIndex(bars.pop('stamp'), name='datetime')
+    bars['time_key'] = bars.index.strftime('%Y-%m-%d %H:%M:%S')
+    bars['last_close'] = bars['close'].shift(1)
+    return bars
+
+
+def set_datetime_index(data, start=None, end=None):
+    data.index = parse_time_key(data['time_key'])
+    if start is not None or end is not None:
+        data = clip_window(data, start, end)
+    return data
+
+
+def load_bars(xlsx_path, start=None, end=None, ktype=KTYPE_DAY, root=DEFAULT_ROOT):
+    '''Load a Futu kline export as a datetime indexed frame ready for ``bt.feeds.PandasData``.'''
+    return set_datetime_index(read_excel(xlsx_path, ktype, root), start, end)
+
+
+def load_code(code, ktype=KTYPE_DAY, start=None, end=None, root=DEFAULT_ROOT):
+    '''Same as ``load_bars`` for bars downloaded straight into the store'''
+    return set_datetime_index(BarStore(root).read(code, ktype), start, end)
+
+
+def load_resampled(xlsx_path, ktype, start=None, end=None, base_ktype=KTYPE_DAY, root=DEFAULT_ROOT):
+    '''``load_bars`` of a kline export resampled to ``ktype``, cached in the store with the base bars'''
+    store = BarStore(root)
+    store.read_excel(xlsx_path, base_ktype)
+    code = store._load_sources()[os.path.abspath(xlsx_path)]['store_code']
+    return set_datetime_index(store.resampled(code, ktype, base_ktype), start, end)
@@ -0,0 +1,264 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+import bar_store
+import my_kernel
+from kdj_strategy import KDJ_Strategy
+from macd_strategy import TheStrategy
+from my_indicator import KDJ, CusExponentialSmoothing, PinNine
+from my_sizer import FixedPerc
+
+DEFAULT_SIZES = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+DEFAULT_FREQS = ['day', 'min']
+DEFAULT_OUT = '../data/benchmark/latest.json'
+DEFAULT_BASELINE = '../data/benchmark/baseline.json'
+
+# 交易日从 1990 年开始，再多就超出 pandas 的日期范围了
+MAX_DAILY_BARS = 60000
+
+INDICATORS = {
+    'KDJ': lambda data: KDJ(data),
+    'CusExponentialSmoothing': lambda data: CusExponentialSmoothing(data.close, period=3),
+    'PinNine': lambda data: PinNine(data.close),
+    'MACDHisto': lambda data: bt.indicators.MACDHisto(data.close),
+}
+
+STRATEGIES = {
+    'KDJ_Strategy': KDJ_Strategy,
+    'TheStrategy': TheStrategy,
+}
+
+
+def synthetic_bars(n, freq='day', seed=0):
+    '''Random walk OHLCV with the columns of a Futu kline export'''
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02 if freq == 'day' else 0.001, n)))
+    open_ = close * (1 + rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n)))
+    if freq == 'day':
+        index = pd.bdate_range('1990-01-01', periods=n)
+    else:
+        index = pd.date_range('1990-01-02 09:30', periods=n, freq='min')
+    return pd.DataFrame({
+        'code': 'HK.BENCH', 'time_key': index.strftime('%Y-%m-%d %H:%M:%S'),
+        'open': open_, 'close': close, 'high': high, 'low': low,
+        'volume': rng.integers(1000, 100000, n), 'turnover': close * 1000, 'last_close': np.roll(close, 1),
+    })
+
+
+class _NoOp(bt.Strategy):
+    params = (('indicator', None),)
+
+    def __init__(self):
+        if self.p.indicator is not None:
+            self.ind = INDICATORS[self.p.indicator](self.data)
+
+
+def _cerebro(bars, strategy=_NoOp, analyzers=False, **params):
+    cerebro = bt.Cerebro(cheat_on_open=True, stdstats=False)
+    cerebro.broker.set_cash(50000)
+    cerebro.broker.addcommissioninfo(bt.commissions.CommInfo_Stocks_Perc(commission=0.0003, percabs=True))
+    cerebro.adddata(bt.feeds.PandasData(dataname=bars))
+    cerebro.addstrategy(strategy, **params)
+    cerebro.addsizer(FixedPerc)
+    if analyzers:
+        # 与 run_strategy.runstrat 相同的 analyzer
+        cerebro.addanalyzer(bt.analyzers.TimeReturn, _name='alltime_roi', timeframe=bt.TimeFrame.NoTimeFrame)
+        cerebro.addanalyzer(bt.analyzers.TimeReturn, timeframe=bt.TimeFrame.Years)
+        cerebro.addanalyzer(bt.analyzers.SharpeRatio, timeframe=bt.TimeFrame.Years, riskfreerate=0.01)
+        cerebro.addanalyzer(bt.analyzers.SQN)
+    return cerebro
+
+
+def benchmarks():
+    '''name -> (setup(raw, root), timed(prepared)); setup is not timed'''
+    def stored(raw, root):
+        bar_store.BarStore(root).write(raw, 'HK.BENCH')
+        return root
+
+    def loaded(raw, root):
+        return bar_store.load_code('HK.BENCH', root=stored(raw, root))
+
+    cases = {
+        'store_write': (lambda raw, root: (raw, root),
+                        lambda args: bar_store.BarStore(args[1]).write(args[0], 'HK.BENCH')),
+        'store_load': (stored, lambda root: bar_store.load_code('HK.BENCH', root=root)),
+        'feed': (loaded, lambda bars: _cerebro(bars).run()),
+    }
+    for name in INDICATORS:
+        cases['indicator:' + name] = (loaded, lambda bars, name=name: _cerebro(bars, indicator=name).run())
+    for name, strategy in STRATEGIES.items():
+        cases['strategy:' + name] = (
+            loaded, lambda bars, strategy=strategy: _cerebro(bars, strategy, printlog=False).run())
+        cases['analyzers:' + name] = (
+            loaded, lambda bars, strategy=strategy: _cerebro(bars, strategy, True, printlog=False).run())
+    return cases
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def _run_case(name, n, freq, repeat, seed):
+    '''One benchmark in a fresh process, so the peak RSS is its own'''
+    raw = synthetic_bars(n, freq, seed)
+    root = tempfile.mkdtemp(prefix='bench_')
+    try:
+        setup, timed = benchmarks()[name]
+        prepared = setup(raw, root)
+        del raw
+        best = float('inf')
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            timed(prepared)
+            best = min(best, time.perf_counter() - begin)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {'name': name, 'freq': freq, 'bars': n, 'seconds': best,
+            'bars_per_sec': n / best if best else None, 'peak_rss_mb': _peak_rss_mb()}
+
+
+def run_suite(sizes=DEFAULT_SIZES, freqs=DEFAULT_FREQS, names=None, repeat=3, seed=0, verbose=True):
+    names = names or list(benchmarks())
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for freq in freqs:
+        for n in sizes:
+            if freq == 'day' and n > MAX_DAILY_BARS:
+                continue
+            for name in names:
+                with ctx.Pool(1) as pool:
+                    result = pool.apply(_run_case, (name, n, freq, repeat, seed))
+                results.append(result)
+                if verbose:
+                    print('%-36s %-4s %10d bars %10.4f s %14.0f bars/s %8.1f MB' % (
+                        name, freq, n, result['seconds'], result['bars_per_sec'], result['peak_rss_mb'] or 0))
+
+    # 指标/策略耗时减去单纯跑数据源的耗时
+    feed = dict(((r['freq'], r['bars']), r['seconds']) for r in results if r['name'] == 'feed')
+    for r in results:
+        if ':' in r['name'] and (r['freq'], r['bars']) in feed:
+            r['net_seconds'] = r['seconds'] - feed[(r['freq'], r['bars'])]
+    return {'meta': environment(), 'results': results}
+
+
+def environment():
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'backtrader': bt.__version__,
+        'numba': my_kernel.HAS_NUMBA,
+    }
+
+
+def compare(current, baseline, threshold=0.10):
+    '''Rows of (name, freq, bars, baseline s, current s, change), regressions
+    are the cases slower than the baseline by more than ``threshold``'''
+    base = dict(((r['name'], r['freq'], r['bars']), r['seconds']) for r in baseline['results'])
+    rows = []
+    for r in current['results']:
+        key = (r['name'], r['freq'], r['bars'])
+        if key not in base:
+            continue
+        change = r['seconds'] / base[key] - 1.0
+        rows.append(key + (base[key], r['seconds'], change, change > threshold))
+    return pd.DataFrame(rows, columns=['name', 'freq', 'bars', 'baseline', 'current', 'change', 'regression'])
+
+
+def save(report, path):
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def runbenchmark(args=None):
+    args = parse_args(args)
+    report = run_suite(args.sizes, args.freqs, args.bench, args.repeat, args.seed)
+    save(report, args.out)
+    if args.save_baseline:
+        save(report, args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline at %s, run with --save-baseline to create it' % args.baseline)
+        return 0
+    result = compare(report, load(args.baseline), args.threshold)
+    print(result.to_string(index=False))
+    regressions = result[result['regression']]
+    if len(regressions):
+        print('%d regression(s) above %.0f%%' % (len(regressions), args.threshold * 100))
+        return 1
+    return 0
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Time loading, indicators, strategies and analyzers on synthetic bars')
+
+    parser.add_argument('--sizes', required=False, type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Numbers of bars (daily series stop at %d)' % MAX_DAILY_BARS)
+
+    parser.add_argument('--freqs', required=False, nargs='+', default=DEFAULT_FREQS,
+                        choices=DEFAULT_FREQS, help='Bar frequencies')
+
+    parser.add_argument('--bench', required=False, nargs='+', default=None,
+                        choices=list(benchmarks()), help='Benchmarks to run, all if not set')
+
+    parser.add_argument('--repeat', required=False, type=int, default=3,
+                        help='Runs per benchmark, the best one is kept')
+
+    parser.add_argument('--seed', required=False, type=int, default=0,
+                        help='Seed of the synthetic bars')
+
+    parser.add_argument('--out', required=False, default=DEFAULT_OUT,
+                        help='JSON file for the results')
+
+    parser.add_argument('--baseline', required=False, default=DEFAULT_BASELINE,
+                        help='JSON results to compare against')
+
+    parser.add_argument('--save-baseline', required=False, action='store_true',
+                        help='Store the results as the new baseline instead of comparing')
+
+    parser.add_argument('--threshold', required=False, type=float, default=0.10,
+                        help='Slowdown ratio reported as a regression')
+
+    if pargs is not None:
+        return parser.parse_args(pargs)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.exit(runbenchmark())
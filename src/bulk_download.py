@@ -0,0 +1,184 @@
+import collections
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BarStore, DEFAULT_ROOT
+from quote_client import RET_OK, get_client
+
+# OpenD allows 60 history kline requests per 30 seconds and 1000 bars per page
+QUOTA_REQUESTS = 60
+QUOTA_SECONDS = 30
+MAX_PAGE_SIZE = 1000
+
+DEFAULT_START = '2003-01-01'
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+
+class RateLimiter(object):
+    '''Thread-safe sliding window limiter, ``acquire`` blocks until a request is allowed.
+
+    Keeps the times of the last ``requests`` calls: a new one goes through
+    only once the oldest of them is ``seconds`` old, so no ``seconds`` long
+    window ever holds more than ``requests`` calls, bursts included.
+    '''
+
+    def __init__(self, requests=QUOTA_REQUESTS, seconds=QUOTA_SECONDS):
+        self.requests = requests
+        self.seconds = seconds
+        self._times = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._times and now - self._times[0] >= self.seconds:
+                    self._times.popleft()
+                if len(self._times) < self.requests:
+                    self._times.append(now)
+                    return
+                wait = self.seconds - (now - self._times[0])
+            time.sleep(wait)
+
+
+class BulkDownloader(object):
+    '''Download the history klines of many codes/ktypes concurrently.
+
+    Pages of ``MAX_PAGE_SIZE`` bars are requested from a thread pool, every
+    request waits for the rate limiter sized on the OpenD quota, failed
+    pages are retried with backoff and each finished symbol is written to
+    the bar store right away.
+    '''
+
+    def __init__(self, store=None, client=None, limiter=None, workers=4, page_size=MAX_PAGE_SIZE,
+                 retries=3, backoff=1.0, overlap=5):
+        self.store = store or BarStore(DEFAULT_ROOT)
+        self.client = client or get_client()
+        self.limiter = limiter or RateLimiter()
+        self.workers = workers
+        self.page_size = page_size
+        self.retries = retries
+        self.backoff = backoff
+        self.overlap = overlap
+
+    def request_page(self, code, ktype, start, end, page_req_key=None):
+        '''One page with retries, returns (data, next page_req_key)'''
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.limiter.acquire()
+            ret, data, next_key = self.client.call('request_history_kline', code, start=start, end=end,
+                                                   ktype=ktype, max_count=self.page_size,
+                                                   page_req_key=page_req_key)
+            if ret == RET_OK:
+                return data, next_key
+            error = data
+        raise IOError('%s %s: %s' % (code, ktype, error))
+
+    def iter_pages(self, code, ktype, start, end):
+        '''Yield the kline pages as they arrive'''
+        page_req_key = None
+        while True:
+            data, page_req_key = self.request_page(code, ktype, start, end, page_req_key)
+            yield data
+            if page_req_key is None:
+                break
+
+    def fetch(self, code, ktype, start, end):
+        return pd.concat(self.iter_pages(code, ktype, start, end), ignore_index=True)
+
+    def download_one(self, code, ktype, start, end):
+        # 边下载边写入，只有当前一页在内存中
+        return self.store.write_pages(self.iter_pages(code, ktype, start, end), code, ktype)
+
+    def _restated(self, stored, tail, data):
+        '''True when the refetched overlap bars differ from the stored ones'''
+        keys = stored['time_key'][tail:].astype(str)
+        fetched = data.drop_duplicates('time_key').set_index('time_key')
+        if not np.isin(keys, fetched.index).all():
+            return True
+        fetched = fetched.loc[keys]
+        for name in PRICE_COLUMNS:
+            if not np.allclose(fetched[name].to_numpy(dtype=np.float64), stored[name][tail:],
+                               rtol=1e-9, atol=0, equal_nan=True):
+                return True
+        return False
+
+    def refresh_one(self, code, ktype, start=DEFAULT_START, end=None):
+        '''Bring one code/ktype up to date, returns (new bars, refetched).
+
+        Only the bars from the day of the last ``overlap`` stored bars on are
+        requested. When those overlap bars changed (e.g. forward adjusted
+        prices after a dividend or split) the whole history is downloaded
+        again, otherwise the newer bars are appended to the store page by
+        page.
+        '''
+        if not self.store.exists(code, ktype) or not self.store.read_meta(code, ktype)['rows']:
+            return self.download_one(code, ktype, start, end), True
+
+        stored = self.store.read_columns(code, ktype, ['time_key'] + PRICE_COLUMNS)
+        tail = max(0, len(stored['time_key']) - self.overlap)
+        last_key = str(stored['time_key'][-1])
+        pages = self.iter_pages(code, ktype, str(stored['time_key'][tail])[:10], end)
+
+        # 先收齐重叠部分的 K 线做校验，之后的页直接追加
+        head = []
+        for page in pages:
+            head.append(page)
+            if len(page) and str(page['time_key'].iloc[-1]) > last_key:
+                break
+        data = pd.concat(head, ignore_index=True)
+        if self._restated(stored, tail, data):
+            pages.close()
+            return self.download_one(code, ktype, start, end), True
+
+        rows = 0
+        for page in itertools.chain([data], pages):
+            new = page[page['time_key'].astype(str) > last_key]
+            if len(new):
+                self.store.append(new, code, ktype)
+                rows += len(new)
+        return rows, False
+
+    def _job(self, code, ktype, start, end):
+        try:
+            return code, str(ktype), self.download_one(code, ktype, start, end), None
+        except Exception as e:
+            return code, str(ktype), 0, str(e)
+
+    def _refresh_job(self, code, ktype, start, end):
+        try:
+            return (code, str(ktype)) + self.refresh_one(code, ktype, start, end) + (None,)
+        except Exception as e:
+            return code, str(ktype), 0, False, str(e)
+
+    def _run(self, job, codes, ktypes, start, end):
+        jobs = [(code, ktype) for code in codes for ktype in ktypes]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(job, code, ktype, start, end) for code, ktype in jobs]
+            return [future.result() for future in futures]
+
+    def download(self, codes, ktypes, start, end):
+        '''Returns one row per code/ktype with the number of bars stored or the error'''
+        rows = self._run(self._job, codes, ktypes, start, end)
+        return pd.DataFrame(rows, columns=['code', 'ktype', 'rows', 'error'])
+
+    def refresh(self, codes, ktypes, start=DEFAULT_START, end=None):
+        '''Incremental ``download``, one row per code/ktype with the number of new
+        bars, whether the history had to be refetched and the error'''
+        rows = self._run(self._refresh_job, codes, ktypes, start, end)
+        return pd.DataFrame(rows, columns=['code', 'ktype', 'rows', 'refetched', 'error'])
+
+
+def download(codes, ktypes, start, end, **kwargs):
+    return BulkDownloader(**kwargs).download(codes, ktypes, start, end)
+
+
+def refresh(codes, ktypes, start=DEFAULT_START, end=None, **kwargs):
+    return BulkDownloader(**kwargs).refresh(codes, ktypes, start, end)
@@ -0,0 +1,230 @@
+import itertools
+import threading
+import time
+
+import pandas as pd
+
+RET_OK = 0  # same values as futu RET_OK / RET_ERROR
+RET_ERROR = -1
+
+
+class FakeHandlerBase(object):
+    '''Stand-in for the futu push handler bases, the fakes push the parsed frame itself'''
+
+    def on_recv_rsp(self, rsp_pb):
+        return RET_OK, rsp_pb
+
+
+class FakeCurKlineHandlerBase(FakeHandlerBase):
+    pass
+
+
+class FakeTradeOrderHandlerBase(FakeHandlerBase):
+    pass
+
+
+class FakeOpenD(object):
+    '''In-process stand-in for a local OpenD serving canned data.
+
+    Hand ``quote_context`` to ``QuoteClient(context_factory=...)`` to run the
+    futu_util helpers offline. ``drop_connections`` simulates OpenD going
+    away: every open context fails until it is reconnected.
+    '''
+
+    def __init__(self, trading_days=(), stock_info=None):
+        self.trading_days = list(trading_days)
+        self.stock_info = stock_info if stock_info is not None else pd.DataFrame(columns=['code', 'name', 'lot_size'])
+        self.bars = {}
+        self.connections = 0
+        self.requests = {}
+        self._contexts = []
+
+    def add_bars(self, code, ktype, data):
+        '''``data`` has the columns of ``request_history_kline`` (code, time_key, open, close, ...)'''
+        self.bars[(code, str(ktype))] = data.reset_index(drop=True)
+
+    def quote_context(self, host='127.0.0.1', port=11111):
+        ctx = FakeQuoteContext(self)
+        self.connections += 1
+        self._contexts.append(ctx)
+        return ctx
+
+    def drop_connections(self):
+        for ctx in self._contexts:
+            ctx.alive = False
+        self._contexts = []
+
+    def push(self, data):
+        '''Send a kline push frame (code, time_key, open, ..., k_type) to the subscribers'''
+        for ctx in self._contexts:
+            if ctx.alive and ctx.handler is not None:
+                rows = data[[key in ctx.subscriptions for key in zip(data['code'], data['k_type'])]]
+                if len(rows):
+                    ctx.handler.on_recv_rsp(rows.reset_index(drop=True))
+
+    def replay(self, code, ktype, data, updates=1):
+        '''Push ``data`` bar by bar, each bar ``updates`` times: the in-progress
+        pushes only know the open, the last one is the closed bar'''
+        data = data.reset_index(drop=True).assign(code=code, k_type=str(ktype))
+        for i in range(len(data)):
+            bar = data.iloc[i:i + 1]
+            for _ in range(updates - 1):
+                partial = bar.copy()
+                partial[['close', 'high', 'low']] = bar['open'].iloc[0]
+                self.push(partial)
+            self.push(bar)
+
+    def count(self, method):
+        self.requests[method] = self.requests.get(method, 0) + 1
+
+
+class FakeQuoteContext(object):
+    '''The subset of ``OpenQuoteContext`` used by this repo'''
+
+    def __init__(self, server):
+        self.server = server
+        self.alive = True
+        self.handler = None
+        self.subscriptions = set()
+
+    def get_global_state(self):
+        self.server.count('get_global_state')
+        if not self.alive:
+            return RET_ERROR, 'connection lost'
+        return RET_OK, {'qot_logined': True, 'trd_logined': True}
+
+    def request_trading_days(self, market=None, start=None, end=None, code=None):
+        self.server.count('request_trading_days')
+        if not self.alive:
+            return RET_ERROR, 'connection lost'
+        days = [day for day in self.server.trading_days
+                if (start is None or day >= start) and (end is None or day <= end)]
+        return RET_OK, [{'time': day, 'trade_date_type': 'WHOLE'} for day in days]
+
+    def request_history_kline(self, code, start=None, end=None, ktype='K_DAY', autype=None,
+                              fields=None, max_count=1000, page_req_key=None, extended_time=False):
+        self.server.count('request_history_kline')
+        if not self.alive:
+            return RET_ERROR, 'connection lost', None
+        data = self.server.bars.get((code, str(ktype)))
+        if data is None:
+            return RET_ERROR, 'unknown stock %s' % code, None
+
+        day = data['time_key'].str.slice(0, 10)
+        mask = pd.Series(True, index=data.index)
+        if start is not None:
+            mask &= day >= start
+        if end is not None:
+            mask &= day <= end
+        data = data[mask]
+
+        offset = page_req_key or 0
+        page = data.iloc[offset:offset + max_count].reset_index(drop=True)
+        next_key = offset + max_count if offset + max_count < len(data) else None
+        return RET_OK, page, next_key
+
+    def get_stock_basicinfo(self, market, stock_type=None, code_list=None):
+        self.server.count('get_stock_basicinfo')
+        if not self.alive:
+            return RET_ERROR, 'connection lost'
+        info = self.server.stock_info
+        if code_list is not None:
+            codes = [code_list] if isinstance(code_list, str) else list(code_list)
+            info = info[info['code'].isin(codes)]
+        return RET_OK, info.reset_index(drop=True)
+
+    def set_handler(self, handler):
+        self.handler = handler
+        return RET_OK
+
+    def subscribe(self, code_list, subtype_list, is_first_push=True, subscribe_push=True, is_detailed_orderbook=False,
+                  extended_time=False):
+        self.server.count('subscribe')
+        if not self.alive:
+            return RET_ERROR, 'connection lost'
+        for code in code_list:
+            for subtype in subtype_list:
+                self.subscriptions.add((code, str(subtype)))
+        return RET_OK, None
+
+    def close(self):
+        self.alive = False
+
+
+class FakeTradeServer(object):
+    '''In-process stand-in for the trading side of OpenD.
+
+    Orders are acknowledged after ``ack_delay`` seconds and filled in full
+    ``fill_delay`` seconds later at the order price, the fill is pushed to
+    the ``TradeOrderHandlerBase`` of the context like OpenD does.
+    '''
+
+    def __init__(self, cash=1000000.0, ack_delay=0.0, fill_delay=0.0, password=None):
+        self.cash = cash
+        self.ack_delay = ack_delay
+        self.fill_delay = fill_delay
+        self.password = password
+        self.orders = []
+        self.positions = {}
+        self._order_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def trade_context(self, filter_trdmarket='HK', host='127.0.0.1', port=11111, **kwargs):
+        return FakeTradeContext(self)
+
+    def fill(self, ctx, order):
+        with self._lock:
+            sign = 1 if order['trd_side'] == 'BUY' else -1
+            self.cash -= sign * order['qty'] * order['price']
+            self.positions[order['code']] = self.positions.get(order['code'], 0) + sign * order['qty']
+            order.update(order_status='FILLED_ALL', dealt_qty=order['qty'], dealt_avg_price=order['price'],
+                         updated_time=time.strftime('%Y-%m-%d %H:%M:%S'))
+        if ctx.handler is not None:
+            ctx.handler.on_recv_rsp(pd.DataFrame([order]))
+
+
+class FakeTradeContext(object):
+    '''The subset of ``OpenSecTradeContext`` used by ``trade_executor``'''
+
+    def __init__(self, server):
+        self.server = server
+        self.handler = None
+        self.unlocked = False
+
+    def set_handler(self, handler):
+        self.handler = handler
+        return RET_OK
+
+    def unlock_trade(self, password=None, password_md5=None, is_unlock=True):
+        if self.server.password is not None and password != self.server.password:
+            return RET_ERROR, 'wrong password'
+        self.unlocked = is_unlock
+        return RET_OK, None
+
+    def accinfo_query(self, trd_env='REAL', **kwargs):
+        return RET_OK, pd.DataFrame({'cash': [self.server.cash], 'power': [self.server.cash]})
+
+    def position_list_query(self, code='', trd_env='REAL', **kwargs):
+        rows = [{'code': c, 'qty': qty, 'can_sell_qty': qty} for c, qty in self.server.positions.items()
+                if qty and (not code or c == code)]
+        return RET_OK, pd.DataFrame(rows, columns=['code', 'qty', 'can_sell_qty'])
+
+    def place_order(self, price, qty, code, trd_side, order_type='NORMAL', adjust_limit=0, trd_env='REAL',
+                    acc_id=0, acc_index=0, remark=None, time_in_force='DAY', fill_outside_rth=False, **kwargs):
+        if trd_env == 'REAL' and not self.unlocked:
+            return RET_ERROR, 'trade is locked'
+        if qty <= 0:
+            return RET_ERROR, 'invalid qty'
+        time.sleep(self.server.ack_delay)
+        order = {'order_id': str(next(self.server._order_ids)), 'code': code, 'trd_side': trd_side,
+                 'order_type': order_type, 'order_status': 'SUBMITTED', 'qty': qty, 'price': price,
+                 'dealt_qty': 0, 'dealt_avg_price': 0.0, 'trd_env': trd_env, 'remark': remark,
+                 'create_time': time.strftime('%Y-%m-%d %H:%M:%S')}
+        self.server.orders.append(order)
+        timer = threading.Timer(self.server.fill_delay, self.server.fill, (self, order))
+        timer.daemon = True
+        timer.start()
+        return RET_OK, pd.DataFrame([order])
+
+    def close(self):
+        self.handler = None
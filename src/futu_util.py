@@ -4,6 +4,9 @@ from datetime import datetime
 import smtplib
 from email.mime.text import MIMEText
 
+import period_stats
+from quote_client import get_client
+
 cfg = ConfigParser()
 cfg.read('../config/base.ini')
 
@@ -27,9 +30,7 @@ def send_mail(subject, content):
 
 
 def is_trade_today():
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-    ret, data = quote_ctx.request_trading_days(start='2020-04-01', end='2030-04-10', code='HK.00700')
-    quote_ctx.close()
+    ret, data = get_client().call('request_trading_days', start='2020-04-01', end='2030-04-10', code='HK.00700')
     today_str = datetime.today().strftime('%Y-%m-%d')
     for one_date in data:
         if one_date['time'] == today_str:
@@ -37,48 +38,42 @@ def is_trade_today():
     return False
 
 
-def get_stock_k_line(code, start_date, end_date, k_type):
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-    datalist = []
-    ret, data, page_req_key = quote_ctx.request_history_kline(code, start=start_date, end=end_date, ktype=k_type,
-                                                              max_count=50)  # 每页5个，请求第一页
-    if ret == RET_OK:
-        print('reading data')
-    else:
-        print('error:', data)
-    datalist.append(data)
-    while page_req_key != None:  # 请求后面的所有结果
-        ret, data, page_req_key = quote_ctx.request_history_kline(code, start=start_date, end=end_date, ktype=k_type,
-                                                                  max_count=50, page_req_key=page_req_key)  # 请求翻页后的数据
+def iter_stock_k_line(code, start_date, end_date, k_type, max_count=50):
+    # 逐页返回，内存里只保留当前这一页；某一页失败时抛 IOError，不会把残缺的历史当成完整的
+    client = get_client()
+    page_req_key = None
+    while True:
+        ret, data, page_req_key = client.call('request_history_kline', code, start=start_date, end=end_date,
+                                              ktype=k_type, max_count=max_count, page_req_key=page_req_key)
         if ret != RET_OK:
-            print('error:', data)
-        datalist.append(data)
+            raise IOError('%s %s: %s' % (code, k_type, data))
+        yield data
+        if page_req_key is None:
+            break
 
+
+def get_stock_k_line(code, start_date, end_date, k_type):
+    print('reading data')
+    result = pd.concat(iter_stock_k_line(code, start_date, end_date, k_type))
     print('All pages are finished!')
-    quote_ctx.close()
-    result = pd.concat(datalist)
     return result
 
 
 def get_stock_info(market, stock_type, code=None):
     # Market.HK, SecurityType.STOCK
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-    ret, data = quote_ctx.get_stock_basicinfo(market, stock_type, code)
+    # 共用一条连接，进程退出时才关闭，防止连接条数用尽
+    ret, data = get_client().call('get_stock_basicinfo', market, stock_type, code)
     if ret == RET_OK:
         print('reading data')
     else:
         print('error:', data)
-    quote_ctx.close()  # 结束后记得关闭当条连接，防止连接条数用尽
     return data
 
 
 def get_month_std(stock):
-    stock['date_ym'] = stock['time_key'].map(lambda x: x.split('-')[0] + '-' + x.split('-')[1])
-    stock['month_std'] = stock.groupby('date_ym')['close'].transform(np.std)
-    stock['month_mean'] = stock.groupby('date_ym')['close'].transform(np.mean)
-    stock['month_cv'] = stock['month_std'] / stock['month_mean']
-    return stock[['code', 'date_ym', 'month_mean', 'month_std', 'month_cv']].drop_duplicates().reset_index().drop(
-        'index', axis=1)
+    '''Monthly mean/std/cv of the close per code, see ``period_stats.period_stats``'''
+    stats = period_stats.period_stats(stock, 'month')
+    return stats.rename(columns={'period': 'date_ym', 'mean': 'month_mean', 'std': 'month_std', 'cv': 'month_cv'})
 
 
 def plot_k_line(stock, x='date', y='price', hue='hue'):
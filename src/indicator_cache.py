@@ -0,0 +1,292 @@
+import array
+import collections
+import hashlib
+import math
+import os
+
+import backtrader as bt
+import numpy as np
+from backtrader.linebuffer import PseudoArray
+from backtrader.lineseries import LineSeriesStub
+
+import my_kernel
+from my_indicator import KDJ, kdj
+
+
+def ema(values, period, alpha=None, start=0):
+    '''backtrader ``ExponentialSmoothing``: SMA seed over the first ``period``
+    valid values (from ``start``), then the exponential recursion.
+    '''
+    alpha = 2.0 / (1.0 + period) if alpha is None else alpha
+    out = np.full(len(values), np.nan)
+    seed = start + period - 1
+    if seed < len(values):
+        out[seed] = math.fsum(values[start:seed + 1].tolist()) / period
+        my_kernel.exp_smoothing(values, out, seed + 1, len(values), out[seed], alpha, 1.0 - alpha)
+    return out
+
+
+def macd(close, period_me1=12, period_me2=26, period_signal=9):
+    '''macd, signal, histo as computed by ``bt.indicators.MACDHisto``'''
+    close = np.asarray(close, dtype=np.float64)
+    line = ema(close, period_me1) - ema(close, period_me2)
+    signal = ema(line, period_signal, start=max(period_me1, period_me2) - 1)
+    return line, signal, line - signal
+
+
+def atr(high, low, close, period=14):
+    '''``bt.indicators.AverageTrueRange``, true range smoothed with alpha 1 / period'''
+    high, low, close = (np.asarray(x, dtype=np.float64) for x in (high, low, close))
+    tr = np.full(len(close), np.nan)
+    tr[1:] = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+    return (ema(tr, period, alpha=1.0 / period, start=1),)
+
+
+def crossover(data0, data1, minperiod=1):
+    '''``bt.indicators.CrossOver``: 1.0 on an upward cross, -1.0 downward.
+
+    ``minperiod`` is the larger minperiod of the two inputs, the last
+    non-zero difference is carried from there like ``NonZeroDifference``.
+    '''
+    data0 = np.asarray(data0, dtype=np.float64)
+    data1 = np.asarray(data1, dtype=np.float64)
+    out = np.full(len(data0), np.nan)
+    start = minperiod - 1
+    if start + 1 >= len(data0):
+        return (out,)
+
+    diff = data0[start:] - data1[start:]
+    keep = diff != 0
+    keep[0] = True
+    last = np.maximum.accumulate(np.where(keep, np.arange(len(diff)), 0))
+    before = diff[last][:-1]
+    after0, after1 = data0[start + 1:], data1[start + 1:]
+    up = (before < 0.0) & (after0 > after1)
+    down = (before > 0.0) & (after0 < after1)
+    out[start + 1:] = up.astype(np.float64) - down
+    return (out,)
+
+
+class IndicatorCache(object):
+    '''LRU of computed indicator arrays with an optional ``.npz`` disk tier.
+
+    Keys are the sha1 of the input arrays together with the indicator name
+    and its params, so the same series with the same params is computed once
+    no matter how many backtests ask for it. ``hits`` counts the lookups
+    answered from memory or disk, ``disk_hits`` the part read from disk.
+    '''
+
+    def __init__(self, maxsize=128, root=None):
+        self.maxsize = maxsize
+        self.root = root
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = collections.OrderedDict()
+
+    @staticmethod
+    def key(name, inputs, params):
+        sha = hashlib.sha1(name.encode())
+        sha.update(repr(sorted(params.items())).encode())
+        for values in inputs:
+            values = np.ascontiguousarray(values, dtype=np.float64)
+            sha.update(str(len(values)).encode())
+            sha.update(values.data)
+        return sha.hexdigest()
+
+    def get(self, name, inputs, params, compute):
+        key = self.key(name, inputs, params)
+        values = self._lru.get(key)
+        if values is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return values
+
+        values = self._load(key)
+        if values is None:
+            self.misses += 1
+            values = tuple(compute(*inputs, **params))
+            self._save(key, values)
+        else:
+            self.hits += 1
+            self.disk_hits += 1
+        for value in values:
+            value.setflags(write=False)  # shared between runs
+
+        self._lru[key] = values
+        if len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+        return values
+
+    def clear(self):
+        self._lru.clear()
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.npz')
+
+    def _load(self, key):
+        if self.root is None or not os.path.exists(self._path(key)):
+            return None
+        with np.load(self._path(key)) as f:
+            return tuple(f['arr_%d' % i] for i in range(len(f.files)))
+
+    def _save(self, key, values):
+        if self.root is None:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        np.savez(self._path(key), *values)
+
+
+# one cache per process, reused by every backtest run in it
+default_cache = IndicatorCache()
+
+
+def line_values(line, end):
+    '''The first ``end`` values of a line buffer as a float64 view.
+
+    A number given in place of a line (``CrossOver(j, 90)``) comes back as
+    a zero-stride array, so caches can tell a constant from a line that
+    only happens to be flat.
+    '''
+    if isinstance(line, LineSeriesStub):
+        line = line.lines[0]  # 指标的 data1 等是包了一层的 line
+    wrapped = getattr(line, 'a', None)
+    if isinstance(wrapped, PseudoArray):
+        return np.broadcast_to(np.float64(wrapped.wrapped), (end,))
+    return np.frombuffer(line.array, dtype=np.float64)[:end]
+
+
+class CachedIndicator(bt.Indicator):
+    '''Base of the cached indicators.
+
+    ``once`` hashes the input line buffers and fills every line from the
+    cache, computing the values only on a miss. In next mode nothing is
+    cached: each bar runs the compute function on the bars so far and keeps
+    its last values, correct but quadratic, use runonce for speed.
+    '''
+    params = (('cache', None),)
+
+    # compute function and the names of the params forwarded to it
+    _compute = None
+    _compute_params = ()
+
+    def _inputs(self):
+        return self.datas
+
+    def _compute_kwargs(self):
+        return dict((name, getattr(self.p, name)) for name in self._compute_params)
+
+    def preonce(self, start, end):
+        pass
+
+    def oncestart(self, start, end):
+        pass
+
+    def once(self, start, end):
+        cache = self.p.cache if self.p.cache is not None else default_cache
+        inputs = [line_values(line, end) for line in self._inputs()]
+        values = cache.get(self._compute.__name__, inputs, self._compute_kwargs(), self._compute)
+        for line, value in zip(self.lines, values):
+            line.array[:end] = array.array(str('d'), value.tobytes())
+
+    def next(self):
+        n = len(self)
+        inputs = [np.frombuffer(line.array, dtype=np.float64)[:n] for line in self._inputs()]
+        values = self._compute(*inputs, **self._compute_kwargs())
+        for line, value in zip(self.lines, values):
+            line[0] = value[-1]
+
+
+class CachedKDJ(CachedIndicator):
+    lines = ("RSV", "K", "D", "J",)
+    params = (('period_me1', 3), ('period_me2', 3), ('period_signal', 9),
+              ('first_k', 66.464), ('first_d', 69.635),)
+    _compute = staticmethod(kdj)
+    _compute_params = ('period_me1', 'period_me2', 'period_signal', 'first_k', 'first_d')
+
+    def __init__(self):
+        self.addminperiod(self.p.period_signal + self.p.period_me1 + self.p.period_me2 - 2)
+
+    def _inputs(self):
+        return self.data.high, self.data.low, self.data.close
+
+
+class CachedMACD(CachedIndicator):
+    lines = ('macd', 'signal',)
+    params = (('period_me1', 12), ('period_me2', 26), ('period_signal', 9),)
+    _compute = staticmethod(macd)
+    _compute_params = ('period_me1', 'period_me2', 'period_signal')
+
+    def __init__(self):
+        self.addminperiod(max(self.p.period_me1, self.p.period_me2) + self.p.period_signal - 1)
+
+    def _inputs(self):
+        return self.data.close,
+
+
+class CachedMACDHisto(CachedMACD):
+    lines = ('histo',)
+
+
+class CachedATR(CachedIndicator):
+    lines = ('atr',)
+    params = (('period', 14),)
+    _compute = staticmethod(atr)
+    _compute_params = ('period',)
+
+    def __init__(self):
+        self.addminperiod(self.p.period + 1)
+
+    def _inputs(self):
+        return self.data.high, self.data.low, self.data.close
+
+
+class CachedCrossOver(CachedIndicator):
+    _mindatas = 2  # lets a plain number stand in for the second line
+
+    lines = ('crossover',)
+    _compute = staticmethod(crossover)
+
+    def __init__(self):
+        self._inputs_minperiod = self._minperiod  # largest minperiod of the two inputs
+        self.addminperiod(2)
+
+    def _inputs(self):
+        return self.data0, self.data1
+
+    def _compute_kwargs(self):
+        return {'minperiod': self._inputs_minperiod}
+
+
+class Indicators(object):
+    '''Indicator factory for strategies: backtrader's own classes when
+    ``cache`` is None, the cached ones otherwise. Call from ``__init__``.
+    '''
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    def MACD(self, data, **kwargs):
+        if self.cache is None:
+            return bt.indicators.MACD(data, **kwargs)
+        return CachedMACD(data, cache=self.cache, **kwargs)
+
+    def MACDHisto(self, data, **kwargs):
+        if self.cache is None:
+            return bt.indicators.MACDHisto(data, **kwargs)
+        return CachedMACDHisto(data, cache=self.cache, **kwargs)
+
+    def ATR(self, data, **kwargs):
+        if self.cache is None:
+            return bt.indicators.AverageTrueRange(data, **kwargs)
+        return CachedATR(data, cache=self.cache, **kwargs)
+
+    def KDJ(self, data, **kwargs):
+        if self.cache is None:
+            return KDJ(data, **kwargs)
+        return CachedKDJ(data, cache=self.cache, **kwargs)
+
+    def CrossOver(self, data0, data1):
+        if self.cache is None:
+            return bt.indicators.CrossOver(data0, data1)
+        return CachedCrossOver(data0, data1, cache=self.cache)
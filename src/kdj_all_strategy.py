@@ -8,26 +8,14 @@ import pandas as pd
 import argparse
 import datetime
 import random
-from my_indicator import CusExponentialSmoothing,PinNine
+import bar_store
+from my_indicator import KDJ, PinNine
 import backtrader as bt
 from backtrader.indicators import EMA
 
 BTVERSION = tuple(int(x) for x in bt.__version__.split('.'))
 
 
-class KDJ(bt.Indicator):
-    lines = ("RSV", "K", "D", "J",)
-    params = (('period_me1', 3), ('period_me2', 3), ('period_signal', 9),)
-
-    def __init__(self):
-        self.l.high = bt.indicators.Highest(self.data.high, period=self.p.period_signal)
-        self.l.low = bt.indicators.Lowest(self.data.low, period=self.p.period_signal)
-        self.l.RSV = 100 * bt.DivByZero(self.data_close - self.l.low, self.l.high - self.l.low, zero=None)
-        self.l.K = CusExponentialSmoothing(self.l.RSV, period=self.p.period_me1, alpha=1 / 3, first_value=66.464)
-        self.l.D = CusExponentialSmoothing(self.l.K, period=self.p.period_me2, alpha=1 / 3, first_value=69.635)
-        self.l.J = 3 * self.l.K - 2 * self.l.D
-
-
 #
 # class Nine(bt.Indicator):
 #     lines = ('nine',)
@@ -246,10 +234,8 @@ def runstrat(args=None):
     # data0 = bt.feeds.YahooFinanceCSVData(dataname=dataname, **dkwargs)
     # cerebro.adddata(data0)
 
-    data = pd.read_excel('../data/kj_tx.xlsx')
     # 加载数据
-    data['datetime'] = data['time_key'].map(lambda x: datetime.datetime.strptime(x.split(' ')[0], '%Y-%m-%d'))
-    data = data.set_index('datetime')
+    data = bar_store.load_bars('../data/kj_tx.xlsx', start=args.fromdate, end=args.todate)
 
     df = bt.feeds.PandasData(dataname=data)
 
@@ -313,7 +299,7 @@ def parse_args(pargs=None):
     #                     help='Choose one of the predefined data sets')
 
     parser.add_argument('--fromdate', required=False,
-                        default='2013-01-01',
+                        default=None,
                         help='Starting date in YYYY-MM-DD format')
 
     parser.add_argument('--todate', required=False,
@@ -1,9 +1,11 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
-from my_indicator import KDJ
 import backtrader as bt
 
+from indicator_cache import Indicators
+from trade_log import TradeRecorder
+
 
 class KDJ_Strategy(bt.Strategy):
     params = (
@@ -15,29 +17,52 @@ class KDJ_Strategy(bt.Strategy):
         ('atrdist', 3.0),  # ATR distance for stop price
         ('smaperiod', 30),  # SMA Period (pretty standard)
         ('dirperiod', 10),  # Lookback period to consider SMA trend direction
+        ('printlog', True),  # print order/trade notifications
+        ('indicator_cache', None),  # IndicatorCache to take precomputed indicators from
+        ('trade_log', None),  # TradeRecorder for order/trade events, one is made for printlog
+        ('timeframes', ()),  # names of the datas added as higher timeframes, other datas (benchmark) are ignored
+        ('confirm', True),  # buy only when K >= D on every higher timeframe data
     )
 
     def __init__(self):
-        self.macd = bt.indicators.MACDHisto(self.data,
-                                            period_me1=self.p.macd1,
-                                            period_me2=self.p.macd2,
-                                            period_signal=self.p.macdsig)
+        ind = Indicators(self.p.indicator_cache)
+        self.macd = ind.MACDHisto(self.data,
+                                  period_me1=self.p.macd1,
+                                  period_me2=self.p.macd2,
+                                  period_signal=self.p.macdsig)
 
         # self.atr = bt.indicators.AverageTrueRange(self.data)
-        self.kdj = KDJ(self.data)
-
-        self.cross_kdj = bt.indicators.CrossOver(self.kdj.K, self.kdj.D)
-        self.cross_j_100 = bt.indicators.CrossOver(self.kdj.J, 100)
-        self.cross_j_90 = bt.indicators.CrossOver(self.kdj.J, 90)
-        self.cross_macd = bt.indicators.CrossOver(self.macd.macd, self.macd.signal)
+        self.kdj = ind.KDJ(self.data)
+
+        self.cross_kdj = ind.CrossOver(self.kdj.K, self.kdj.D)
+        self.cross_j_100 = ind.CrossOver(self.kdj.J, 100)
+        self.cross_j_90 = ind.CrossOver(self.kdj.J, 90)
+        self.cross_macd = ind.CrossOver(self.macd.macd, self.macd.signal)
+
+        # timeframes 指定的 data（周线、月线、60 分钟线）用来确认买点，基准等其他 data 不参与
+        tf0 = (self.data0._timeframe, self.data0._compression)
+        self.higher = [self.getdatabyname(name) for name in self.p.timeframes]
+        for d in self.higher:
+            if (d._timeframe, d._compression) <= tf0:
+                raise ValueError('data %r is not a higher timeframe than data0, resample it up' % d._name)
+        # 不确认时不建高周期 KDJ，免得它的 minperiod 推迟开始交易
+        self.higher_kdj = [ind.KDJ(d) for d in self.higher] if self.p.confirm else []
+        for kdj in self.higher_kdj:
+            kdj.plotinfo.plot = False
 
         self.order = None
         self.buyprice = None
         self.buycomm = None
+        # 只记录，不在回测循环里 print
+        self.trade_log = self.p.trade_log
+        if self.trade_log is None and self.p.printlog:
+            self.trade_log = TradeRecorder()
         self.buy_flag = False
         self.sell_flag = False
         self.highest_J = 1
         self.predict_cross = False
+        # 基准等其他 data 有新 K 线时策略也会被调用，data0 没有新 K 线就不动
+        self.bars_seen = 0
 
         # 画图选项
         self.cross_macd.plotinfo.subplot = False
@@ -57,19 +82,11 @@ class KDJ_Strategy(bt.Strategy):
     def notify_order(self, order):
         if order.status == order.Completed:
             if order.isbuy():
-                self.log(
-                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                    (order.executed.price,
-                     order.executed.value,
-                     order.executed.comm))
-
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
-            else:  # Sell
-                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
+            if self.trade_log is not None:
+                self.trade_log.order(self.datas[0].datetime[0], order.isbuy(), order.executed.price,
+                                     order.executed.value, order.executed.comm)
 
         if not order.alive():
             self.order = None  # indicate no order is pending
@@ -77,17 +94,25 @@ class KDJ_Strategy(bt.Strategy):
     def notify_trade(self, trade):
         if not trade.isclosed:
             return
-        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' % (trade.pnl, trade.pnlcomm))
+        if self.trade_log is not None:
+            self.trade_log.trade(self.datas[0].datetime[0], trade.pnl, trade.pnlcomm)
 
-    def log(self, txt, dt=None):
-        ''' Logging function fot this strategy'''
-        dt = dt or self.datas[0].datetime.date(0)
-        print('%s, %s' % (dt.isoformat(), txt))
+    def stop(self):
+        if self.p.printlog and len(self.trade_log):
+            print(self.trade_log.render())
+
+    def confirmed(self):
+        '''K >= D on the last closed bar of every higher timeframe'''
+        if not self.p.confirm:
+            return True
+        return all(kdj.K[0] >= kdj.D[0] for kdj in self.higher_kdj)
 
     def start(self):
         self.order = None  # sentinel to avoid operrations on pending order
 
     def next_open(self):
+        if len(self.data0) == self.bars_seen:
+            return
         if self.buy_flag:
             if self.data.open[0] > self.data.low[-1]:
                 self.order = self.buy(coc=False)
@@ -98,6 +123,9 @@ class KDJ_Strategy(bt.Strategy):
             self.sell_flag = False
 
     def next(self):
+        if len(self.data0) == self.bars_seen:
+            return
+        self.bars_seen = len(self.data0)
         if self.order:
             return  # pending order execution
 
@@ -110,7 +138,8 @@ class KDJ_Strategy(bt.Strategy):
             self.predict_cross = False
 
         if not self.position:
-            if ref_k_d_0 > 0 and ref_k_d_1 > 0 and ref_k_d_0 / ref_k_d_1 < 0.5 and self.kdj.D[0] - self.kdj.K[0] < 5:
+            if ref_k_d_0 > 0 and ref_k_d_1 > 0 and ref_k_d_0 / ref_k_d_1 < 0.5 and self.kdj.D[0] - self.kdj.K[0] < 5 \
+                    and self.confirmed():
                 self.buy_flag = True
                 self.predict_cross = True
         else:
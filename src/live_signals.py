@@ -0,0 +1,189 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import math
+import time
+
+from bar_store import KTYPE_DAY
+from quote_client import RET_OK
+from streaming import NAN, StreamingKDJ, StreamingMACD
+from vector_backtest import kdj_strategy_minperiod
+
+# kind 'flag': KDJ_Strategy.next set buy_flag / sell_flag at the close of time_key
+# kind 'order': KDJ_Strategy.next_open would buy / close at the open of time_key
+Signal = collections.namedtuple('Signal', 'code ktype time_key kind side price created')
+
+Bar = collections.namedtuple('Bar', 'time_key open high low close')
+
+BUY = 'BUY'
+SELL = 'SELL'
+
+
+def _change(new, old):
+    '''(new - old) / old with numpy's inf / nan instead of ZeroDivisionError'''
+    try:
+        return (new - old) / old
+    except ZeroDivisionError:
+        return NAN if new == old else math.copysign(math.inf, new - old)
+
+
+class SymbolState(object):
+    '''Indicator and ``KDJ_Strategy`` state of one code'''
+
+    def __init__(self, code, ktype, params):
+        self.code = code
+        self.ktype = ktype
+        self.kdj = StreamingKDJ(params['period_me1'], params['period_me2'], params['period_signal'])
+        self.macd = StreamingMACD(params['macd1'], params['macd2'], params['macdsig'])
+        self.count = 0
+        self.pending = None  # bar still being updated by the push
+        self.last = None  # last closed bar
+        self.K = self.D = self.J = NAN
+        self.gap = NAN
+        self.j1 = self.j2 = NAN
+        self.macd_line = self.macd_signal = NAN
+        self.position = False
+        self.buy_flag = False
+        self.sell_flag = False
+        self.predict_cross = False
+
+
+class LiveSignalEngine(object):
+    '''``KDJ_Strategy`` on pushed klines, one O(1) update per closed bar.
+
+    A bar counts as closed when a push with a later ``time_key`` arrives
+    for the same code (or on ``flush``), pushes of the bar in progress only
+    replace it. Closing bar i runs the logic of ``next`` and the first push
+    of bar i + 1 the logic of ``next_open``, so ``on_signal`` receives the
+    same flags and cheat-on-open orders as the backtest. The position is
+    assumed to follow the orders, ``set_position`` corrects it from the
+    actual fills.
+    '''
+
+    def __init__(self, on_signal=None, macd1=12, macd2=26, macdsig=9,
+                 period_me1=3, period_me2=3, period_signal=9):
+        self.on_signal = on_signal
+        self.params = dict(macd1=macd1, macd2=macd2, macdsig=macdsig,
+                           period_me1=period_me1, period_me2=period_me2, period_signal=period_signal)
+        self.start = kdj_strategy_minperiod(**self.params) - 1
+        self.states = {}
+
+    def state(self, code, ktype=KTYPE_DAY):
+        key = (code, str(ktype))
+        if key not in self.states:
+            self.states[key] = SymbolState(code, str(ktype), self.params)
+        return self.states[key]
+
+    def set_position(self, code, held, ktype=KTYPE_DAY):
+        self.state(code, ktype).position = bool(held)
+
+    def _emit(self, state, time_key, kind, side, price):
+        if self.on_signal is not None:
+            self.on_signal(Signal(state.code, state.ktype, time_key, kind, side, price, time.perf_counter()))
+
+    def _close_bar(self, state):
+        bar, state.pending = state.pending, None
+        i = state.count
+        state.count += 1
+        _, k, d, j = state.kdj.push(bar.high, bar.low, bar.close)
+        state.macd_line, state.macd_signal, _ = state.macd.push(bar.close)
+        gap1, state.gap = state.gap, d - k
+        j1, j2 = state.J, state.j1
+        state.K, state.D, state.J, state.j1, state.j2 = k, d, j, j1, j2
+        state.last = bar
+
+        if i < self.start:
+            return
+        # KDJ_Strategy.next
+        if state.predict_cross:
+            if j <= j1:
+                state.sell_flag = True
+                self._emit(state, bar.time_key, 'flag', SELL, bar.close)
+            state.predict_cross = False
+        if not state.position:
+            gap0 = state.gap
+            if gap0 > 0 and gap1 > 0 and gap0 / gap1 < 0.5 and gap0 < 5:
+                state.buy_flag = True
+                state.predict_cross = True
+                self._emit(state, bar.time_key, 'flag', BUY, bar.close)
+        elif j >= 90:
+            drop1 = _change(j, j1)
+            if drop1 < -0.10 or (drop1 < -0.05 and _change(j1, j2) < -0.05):
+                state.sell_flag = True
+                self._emit(state, bar.time_key, 'flag', SELL, bar.close)
+
+    def _open_bar(self, state, bar):
+        if state.count < self.start:
+            return
+        # KDJ_Strategy.next_open
+        held = state.position
+        if state.buy_flag and bar.open > state.last.low:
+            state.buy_flag = False
+            state.position = True
+            self._emit(state, bar.time_key, 'order', BUY, bar.open)
+        if state.sell_flag:
+            if held:
+                state.position = False
+                self._emit(state, bar.time_key, 'order', SELL, bar.open)
+            state.sell_flag = False
+
+    def update(self, code, time_key, open, high, low, close, ktype=KTYPE_DAY):
+        '''One pushed kline, the bar in progress or a new one'''
+        state = self.state(code, ktype)
+        time_key = str(time_key)
+        bar = Bar(time_key, float(open), float(high), float(low), float(close))
+        pending = state.pending
+        if pending is not None and time_key == pending.time_key:
+            state.pending = bar
+            return
+        if pending is not None:
+            if time_key < pending.time_key:
+                return  # late push of an older bar
+            self._close_bar(state)
+        elif state.last is not None and time_key <= state.last.time_key:
+            return
+        state.pending = bar
+        if state.last is not None:
+            self._open_bar(state, bar)
+
+    def flush(self, code=None, ktype=KTYPE_DAY):
+        '''Close the bars in progress, e.g. once the session is over'''
+        for state in list(self.states.values()):
+            if state.pending is not None and (code is None or (state.code, state.ktype) == (code, str(ktype))):
+                self._close_bar(state)
+
+    def on_kline(self, data):
+        '''``CurKlineHandlerBase`` push frame (code, time_key, open, close, high, low, k_type, ...)'''
+        ktypes = data['k_type'] if 'k_type' in data.columns else [KTYPE_DAY] * len(data)
+        for code, time_key, open, high, low, close, ktype in zip(
+                data['code'], data['time_key'], data['open'], data['high'], data['low'], data['close'], ktypes):
+            self.update(code, time_key, open, high, low, close, ktype)
+
+    def subscribe(self, client, codes, ktype=KTYPE_DAY, handler_base=None):
+        '''Subscribe ``codes`` on ``client`` (a ``QuoteClient``) and feed their kline push here.
+
+        ``handler_base`` defaults to futu's ``CurKlineHandlerBase``, pass
+        ``fake_futu.FakeCurKlineHandlerBase`` with a fake context.
+        '''
+        handler = kline_handler(self, handler_base)
+        client.context.set_handler(handler)
+        ret, err = client.call('subscribe', list(codes), [str(ktype)])
+        if ret != RET_OK:
+            raise IOError('subscribe failed: %s' % err)
+        return handler
+
+
+def kline_handler(engine, handler_base=None):
+    if handler_base is None:
+        from futu import CurKlineHandlerBase
+        handler_base = CurKlineHandlerBase
+
+    class KlineHandler(handler_base):
+        def on_recv_rsp(self, rsp_pb):
+            ret, data = super(KlineHandler, self).on_recv_rsp(rsp_pb)
+            if ret == RET_OK:
+                engine.on_kline(data)
+            return ret, data
+
+    return KlineHandler()
@@ -6,6 +6,10 @@ import argparse
 import datetime
 import random
 
+import bar_store
+from indicator_cache import Indicators
+from trade_log import TradeRecorder
+
 import backtrader as bt
 from backtrader.indicators import EMA
 
@@ -57,24 +61,28 @@ class TheStrategy(bt.Strategy):
         ('atrdist', 3.0),  # ATR distance for stop price
         ('smaperiod', 30),  # SMA Period (pretty standard)
         ('dirperiod', 10),  # Lookback period to consider SMA trend direction
+        ('printlog', True),  # print order/trade notifications
+        ('indicator_cache', None),  # IndicatorCache to take precomputed indicators from
+        ('trade_log', None),  # TradeRecorder for order/trade events, one is made for printlog
     )
 
     def __init__(self):
-        self.macd = bt.indicators.MACD(self.data,
+        ind = Indicators(self.p.indicator_cache)
+        self.macd = ind.MACD(self.data,
+                             period_me1=self.p.macd1,
+                             period_me2=self.p.macd2,
+                             period_signal=self.p.macdsig)
+
+        self.macdhisto = ind.MACDHisto(self.data,
                                        period_me1=self.p.macd1,
                                        period_me2=self.p.macd2,
                                        period_signal=self.p.macdsig)
 
-        self.macdhisto = bt.indicators.MACDHisto(self.data,
-                                                 period_me1=self.p.macd1,
-                                                 period_me2=self.p.macd2,
-                                                 period_signal=self.p.macdsig)
-
         # Cross of macd.macd and macd.signal
-        self.mcross = bt.indicators.CrossOver(self.macd.macd, self.macd.signal)
+        self.mcross = ind.CrossOver(self.macd.macd, self.macd.signal)
 
         # To set the stop price
-        self.atr = bt.indicators.AverageTrueRange(self.data)
+        self.atr = ind.ATR(self.data)
 
         # Control market trend
         # self.sma = bt.indicators.SMA(self.data, period=self.p.smaperiod)
@@ -83,23 +91,19 @@ class TheStrategy(bt.Strategy):
         self.order = None
         self.buyprice = None
         self.buycomm = None
+        # 只记录，不在回测循环里 print
+        self.trade_log = self.p.trade_log
+        if self.trade_log is None and self.p.printlog:
+            self.trade_log = TradeRecorder()
 
     def notify_order(self, order):
         if order.status == order.Completed:
             if order.isbuy():
-                self.log(
-                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                    (order.executed.price,
-                     order.executed.value,
-                     order.executed.comm))
-
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
-            else:  # Sell
-                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
+            if self.trade_log is not None:
+                self.trade_log.order(self.datas[0].datetime[0], order.isbuy(), order.executed.price,
+                                     order.executed.value, order.executed.comm)
 
         if not order.alive():
             self.order = None  # indicate no order is pending
@@ -107,12 +111,12 @@ class TheStrategy(bt.Strategy):
     def notify_trade(self, trade):
         if not trade.isclosed:
             return
-        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' % (trade.pnl, trade.pnlcomm))
+        if self.trade_log is not None:
+            self.trade_log.trade(self.datas[0].datetime[0], trade.pnl, trade.pnlcomm)
 
-    def log(self, txt, dt=None):
-        ''' Logging function fot this strategy'''
-        dt = dt or self.datas[0].datetime.date(0)
-        print('%s, %s' % (dt.isoformat(), txt))
+    def stop(self):
+        if self.p.printlog and len(self.trade_log):
+            print(self.trade_log.render())
 
     def start(self):
         self.order = None  # sentinel to avoid operrations on pending order
@@ -179,11 +183,9 @@ def runstrat(args=None):
     # data0 = bt.feeds.YahooFinanceCSVData(dataname=dataname, **dkwargs)
     # cerebro.adddata(data0)
 
-    data = pd.read_excel('../data/kj_tx.xlsx')
     # 加载数据
+    data = bar_store.load_bars('../data/kj_tx.xlsx', start=args.fromdate, end=args.todate)
     print(data.dtypes)
-    data['datetime'] = data['time_key'].map(lambda x: datetime.datetime.strptime(x.split(' ')[0], '%Y-%m-%d'))
-    data = data.set_index('datetime')
 
     df = bt.feeds.PandasData(dataname=data)
 
@@ -247,7 +249,7 @@ def parse_args(pargs=None):
     #                     help='Choose one of the predefined data sets')
 
     parser.add_argument('--fromdate', required=False,
-                        default='2013-01-01',
+                        default=None,
                         help='Starting date in YYYY-MM-DD format')
 
     parser.add_argument('--todate', required=False,
@@ -0,0 +1,185 @@
+import math
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from bar_store import KTYPE_1M, KTYPE_60M, KTYPE_DAY, KTYPE_MON, KTYPE_WEEK
+
+# backtrader date2num counts days from 0001-01-01, 1970-01-01 is day 719163
+_EPOCH_NUM = 719163.0
+
+# 每年的 K 线根数：港股约 252 个交易日，每天 6 根 60 分钟线、330 根 1 分钟线
+BARS_PER_YEAR = {
+    KTYPE_DAY: 252,
+    KTYPE_WEEK: 52,
+    KTYPE_MON: 12,
+    KTYPE_60M: 252 * 6,
+    KTYPE_1M: 252 * 330,
+}
+
+
+def periods_per_year(ktype):
+    '''Bars per year of ``ktype``, the ``periods`` of ``compute``'''
+    if ktype not in BARS_PER_YEAR:
+        raise ValueError('no bars per year for %r, expected one of %s' % (ktype, ', '.join(BARS_PER_YEAR)))
+    return BARS_PER_YEAR[ktype]
+
+
+def _average(values):
+    return math.fsum(values) / len(values)
+
+
+def _standarddev(values):
+    avg = _average(values)
+    return math.sqrt(_average([(x - avg) ** 2 for x in values]))
+
+
+def num2index(values):
+    '''backtrader float datetimes to a DatetimeIndex, rounded to the microsecond like ``bt.num2date``'''
+    us = np.round((np.asarray(values, dtype=np.float64) - _EPOCH_NUM) * 86400e6).astype('int64')
+    return pd.DatetimeIndex(us.astype('datetime64[us]'), name='datetime')
+
+
+def annual_returns(equity, cash):
+    '''``TimeReturn(timeframe=Years)``: each year-end value over the previous one (``cash`` for the first)'''
+    year_end = equity.groupby(equity.index.year).last()
+    start = np.concatenate([[cash], year_end.to_numpy()[:-1]])
+    return pd.Series(year_end.to_numpy() / start - 1.0, index=year_end.index)
+
+
+def sharpe_ratio(returns, riskfreerate=0.01):
+    '''``SharpeRatio(timeframe=Years)`` on the annual returns, None when undefined'''
+    returns = list(returns)
+    if not returns:
+        return None
+    rate = pow(1.0 + riskfreerate, 1.0) - 1.0
+    ret_free = [r - rate for r in returns]
+    try:
+        return _average(ret_free) / _standarddev(ret_free)
+    except ZeroDivisionError:
+        return None
+
+
+def sqn(pnl):
+    '''``SQN`` of the closed trades net pnl'''
+    pnl = list(pnl)
+    if len(pnl) <= 1:
+        return 0
+    try:
+        return math.sqrt(len(pnl)) * _average(pnl) / _standarddev(pnl)
+    except ZeroDivisionError:
+        return None
+
+
+def drawdown(equity):
+    '''Drawdown in % of the running peak like ``DrawDown``, and the max drawdown length in bars'''
+    values = np.asarray(equity, dtype=np.float64)
+    peak = np.maximum.accumulate(values)
+    dd = 100.0 * (peak - values) / peak
+    # 回撤持续的 bar 数：上一次创新高以来的 bar 数
+    bars = np.arange(len(values))
+    last_peak = np.maximum.accumulate(np.where(values >= peak, bars, 0))
+    length = bars - last_peak
+    return pd.Series(dd, index=getattr(equity, 'index', None)), int(length.max()) if len(length) else 0
+
+
+def sortino_ratio(returns, periods=252, required_return=0.0):
+    '''Annualized mean excess return over the downside deviation (empyrical definition)'''
+    excess = np.asarray(returns, dtype=np.float64) - required_return
+    if not len(excess):
+        return None
+    downside = math.sqrt(np.mean(np.minimum(excess, 0.0) ** 2))
+    if downside == 0:
+        return None
+    return np.mean(excess) * periods / (downside * math.sqrt(periods))
+
+
+def cagr(equity, cash, periods=252):
+    '''Compound annual growth with ``periods`` bars per year'''
+    if not len(equity):
+        return 0.0
+    return (equity.iloc[-1] / cash) ** (periods / float(len(equity))) - 1.0
+
+
+def summary(equity, trades, cash, riskfreerate=0.01):
+    '''roi / yearly sharpe / sqn like the TimeReturn, SharpeRatio and SQN analyzers'''
+    stats = {'roi': equity.iloc[-1] / cash - 1.0 if len(equity) else 0.0}
+    stats['sharpe'] = sharpe_ratio(annual_returns(equity, cash).tolist(), riskfreerate)
+    pnl = trades['pnlcomm'].tolist()
+    stats['sqn'] = sqn(pnl)
+    stats['trades'] = len(pnl)
+    return stats
+
+
+def compute(equity, cash, pnlcomm=(), benchmark=None, riskfreerate=0.01, periods=BARS_PER_YEAR[KTYPE_DAY]):
+    '''All the statistics of an equity curve, once at the end of the run.
+
+    ``equity`` is the broker value per bar (``EquityRecorder.equity``),
+    ``pnlcomm`` the net pnl of the closed trades and ``benchmark`` a bars
+    frame (open/close) on the same dates. roi, annual returns, sharpe, sqn
+    and max drawdown are those of the runstrat analyzers; sortino and
+    calmar use ``periods`` bars per year (``periods_per_year`` of the ktype).
+    '''
+    years = annual_returns(equity, cash)
+    dd, dd_len = drawdown(equity)
+    returns = equity.pct_change().fillna(equity.iloc[0] / cash - 1.0) if len(equity) else equity
+    max_dd = float(dd.max()) if len(dd) else 0.0
+    growth = cagr(equity, cash, periods)
+    stats = {
+        'roi': equity.iloc[-1] / cash - 1.0 if len(equity) else 0.0,
+        'annual_returns': dict((str(year), float(r)) for year, r in years.items()),
+        'cagr': growth,
+        'sharpe': sharpe_ratio(years.tolist(), riskfreerate),
+        'sortino': sortino_ratio(returns, periods),
+        'calmar': growth / (max_dd / 100.0) if max_dd else None,
+        'max_drawdown': max_dd,
+        'max_drawdown_len': dd_len,
+        'sqn': sqn(pnlcomm),
+        'trades': len(pnlcomm),
+    }
+    if benchmark is not None and len(benchmark):
+        close = benchmark['close']
+        # TimeReturn(data=...) 以第一根 K 线的开盘价为起点
+        stats['benchmark_roi'] = close.iloc[-1] / benchmark['open'].iloc[0] - 1.0
+        stats['excess_roi'] = stats['roi'] - stats['benchmark_roi']
+        bench_years = annual_returns(close, benchmark['open'].iloc[0])
+        stats['excess_annual_returns'] = dict(
+            (str(year), float(years[year] - r)) for year, r in bench_years.items() if year in years.index)
+    return stats
+
+
+class EquityRecorder(bt.Analyzer):
+    '''Broker value of every bar into a preallocated array, plus the net pnl
+    of closed trades. Costs one store per bar, ``compute`` does the rest.'''
+
+    def start(self):
+        size = max(self.data.buflen(), 1)
+        self._dt = np.empty(size)
+        self._values = np.empty(size)
+        self._value = self.strategy.broker.getvalue()
+        self.cash = self._value
+        self.pnlcomm = []
+        self.size = 0
+
+    def notify_fund(self, cash, value, fundvalue, shares):
+        self._value = value
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self.pnlcomm.append(trade.pnlcomm)
+
+    def next(self):
+        i = self.size
+        if i == len(self._values):
+            self._dt = np.resize(self._dt, 2 * i)
+            self._values = np.resize(self._values, 2 * i)
+        self._dt[i] = self.data.datetime[0]
+        self._values[i] = self._value
+        self.size = i + 1
+
+    def equity(self):
+        return pd.Series(self._values[:self.size].copy(), index=num2index(self._dt[:self.size]), name='value')
+
+    def get_analysis(self):
+        return {'equity': self.equity(), 'pnlcomm': self.pnlcomm}
@@ -1,4 +1,12 @@
+import array
+
 import backtrader as bt
+import numpy as np
+
+import my_kernel
+from streaming import RollingExtreme
+
+NAN = float('NaN')
 
 
 class PinNine(bt.indicators.PeriodN):
@@ -12,30 +20,7 @@ class PinNine(bt.indicators.PeriodN):
         pass
 
     def once(self, start, end):
-        darray = self.data.array
-        larray = self.line.array
-        for i in range(start, end):
-            now_c = darray[i]
-            if i <= 4:
-                larray[i] = 0
-            else:
-                ref_c = darray[i - 4]
-                my_cond = now_c > ref_c if self.p.cond == 'up' else now_c < ref_c
-                if my_cond:
-                    if flag_i <= 8:
-                        flag_i += 1
-                    elif flag_i == 9:
-                        flag_i = 1
-                    else:
-                        raise ValueError
-                else:
-                    flag_i = 0
-                if 5 <= flag_i <= 9:
-                    larray[i] = flag_i
-                elif flag_i < 5:
-                    larray[i] = 0
-                else:
-                    raise ValueError()
+        my_kernel.pin_nine(self.data.array, self.line.array, start, end, self.p.cond == 'up')
 
 
 class CusExponentialSmoothing(bt.indicators.Average):
@@ -63,27 +48,156 @@ class CusExponentialSmoothing(bt.indicators.Average):
         pass
 
     def once(self, start, end):
-        darray = self.data.array
         larray = self.line.array
-        alpha = self.alpha
-        alpha1 = self.alpha1
 
         # Seed value from SMA calculated with the call to oncestart
         prev = self.p.first_value
         if prev is None:
             prev = larray[start - 1]
-        for i in range(start, end):
-            larray[i] = prev = prev * alpha1 + darray[i] * alpha
+        my_kernel.exp_smoothing(self.data.array, larray, start, end, prev, self.alpha, self.alpha1)
+
+
+def rolling_extreme(values, period, highest=True):
+    '''Max (or min) over the last ``period`` values, NaN for the first ``period - 1``.
+
+    O(n) whatever the period (van Herk / Gil-Werman): the series is cut in
+    blocks of ``period``, every window is covered by the suffix of one block
+    and the prefix of the next, both obtained with one accumulate.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    out = np.full(n, np.nan)
+    if n < period:
+        return out
+    func = np.maximum if highest else np.minimum
+    blocks = -(-n // period)
+    padded = np.full(blocks * period, values[-1])
+    padded[:n] = values
+    padded = padded.reshape(blocks, period)
+    prefix = func.accumulate(padded, axis=1).ravel()
+    suffix = func.accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()
+    out[period - 1:] = func(suffix[:n - period + 1], prefix[period - 1:n])
+    return out
+
+
+class RollingExtremum(bt.indicators.PeriodN):
+    '''``bt.indicators.Highest`` (or ``Lowest`` with ``highest=False``) on a
+    monotonic deque: amortized O(1) per bar in ``next``, ``rolling_extreme``
+    over the whole buffer in ``once``'''
+    lines = ('extreme',)
+    params = (('highest', True),)
+
+    def __init__(self):
+        self._window = RollingExtreme(self.p.period, self.p.highest)
+        super(RollingExtremum, self).__init__()
+
+    def prenext(self):
+        self._window.push(self.data[0])
+
+    def next(self):
+        self.line[0] = self._window.push(self.data[0])
+
+    def preonce(self, start, end):
+        pass
+
+    def oncestart(self, start, end):
+        self.once(start, end)
+
+    def once(self, start, end):
+        values = rolling_extreme(np.frombuffer(self.data.array, dtype=np.float64)[:end], self.p.period,
+                                 self.p.highest)
+        self.line.array[start:end] = array.array(str('d'), values[start:end].tobytes())
+
+
+def exp_smoothing(values, alpha, first_value, start):
+    '''``prev * (1 - alpha) + value * alpha`` from ``start`` on, seeded with ``first_value``.
+
+    Same arithmetic as ``CusExponentialSmoothing.once``, values before ``start`` are NaN.
+    '''
+    out = np.full(len(values), np.nan)
+    my_kernel.exp_smoothing(values, out, start, len(values), first_value, alpha, 1.0 - alpha)
+    return out
+
+
+def kdj(high, low, close, period_me1=3, period_me2=3, period_signal=9, first_k=66.464, first_d=69.635):
+    '''Vectorized RSV/K/D/J over whole arrays, returns four float64 arrays.
+
+    Warm-up bars are NaN exactly where the backtrader lines are, and RSV is
+    NaN when the high/low range is zero.
+    '''
+    highest = rolling_extreme(high, period_signal, highest=True)
+    lowest = rolling_extreme(low, period_signal, highest=False)
+    return kdj_from_range(highest, lowest, close, period_me1, period_me2, period_signal, first_k, first_d)
+
+
+def kdj_from_range(highest, lowest, close, period_me1=3, period_me2=3, period_signal=9,
+                   first_k=66.464, first_d=69.635):
+    '''``kdj`` from the rolling highest high / lowest low already computed'''
+    highest = np.asarray(highest, dtype=np.float64)
+    lowest = np.asarray(lowest, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    span = highest - lowest
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = 100 * np.where(span != 0, (close - lowest) / span, np.nan)
+
+    # 与原先 Highest/Lowest + CusExponentialSmoothing 链的 minperiod 保持一致
+    start_k = period_signal + period_me1 - 1
+    k = exp_smoothing(rsv, 1 / 3, first_k, start_k)
+    d = exp_smoothing(k, 1 / 3, first_d, start_k + period_me2 - 1)
+    j = 3 * k - 2 * d
+    return rsv, k, d, j
 
 
 class KDJ(bt.Indicator):
     lines = ("RSV", "K", "D", "J",)
-    params = (('period_me1', 3), ('period_me2', 3), ('period_signal', 9),)
+    params = (('period_me1', 3), ('period_me2', 3), ('period_signal', 9),
+              ('first_k', 66.464), ('first_d', 69.635),)
 
     def __init__(self):
-        self.l.high = bt.indicators.Highest(self.data.high, period=self.p.period_signal)
-        self.l.low = bt.indicators.Lowest(self.data.low, period=self.p.period_signal)
-        self.l.RSV = 100 * bt.DivByZero(self.data_close - self.l.low, self.l.high - self.l.low, zero=None)
-        self.l.K = CusExponentialSmoothing(self.l.RSV, period=self.p.period_me1, alpha=1 / 3, first_value=66.464)
-        self.l.D = CusExponentialSmoothing(self.l.K, period=self.p.period_me2, alpha=1 / 3, first_value=69.635)
-        self.l.J = 3 * self.l.K - 2 * self.l.D
+        self._highest = RollingExtremum(self.data.high, period=self.p.period_signal, highest=True)
+        self._lowest = RollingExtremum(self.data.low, period=self.p.period_signal, highest=False)
+        self.addminperiod(self.p.period_signal + self.p.period_me1 + self.p.period_me2 - 2)
+        self.alpha = 1 / 3
+        self.alpha1 = 1.0 - self.alpha
+
+    def preonce(self, start, end):
+        pass
+
+    def oncestart(self, start, end):
+        pass
+
+    def once(self, start, end):
+        # once 模式下整段一次算完，直接填充各条 line 的 buffer
+        values = kdj_from_range(np.frombuffer(self._highest.array, dtype=np.float64)[:end],
+                                np.frombuffer(self._lowest.array, dtype=np.float64)[:end],
+                                np.frombuffer(self.data.close.array, dtype=np.float64)[:end],
+                                self.p.period_me1, self.p.period_me2, self.p.period_signal,
+                                self.p.first_k, self.p.first_d)
+        for line, value in zip(self.lines, values):
+            line.array[:end] = array.array(str('d'), value.tobytes())
+
+    def prenext(self):
+        self.next()
+
+    def next(self):
+        i = len(self) - 1
+        start_rsv = self.p.period_signal - 1
+        start_k = start_rsv + self.p.period_me1
+        start_d = start_k + self.p.period_me2 - 1
+        if i < start_rsv:
+            return
+
+        highest, lowest = self._highest[0], self._lowest[0]
+        span = highest - lowest
+        self.l.RSV[0] = rsv = 100 * ((self.data.close[0] - lowest) / span) if span else NAN
+
+        if i < start_k:
+            return
+        prev = self.p.first_k if i == start_k else self.l.K[-1]
+        self.l.K[0] = k = prev * self.alpha1 + rsv * self.alpha
+
+        if i < start_d:
+            return
+        prev = self.p.first_d if i == start_d else self.l.D[-1]
+        self.l.D[0] = d = prev * self.alpha1 + k * self.alpha
+        self.l.J[0] = 3 * k - 2 * d
@@ -0,0 +1,71 @@
+import array
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+def _exp_smoothing(src, dst, start, end, prev, alpha, alpha1):
+    for i in range(start, end):
+        prev = prev * alpha1 + src[i] * alpha
+        dst[i] = prev
+
+
+def _pin_nine(src, dst, start, end, up):
+    flag = 0
+    for i in range(start, end):
+        if i <= 4:
+            dst[i] = 0
+            continue
+        if (src[i] > src[i - 4]) if up else (src[i] < src[i - 4]):
+            flag = 1 if flag == 9 else flag + 1
+        else:
+            flag = 0
+        dst[i] = flag if flag >= 5 else 0
+
+
+if HAS_NUMBA:
+    _exp_smoothing_kernel = njit(cache=True)(_exp_smoothing)
+    _pin_nine_kernel = njit(cache=True)(_pin_nine)
+
+
+def _as_ndarray(buf):
+    return buf if isinstance(buf, np.ndarray) else np.frombuffer(buf, dtype=np.float64)
+
+
+def _as_array(buf):
+    if isinstance(buf, array.array):
+        return buf
+    return array.array(str('d'), np.ascontiguousarray(buf, dtype=np.float64).tobytes())
+
+
+def _run(kernel, jit_kernel, src, dst, start, end, *args):
+    if HAS_NUMBA:
+        # ndarray 视图直接指向 line buffer，结果原地写回
+        jit_kernel(_as_ndarray(src), _as_ndarray(dst), start, end, *args)
+        return
+    # 纯 Python 回退时 array.array 的下标访问比 ndarray 快
+    out = _as_array(dst)
+    kernel(_as_array(src), out, start, end, *args)
+    if out is not dst:
+        dst[start:end] = np.frombuffer(out, dtype=np.float64)[start:end]
+
+
+def exp_smoothing(src, dst, start, end, prev, alpha, alpha1):
+    '''``dst[i] = prev = prev * alpha1 + src[i] * alpha`` for i in [start, end).
+
+    ``src``/``dst`` are float64 buffers, either the ``array.array`` of a line
+    or an ndarray. ``dst`` is written in place.
+    '''
+    _run(_exp_smoothing, _exp_smoothing_kernel if HAS_NUMBA else None,
+         src, dst, start, end, float(prev), float(alpha), float(alpha1))
+
+
+def pin_nine(src, dst, start, end, up=True):
+    '''Nine-turn counter of ``PinNine``, written in place into ``dst``.'''
+    _run(_pin_nine, _pin_nine_kernel if HAS_NUMBA else None,
+         src, dst, start, end, bool(up))
@@ -21,3 +21,32 @@ class FixedPerc(bt.Sizer):
         else:
             size = cashtouse // data.close[0]
         return size
+
+
+class CashSplit(bt.Sizer):
+    '''Splits the cash evenly over the buys a strategy places on the same bar
+    Params:
+      - ``perc`` (default: ``1``) Perc of cash to allocate over all the buys
+      - ``slots`` (default: ``None``) Max concurrent positions, each one
+        then gets at most ``perc`` of the portfolio value over ``slots``
+
+    The strategy sets ``buys_this_bar`` before placing its buys, one buy
+    is assumed when it does not. Sells close the position.
+    '''
+
+    params = (
+        ('perc', 1),
+        ('slots', None),
+    )
+
+    def _getsizing(self, comminfo, cash, data, isbuy):
+        if not isbuy:
+            return self.broker.getposition(data).size
+        cashtouse = self.p.perc * cash / max(getattr(self.strategy, 'buys_this_bar', 1), 1)
+        if self.p.slots:
+            cashtouse = min(cashtouse, self.p.perc * self.broker.getvalue() / self.p.slots)
+        if BTVERSION > (1, 7, 1, 93):
+            size = comminfo.getsize(data.close[0], cashtouse)
+        else:
+            size = cashtouse // data.close[0]
+        return size
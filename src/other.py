@@ -1,12 +1,28 @@
+import pandas as pd
 
-def plot_all(result):
+import metrics
+import report
+
+
+def plot_all(result, out=None, max_points=report.MAX_POINTS):
     # 提取收益序列
     pnl = pd.Series(result.analyzers._TimeReturn.get_analysis())
     # 计算累计收益
     cumulative = (pnl + 1).cumprod()
+    if out is not None:
+        # 不弹窗口，直接写 PNG / HTML；有 EquityRecorder 时用每根 K 线的市值
+        equity = getattr(result.analyzers, 'equity', None)
+        if isinstance(equity, metrics.EquityRecorder):
+            return report.render(equity.equity(), out, equity.cash, equity.pnlcomm, max_points=max_points)
+        # 只有按年的收益，一年一个点
+        cumulative.index = pd.to_datetime(cumulative.index)
+        return report.render(cumulative, out, cash=1.0, max_points=max_points, periods=1)
     # 计算回撤序列
     max_return = cumulative.cummax()
     drawdown = (cumulative - max_return) / max_return
+    # 长序列先降采样再画
+    cumulative = report.downsample(cumulative, max_points)
+    drawdown = report.downsample(drawdown, max_points, 'minmax')
     # 计算收益评价指标
     import pyfolio as pf
     # 按年统计收益指标
@@ -60,5 +76,4 @@ def plot_all(result):
     plt.legend(h1 + h2, l1 + l2, fontsize=12, loc='upper left', ncol=1)
 
     fig.tight_layout()  # 规整排版
-    plt.figure(figsize=(80, 60))
     plt.show()
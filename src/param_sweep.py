@@ -0,0 +1,229 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import functools
+import itertools
+import multiprocessing.util
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import backtrader as bt
+import pandas as pd
+
+import bar_store
+import indicator_cache
+import metrics
+from kdj_strategy import KDJ_Strategy
+from macd_strategy import TheStrategy
+from my_sizer import FixedPerc
+from shared_feed import SharedBars, SharedPandasData
+
+STRATEGIES = {
+    'kdj': KDJ_Strategy,
+    'macd': TheStrategy,
+}
+
+# bars of the current worker process, loaded or attached once by the initializer
+_bars = None
+
+
+def grid_params(space):
+    '''All combinations of ``{'macd1': [8, 12], 'macd2': [26, 30]}`` style spaces'''
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+
+
+def random_params(space, n, seed=None):
+    '''``n`` random draws, a list is sampled as choices and a (low, high) tuple uniformly'''
+    rng = random.Random(seed)
+    result = []
+    for _ in range(n):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    params[name] = rng.randint(low, high)
+                else:
+                    params[name] = rng.uniform(low, high)
+            else:
+                params[name] = rng.choice(values)
+        result.append(params)
+    return result
+
+
+def run_once(bars, strategy, params, cash=50000, commission=0.0003, perc=1, cache=False, equity=False):
+    '''One backtest without plotting or trade logging, returns a flat dict of analyzer results.
+
+    ``bars`` is a datetime indexed DataFrame or a ``SharedBars`` block.
+    ``cache`` is an ``IndicatorCache``, or True for the per-process default one.
+    ``equity`` adds the broker value per bar and the closed trades net pnl
+    under 'equity' and 'pnlcomm'.
+    '''
+    cerebro = bt.Cerebro(cheat_on_open=True, stdstats=False)
+    cerebro.broker.set_cash(cash)
+    cerebro.broker.addcommissioninfo(bt.commissions.CommInfo_Stocks_Perc(commission=commission, percabs=True))
+    if isinstance(bars, SharedBars):
+        cerebro.adddata(SharedPandasData(shared=bars))
+    else:
+        cerebro.adddata(bt.feeds.PandasData(dataname=bars))
+    if cache:
+        cache = indicator_cache.default_cache if cache is True else cache
+        cerebro.addstrategy(strategy, printlog=False, indicator_cache=cache, **params)
+    else:
+        cerebro.addstrategy(strategy, printlog=False, **params)
+    cerebro.addsizer(FixedPerc, perc=perc)
+
+    cerebro.addanalyzer(bt.analyzers.TimeReturn, _name='alltime_roi', timeframe=bt.TimeFrame.NoTimeFrame)
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, timeframe=bt.TimeFrame.Years, riskfreerate=0.01)
+    cerebro.addanalyzer(bt.analyzers.SQN)
+    if equity:
+        cerebro.addanalyzer(metrics.EquityRecorder, _name='equity')
+
+    st0 = cerebro.run()[0]
+
+    result = dict(params)
+    roi = st0.analyzers.alltime_roi.get_analysis()
+    result['roi'] = next(iter(roi.values()), 0.0)
+    result['sharpe'] = st0.analyzers.sharperatio.get_analysis()['sharperatio']
+    sqn = st0.analyzers.sqn.get_analysis()
+    result['sqn'] = sqn['sqn']
+    result['trades'] = sqn['trades']
+    if equity:
+        result['equity'] = st0.analyzers.equity.equity()
+        result['pnlcomm'] = st0.analyzers.equity.pnlcomm
+    return result
+
+
+def _init_worker(data_path, start, end):
+    global _bars
+    _bars = bar_store.load_bars(data_path, start=start, end=end)
+
+
+def _init_shared_worker(descriptor):
+    global _bars
+    _bars = SharedBars.attach(descriptor)
+    # 进程退出时关闭映射，atexit 在 pool 的子进程里不会执行
+    multiprocessing.util.Finalize(_bars, _bars.close, exitpriority=10)
+
+
+def _run_in_worker(strategy, run_kwargs, params):
+    return run_once(_bars, strategy, params, **run_kwargs)
+
+
+def sweep(data_path, strategy, params_list, workers=None, start=None, end=None, shared=False, **run_kwargs):
+    '''Run ``strategy`` once per params dict over a process pool.
+
+    Every worker loads the bars a single time, or with ``shared=True`` the
+    parent loads them into shared memory once and the workers attach to it.
+    The analyzer results are returned as one DataFrame with a row per params dict.
+    '''
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(params_list) // (workers * 4))
+    job = functools.partial(_run_in_worker, strategy, run_kwargs)
+    if not shared:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(data_path, start, end)) as pool:
+            return pd.DataFrame(list(pool.map(job, params_list, chunksize=chunksize)))
+
+    with SharedBars.create(bar_store.load_bars(data_path, start=start, end=end)) as bars:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_shared_worker,
+                                 initargs=(bars.descriptor,)) as pool:
+            return pd.DataFrame(list(pool.map(job, params_list, chunksize=chunksize)))
+
+
+def _number(text):
+    return float(text) if '.' in text else int(text)
+
+
+def _parse_space(items):
+    space = {}
+    for item in items or []:
+        name, values = item.split('=', 1)
+        if ':' in values:
+            space[name] = tuple(_number(v) for v in values.split(':'))
+        else:
+            space[name] = [_number(v) for v in values.split(',')]
+    return space
+
+
+def _search_params(args):
+    '''params dicts of the ``--param`` space: ``--random`` draws or the full grid'''
+    space = _parse_space(args.param)
+    if args.random:
+        return random_params(space, args.random, seed=args.seed)
+    ranges = [name for name, values in space.items() if isinstance(values, tuple)]
+    if ranges:
+        raise ValueError('--param %s is a low:high range, ranges need --random' % ', '.join(ranges))
+    return grid_params(space)
+
+
+def runsweep(args=None):
+    args = parse_args(args)
+    params_list = _search_params(args)
+
+    result = sweep(args.data, STRATEGIES[args.strategy], params_list, workers=args.workers,
+                   shared=args.shared, cash=args.cash, commission=args.commperc, perc=args.cashalloc,
+                   cache=args.cache)
+    result = result.sort_values(args.sortby, ascending=False)
+    print(result.to_string())
+    if args.out:
+        result.to_csv(args.out, index=False)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Parameter sweep for KDJ_Strategy / TheStrategy')
+
+    parser.add_argument('--data', required=False, default='../data/kj_tx.xlsx',
+                        help='Futu kline xlsx export to run on')
+
+    parser.add_argument('--strategy', required=False, default='kdj',
+                        choices=STRATEGIES.keys(), help='Strategy to sweep')
+
+    parser.add_argument('--param', required=False, action='append',
+                        help=('Search space of a strategy param, repeatable. '
+                              'name=v1,v2,v3 for a list, name=low:high for a range '
+                              '(ranges need --random)'))
+
+    parser.add_argument('--random', required=False, type=int, default=0,
+                        help='Number of random draws instead of the full grid')
+
+    parser.add_argument('--seed', required=False, type=int, default=None,
+                        help='Seed of the random search')
+
+    parser.add_argument('--workers', required=False, type=int, default=None,
+                        help='Worker processes, defaults to the cpu count')
+
+    parser.add_argument('--shared', required=False, action='store_true',
+                        help='Load the bars once into shared memory for all workers')
+
+    parser.add_argument('--cache', required=False, action='store_true',
+                        help='Reuse indicator values across runs with the same indicator params')
+
+    parser.add_argument('--cash', required=False, type=float, default=50000,
+                        help='Cash to start with')
+
+    parser.add_argument('--cashalloc', required=False, type=float, default=1,
+                        help='Perc (abs) of cash to allocate for ops')
+
+    parser.add_argument('--commperc', required=False, type=float, default=0.0003,
+                        help='Perc (abs) commision in each operation')
+
+    parser.add_argument('--sortby', required=False, default='roi',
+                        help='Result column to rank by')
+
+    parser.add_argument('--out', required=False, default=None,
+                        help='Write the result table to this csv')
+
+    if pargs is not None:
+        return parser.parse_args(pargs)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    runsweep()
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+import bar_store
+from bar_store import DEFAULT_ROOT, KTYPE_DAY
+
+# pandas period frequencies, the keys print like '2015-01' (month), '2015Q1' (quarter)
+PERIODS = {
+    'week': 'W-SUN',
+    'month': 'M',
+    'quarter': 'Q',
+    'year': 'Y',
+}
+
+
+def period_key(time_key, period='month'):
+    '''Period of each bar as a ``PeriodIndex``, from time_key strings or datetimes in one pass'''
+    if period not in PERIODS:
+        raise ValueError('unknown period %r, expected one of %s' % (period, ', '.join(PERIODS)))
+    if isinstance(time_key, pd.DatetimeIndex):
+        dt = time_key
+    elif pd.api.types.is_datetime64_any_dtype(time_key):
+        dt = pd.DatetimeIndex(time_key)
+    else:
+        dt = bar_store.parse_time_key(np.asarray(time_key))
+    return dt.to_period(PERIODS[period])
+
+
+def period_stats(data, period='month', value='close', by='code', ddof=0):
+    '''mean, std and cv (std / mean) of ``value`` per ``by`` and period.
+
+    ``data`` has a ``time_key`` column (or a datetime index) and, for many
+    codes at once, a ``by`` column. One grouped aggregation gives one row
+    per (code, period) in the order they first appear. ``ddof=0`` is the
+    ``np.std`` population deviation.
+    '''
+    keys = period_key(data['time_key'] if 'time_key' in data.columns else data.index, period)
+    groups = [data[by].to_numpy(), keys] if by is not None and by in data.columns else [keys]
+    stats = data[value].groupby(groups, sort=False).agg(['mean', 'std', 'count'])
+    n = stats.pop('count')
+    # agg 的 std 是 ddof=1，换算到 ddof，只有一根 K 线时 ddof=0 的 std 为 0
+    stats['std'] = (stats['std'] * np.sqrt((n - 1) / (n - ddof).clip(lower=1))).fillna(0.0).where(n > ddof)
+    stats['cv'] = stats['std'] / stats['mean']
+    stats.index.names = ([by] if len(groups) == 2 else []) + ['period']
+    stats = stats.reset_index()
+    stats['period'] = stats['period'].astype(str)
+    return stats
+
+
+def rolling_stats(data, window, value='close', by='code', ddof=0):
+    '''Rolling mean, std and cv over ``window`` bars, per ``by`` when the column exists, aligned to ``data``'''
+    values = data[value]
+    if by is not None and by in data.columns:
+        rolling = values.groupby(data[by].to_numpy(), sort=False).rolling(window)
+        mean = rolling.mean().droplevel(0)
+        std = rolling.std(ddof=ddof).droplevel(0)
+    else:
+        mean = values.rolling(window).mean()
+        std = values.rolling(window).std(ddof=ddof)
+    result = pd.DataFrame({'mean': mean, 'std': std}).reindex(data.index)
+    result['cv'] = result['std'] / result['mean']
+    return result
+
+
+def store_stats(codes, period='month', ktype=KTYPE_DAY, value='close', root=DEFAULT_ROOT, ddof=0):
+    '''``period_stats`` of many codes of the bar store, reading only the time_key and ``value`` columns'''
+    store = bar_store.BarStore(root)
+    frames = []
+    for code in codes:
+        columns = store.read_columns(code, ktype, ['time_key', value])
+        frame = pd.DataFrame(columns, copy=False)
+        frame['code'] = code
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=['code', 'period', 'mean', 'std', 'cv'])
+    return period_stats(pd.concat(frames, ignore_index=True), period, value, 'code', ddof)
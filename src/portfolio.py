@@ -0,0 +1,125 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+import bar_store
+import metrics
+from bar_store import DEFAULT_ROOT, KTYPE_DAY
+from my_sizer import CashSplit
+from portfolio_strategy import PortfolioKDJ
+
+
+def align(frames):
+    '''Reindex datetime indexed bars onto the union of their dates.
+
+    Returns (aligned frames, halted bool arrays) keyed like ``frames``. A
+    date without a bar of the code is marked halted and gets no prices of
+    its own: open/high/low stay NaN and the close carries the last traded
+    one, only so that a held position keeps its value (NaN before the
+    first bar). Every feed then moves on the same clock; the indicators
+    are computed on the real bars only (``DataState.prepare``).
+    '''
+    index = pd.DatetimeIndex(np.unique(np.concatenate([frame.index.values for frame in frames.values()])),
+                             name='datetime')
+    aligned, halted = {}, {}
+    for name, frame in frames.items():
+        present = index.isin(frame.index)
+        frame = frame.reindex(index)
+        frame['close'] = frame['close'].ffill()
+        if 'volume' in frame.columns:
+            frame['volume'] = frame['volume'].fillna(0)
+        aligned[name] = frame
+        halted[name] = ~present
+    return aligned, halted
+
+
+def load_universe(codes, ktype=KTYPE_DAY, start=None, end=None, root=DEFAULT_ROOT):
+    return dict((code, bar_store.load_code(code, ktype, start=start, end=end, root=root)) for code in codes)
+
+
+def run_portfolio(frames, cash=50000, commission=0.0003, perc=1, slots=None, printlog=False, **params):
+    '''``PortfolioKDJ`` over the aligned ``frames`` in one cerebro, returns the strategy.
+
+    The ``EquityRecorder`` analyzer holds the portfolio value per bar.
+    '''
+    aligned, halted = align(frames)
+    cerebro = bt.Cerebro(cheat_on_open=True, stdstats=False)
+    cerebro.broker.set_cash(cash)
+    cerebro.broker.addcommissioninfo(bt.commissions.CommInfo_Stocks_Perc(commission=commission, percabs=True))
+    for name, frame in aligned.items():
+        cerebro.adddata(bt.feeds.PandasData(dataname=frame), name=name)
+    cerebro.addstrategy(PortfolioKDJ, halted=halted, printlog=printlog, **params)
+    cerebro.addsizer(CashSplit, perc=perc, slots=slots)
+    cerebro.addanalyzer(metrics.EquityRecorder, _name='equity')
+    return cerebro.run()[0]
+
+
+def runportfolio(args=None):
+    args = parse_args(args)
+    codes = args.codes or bar_store.BarStore(args.store).codes(args.ktype)
+    frames = load_universe(codes, args.ktype, args.fromdate, args.todate, args.store)
+    st0 = run_portfolio(frames, cash=args.cash, commission=args.commperc, perc=args.cashalloc,
+                        slots=args.slots, printlog=args.printlog)
+    equity = st0.analyzers.equity
+    periods = metrics.periods_per_year(args.ktype)
+    stats = metrics.compute(equity.equity(), equity.cash, equity.pnlcomm, periods=periods)
+    print('codes: %d' % len(frames))
+    for name, value in stats.items():
+        print('%s: %s' % (name, value))
+    if args.report:
+        import report
+        report.render(equity.equity(), args.report, equity.cash, equity.pnlcomm, title='portfolio',
+                      periods=periods)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='KDJ_Strategy rules over many codes of the bar store in one portfolio')
+
+    parser.add_argument('--codes', required=False, nargs='+', default=None,
+                        help='Codes to trade, every code of the store if not set')
+
+    parser.add_argument('--store', required=False, default=DEFAULT_ROOT,
+                        help='Bar store root directory')
+
+    parser.add_argument('--ktype', required=False, default=KTYPE_DAY,
+                        help='Kline type of the cached bars')
+
+    parser.add_argument('--fromdate', required=False, default=None,
+                        help='Starting date in YYYY-MM-DD format')
+
+    parser.add_argument('--todate', required=False, default=None,
+                        help='Ending date in YYYY-MM-DD format')
+
+    parser.add_argument('--cash', required=False, type=float, default=50000,
+                        help='Cash to start with')
+
+    parser.add_argument('--cashalloc', required=False, type=float, default=1,
+                        help='Perc (abs) of cash to split over the buys of a bar')
+
+    parser.add_argument('--slots', required=False, type=int, default=None,
+                        help='Max concurrent positions, caps each buy to value / slots')
+
+    parser.add_argument('--commperc', required=False, type=float, default=0.0003,
+                        help='Perc (abs) commision in each operation')
+
+    parser.add_argument('--printlog', required=False, action='store_true',
+                        help='Print the executions at the end')
+
+    parser.add_argument('--report', required=False, default=None,
+                        help='Write the report to this .png / .html')
+
+    if pargs is not None:
+        return parser.parse_args(pargs)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    runportfolio()
@@ -0,0 +1,148 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import backtrader as bt
+import numpy as np
+
+from my_indicator import kdj
+from trade_log import TradeRecorder
+from vector_backtest import kdj_signals, kdj_strategy_minperiod
+
+
+class DataState(object):
+    '''``KDJ_Strategy`` state of one data of the portfolio'''
+
+    __slots__ = ('data', 'name', 'entry', 'exit', 'no_rise', 'open', 'prev_low', 'halted',
+                 'order', 'buy_flag', 'sell_flag', 'predict_cross')
+
+    def __init__(self, data, halted=None):
+        self.data = data
+        self.name = data._name
+        self.halted = halted
+        self.entry = self.exit = self.no_rise = self.open = self.prev_low = None
+        self.order = None
+        self.buy_flag = False
+        self.sell_flag = False
+        self.predict_cross = False
+
+    def prepare(self, minperiod, period_me1, period_me2, period_signal):
+        '''Signals of every bar in one vectorized pass over the preloaded lines.
+
+        The KDJ and the signals run on the traded bars only, as if the data
+        were alone, and are spread back onto the shared clock: a halted bar
+        has no signal and ``prev_low`` is the low of the last traded bar.
+        '''
+        n = self.data.buflen()
+        halted = np.zeros(n, dtype=bool) if self.halted is None else np.asarray(self.halted, dtype=bool)[:n]
+        traded = np.flatnonzero(~halted)
+        high, low, close, open_ = (np.frombuffer(line.array, dtype=np.float64)[:n][traded] for line in (
+            self.data.high, self.data.low, self.data.close, self.data.open))
+        _, k, d, j = kdj(high, low, close, period_me1, period_me2, period_signal)
+        prev_low = np.full(len(low), np.nan)
+        prev_low[1:] = low[:-1]
+        signals = []
+        for values in kdj_signals(k, d, j) + (open_, prev_low):
+            full = np.zeros(n, dtype=values.dtype) if values.dtype == bool else np.full(n, np.nan)
+            full[traded] = values
+            signals.append(full)
+        entry, exit_ = signals[0], signals[1]
+        # 和单独回测一样，该代码自己的前 minperiod - 1 根 K 线不出信号
+        entry[traded[:minperiod - 1]] = False
+        exit_[traded[:minperiod - 1]] = False
+        self.entry, self.exit, self.no_rise, self.open, self.prev_low = (x.tolist() for x in signals)
+        self.halted = halted.tolist()
+
+
+class PortfolioKDJ(bt.Strategy):
+    '''``KDJ_Strategy`` rules on every data of the cerebro at once.
+
+    The datas must share one time index (``portfolio.align``), so the bar
+    position is the same for all of them and the per-bar work is a few list
+    lookups per data: the KDJ and the entry/exit conditions of each data
+    are computed once, vectorized, the first time the strategy runs.
+    Needs preloaded datas (the cerebro default). ``halted`` maps a data
+    name to a bool array of bars without trading: they are left out of the
+    data's KDJ, nothing is signalled or executed on them and a pending
+    buy/sell waits for the next traded bar. The buys of a bar are counted
+    in ``buys_this_bar`` for the ``CashSplit`` sizer.
+    '''
+    params = (
+        ('macd1', 12),
+        ('macd2', 26),
+        ('macdsig', 9),
+        ('period_me1', 3),
+        ('period_me2', 3),
+        ('period_signal', 9),
+        ('halted', None),  # data name -> bool array
+        ('printlog', False),
+        ('trade_log', None),
+    )
+
+    def __init__(self):
+        halted = self.p.halted or {}
+        self.states = [DataState(data, halted.get(data._name)) for data in self.datas]
+        self._state_of = dict((id(state.data), state) for state in self.states)
+        self._prepared = False
+        self.buys_this_bar = 0
+        # 和 KDJ_Strategy 一样，等 MACD/KDJ 的交叉指标都有值后才开始
+        self.warmup = kdj_strategy_minperiod(self.p.macd1, self.p.macd2, self.p.macdsig,
+                                                self.p.period_me1, self.p.period_me2, self.p.period_signal)
+        self.addminperiod(self.warmup)
+        self.trade_log = self.p.trade_log
+        if self.trade_log is None and self.p.printlog:
+            self.trade_log = TradeRecorder()
+
+    def _prepare(self):
+        for state in self.states:
+            state.prepare(self.warmup, self.p.period_me1, self.p.period_me2, self.p.period_signal)
+        self._prepared = True
+
+    def notify_order(self, order):
+        state = self._state_of[id(order.data)]
+        if order.status == order.Completed and self.trade_log is not None:
+            self.trade_log.order(order.data.datetime[0], order.isbuy(), order.executed.price,
+                                 order.executed.value, order.executed.comm)
+        if not order.alive():
+            state.order = None
+
+    def notify_trade(self, trade):
+        if trade.isclosed and self.trade_log is not None:
+            self.trade_log.trade(trade.data.datetime[0], trade.pnl, trade.pnlcomm)
+
+    def stop(self):
+        if self.p.printlog and len(self.trade_log):
+            print(self.trade_log.render())
+
+    def next_open(self):
+        if not self._prepared:
+            self._prepare()
+        i = len(self.data0) - 1  # datas share one clock
+        buys = [state for state in self.states
+                if state.buy_flag and not state.halted[i] and state.open[i] > state.prev_low[i]]
+        self.buys_this_bar = len(buys)
+        for state in buys:
+            state.order = self.buy(data=state.data, coc=False)
+            state.buy_flag = False
+        for state in self.states:
+            if state.sell_flag and not state.halted[i]:
+                state.order = self.close(data=state.data, coc=False)
+                state.sell_flag = False
+
+    def next(self):
+        if not self._prepared:
+            self._prepare()
+        i = len(self.data0) - 1  # datas share one clock
+        getposition = self.getposition
+        for state in self.states:
+            if state.order or state.halted[i]:
+                continue
+            if state.predict_cross:
+                if state.no_rise[i]:
+                    state.sell_flag = True
+                state.predict_cross = False
+            if not getposition(state.data).size:
+                if state.entry[i]:
+                    state.buy_flag = True
+                    state.predict_cross = True
+            elif state.exit[i]:
+                state.sell_flag = True
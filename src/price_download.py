@@ -1,13 +1,13 @@
-import futu_util
-import pandas as pd
+import bar_store
+from bulk_download import refresh
 from futu import *
 
-# d1 = util.get_stock_k_line('HK.01398', '2013-01-01', '2022-08-30')
-# d2 = util.get_stock_k_line('HK.00939', '2013-01-01', '2022-08-30')
-# d3 = util.get_stock_k_line('HK.01288', '2013-01-01', '2022-08-30')
-d4 = futu_util.get_stock_k_line('HK.800000', '2003-01-01', '2022-08-30', k_type=KLType.K_DAY)
+CODES = ['HK.01398', 'HK.00939', 'HK.01288', 'HK.800000']
 
-# d1.to_excel('data/yh_gs.xlsx')
-# d2.to_excel('data/yh_js.xlsx')
-# d3.to_excel('data/yh_ny.xlsx')
-d4.to_excel('../data/hs_index_day.xlsx')
+# 增量更新：只请求最后一根 K 线之后的数据，首次运行时全量下载
+result = refresh(CODES, [KLType.K_DAY], '2003-01-01')
+print(result)
+
+index = result[result['code'] == 'HK.800000'].iloc[0]
+if index['rows'] or index['refetched']:
+    bar_store.BarStore().read('HK.800000', KLType.K_DAY).to_excel('../data/hs_index_day.xlsx')
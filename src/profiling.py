@@ -0,0 +1,219 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import contextlib
+import io
+import json
+import os
+import time
+
+import backtrader as bt
+
+ENV_PROFILE = 'RUNSTRAT_PROFILE'  # phases / cprofile / pyinstrument
+ENV_PROFILE_OUT = 'RUNSTRAT_PROFILE_OUT'
+MODES = ('phases', 'cprofile', 'pyinstrument')
+DEFAULT_OUT = '../data/profile/runstrat.json'
+
+# nextstart / oncestart default to calling next / once, they would be counted twice
+INDICATOR_METHODS = ('preonce', 'once', 'prenext', 'next')
+STRATEGY_METHODS = ('prenext', 'next', 'prenext_open', 'next_open', 'notify_order', 'notify_trade')
+ANALYZER_METHODS = ('prenext', 'next', 'notify_order', 'notify_trade', 'notify_cashvalue', 'notify_fund', 'stop')
+
+
+class Profiler(object):
+    '''Wall time per phase of ``runstrat`` and per callback of the backtest.
+
+    ``phase`` times a block of the script, ``run`` times ``cerebro.run``
+    (optionally under cProfile or pyinstrument) and, through
+    ``PhaseAnalyzer``, every ``once``/``next`` of each indicator class and
+    every strategy and analyzer callback. ``save`` writes the JSON report,
+    the profiler output goes next to it.
+    '''
+
+    def __init__(self, mode='phases', out=DEFAULT_OUT, top=30):
+        if mode not in MODES:
+            raise ValueError('unknown profile mode %r, expected one of %s' % (mode, ', '.join(MODES)))
+        self.mode = mode
+        self.out = out
+        self.top = top
+        self.phases = collections.OrderedDict()
+        self.callbacks = {}
+        self.marks = {}
+        self.functions = None
+        self.profile_path = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - begin
+
+    def mark(self, name):
+        '''Remember the first time ``name`` happened'''
+        self.marks.setdefault(name, time.perf_counter())
+
+    def wrap(self, obj, method, key, first=None):
+        '''Replace ``obj.method`` by a timed version accumulating under ``key``'''
+        func = getattr(obj, method, None)
+        if func is None or getattr(func, '_profiled', False):
+            return
+        stat = self.callbacks.setdefault(key, [0, 0.0])
+        clock = time.perf_counter
+        marks = self.marks
+
+        def timed(*args, **kwargs):
+            begin = clock()
+            if first is not None and first not in marks:
+                marks[first] = begin
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stat[0] += 1
+                stat[1] += clock() - begin
+
+        timed._profiled = True
+        setattr(obj, method, timed)
+
+    def instrument(self, strategy, skip=None):
+        '''Time the callbacks of ``strategy``, its indicators, observers and analyzers'''
+        name = type(strategy).__name__
+        for method in STRATEGY_METHODS:
+            self.wrap(strategy, method, 'strategy:%s.%s' % (name, method), first='loop_start')
+
+        pending = list(strategy._lineiterators[bt.LineIterator.IndType])
+        while pending:
+            ind = pending.pop()
+            if hasattr(ind, '_lineiterators'):  # LinesOperation has no children
+                pending.extend(ind._lineiterators[bt.LineIterator.IndType])
+            for method in INDICATOR_METHODS:
+                self.wrap(ind, method, 'indicator:%s.%s' % (type(ind).__name__, method))
+        for obs in strategy._lineiterators[bt.LineIterator.ObsType]:
+            for method in INDICATOR_METHODS:
+                self.wrap(obs, method, 'observer:%s.%s' % (type(obs).__name__, method))
+        for analyzer in strategy.analyzers:
+            if analyzer is skip:
+                continue
+            for method in ANALYZER_METHODS:
+                self.wrap(analyzer, method, 'analyzer:%s.%s' % (type(analyzer).__name__, method))
+
+    def run(self, cerebro, **kwargs):
+        '''``cerebro.run`` with a ``PhaseAnalyzer`` attached, timed as the 'run' phase'''
+        cerebro.addanalyzer(PhaseAnalyzer, profiler=self, _name='profiler')
+        profiler = None
+        if self.mode == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+        elif self.mode == 'pyinstrument':
+            from pyinstrument import Profiler as SamplingProfiler
+            profiler = SamplingProfiler()
+
+        self.mark('run_start')
+        with self.phase('run'):
+            if profiler is not None:
+                profiler.enable() if self.mode == 'cprofile' else profiler.start()
+            try:
+                results = cerebro.run(**kwargs)
+            finally:
+                if profiler is not None:
+                    profiler.disable() if self.mode == 'cprofile' else profiler.stop()
+        self.mark('run_end')
+        if profiler is not None:
+            self._save_profile(profiler)
+        return results
+
+    def _save_profile(self, profiler):
+        base = os.path.splitext(self.out)[0]
+        _makedirs(self.out)
+        if self.mode == 'cprofile':
+            import pstats
+            self.profile_path = base + '.prof'
+            profiler.dump_stats(self.profile_path)
+            stats = pstats.Stats(profiler, stream=io.StringIO())
+            rows = []
+            for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+                rows.append({'function': '%s:%d(%s)' % (os.path.basename(filename), line, func),
+                             'calls': nc, 'tottime': tt, 'cumtime': ct})
+            rows.sort(key=lambda row: row['tottime'], reverse=True)
+            self.functions = rows[:self.top]
+        else:
+            self.profile_path = base + '.html'
+            with open(self.profile_path, 'w') as f:
+                f.write(profiler.output_html())
+
+    def _run_split(self):
+        '''run = setup (preload, strategy __init__) + once (indicator precompute) + loop'''
+        marks = self.marks
+        split = collections.OrderedDict()
+        if 'strategy_start' in marks:
+            split['setup'] = marks['strategy_start'] - marks['run_start']
+            if 'loop_start' in marks:
+                split['once'] = marks['loop_start'] - marks['strategy_start']
+                split['loop'] = marks.get('strategy_stop', marks['loop_start']) - marks['loop_start']
+            if 'strategy_stop' in marks and 'run_end' in marks:
+                split['teardown'] = marks['run_end'] - marks['strategy_stop']
+        return split
+
+    def report(self):
+        callbacks = [{'name': key, 'calls': calls, 'seconds': seconds}
+                     for key, (calls, seconds) in self.callbacks.items()]
+        callbacks.sort(key=lambda row: row['seconds'], reverse=True)
+        by_kind = collections.OrderedDict()
+        for row in callbacks:
+            kind, owner = row['name'].split(':', 1)
+            owner = owner.split('.')[0]
+            by_kind.setdefault(kind, collections.OrderedDict())
+            by_kind[kind][owner] = by_kind[kind].get(owner, 0.0) + row['seconds']
+        return {
+            'mode': self.mode,
+            'phases': self.phases,
+            'run': self._run_split(),
+            'totals': by_kind,
+            'callbacks': callbacks,
+            'functions': self.functions,
+            'profile': self.profile_path,
+        }
+
+    def save(self):
+        _makedirs(self.out)
+        report = self.report()
+        with open(self.out, 'w') as f:
+            json.dump(report, f, indent=1)
+        return report
+
+
+class PhaseAnalyzer(bt.Analyzer):
+    '''Hooks a ``Profiler`` into the strategy once its indicators exist'''
+    params = (('profiler', None),)
+
+    def start(self):
+        self.p.profiler.mark('strategy_start')
+        self.p.profiler.instrument(self.strategy, skip=self)
+
+    def stop(self):
+        self.p.profiler.mark('strategy_stop')
+
+    def get_analysis(self):
+        report = self.p.profiler.report()
+        return {'run': report['run'], 'totals': report['totals']}
+
+
+def _makedirs(path):
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+
+
+def from_env(profile=None, out=None):
+    '''Profiler for the ``profile`` argument or ``$RUNSTRAT_PROFILE``, None when both are unset.
+
+    True or '1' mean 'phases'.
+    '''
+    mode = profile if profile is not None else os.environ.get(ENV_PROFILE)
+    if not mode or mode in ('0', 'off'):
+        return None
+    if mode is True or mode == '1':
+        mode = 'phases'
+    return Profiler(mode, out or os.environ.get(ENV_PROFILE_OUT) or DEFAULT_OUT)
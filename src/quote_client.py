@@ -0,0 +1,103 @@
+import atexit
+import threading
+
+RET_OK = 0  # same value as futu RET_OK
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 11111
+
+
+class QuoteClient(object):
+    '''One ``OpenQuoteContext`` shared by every quote request.
+
+    The connection is opened on first use and kept for later calls, so a
+    loop over symbols costs one handshake and one OpenD connection instead of
+    one per call. ``call`` checks the connection with ``get_global_state``
+    when a request fails and reconnects once before giving up.
+    ``context_factory`` builds the context (``OpenQuoteContext`` by default),
+    pass ``fake_futu.FakeQuoteContext`` to run without OpenD.
+    '''
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, context_factory=None):
+        self.host = host
+        self.port = port
+        self.context_factory = context_factory
+        self.connects = 0
+        self._ctx = None
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        factory = self.context_factory
+        if factory is None:
+            from futu import OpenQuoteContext
+            factory = OpenQuoteContext
+        self.connects += 1
+        return factory(host=self.host, port=self.port)
+
+    @property
+    def context(self):
+        with self._lock:
+            if self._ctx is None:
+                self._ctx = self._connect()
+            return self._ctx
+
+    def is_healthy(self):
+        with self._lock:
+            if self._ctx is None:
+                return False
+            try:
+                ret, _ = self._ctx.get_global_state()
+            except Exception:
+                return False
+            return ret == RET_OK
+
+    def reconnect(self):
+        with self._lock:
+            self.close()
+            return self.context
+
+    def call(self, method, *args, **kwargs):
+        '''``getattr(context, method)(*args, **kwargs)``, retried once on a fresh
+        connection if it failed and the current one is broken.'''
+        result = getattr(self.context, method)(*args, **kwargs)
+        if result[0] != RET_OK and not self.is_healthy():
+            self.reconnect()
+            result = getattr(self.context, method)(*args, **kwargs)
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._ctx is not None:
+                try:
+                    self._ctx.close()
+                finally:
+                    self._ctx = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    '''Process wide ``QuoteClient``, closed at interpreter exit'''
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = QuoteClient()
+            atexit.register(_client.close)
+        return _client
+
+
+def set_client(client):
+    '''Replace the process wide client, e.g. with one built on a fake context'''
+    global _client
+    with _client_lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _client = client
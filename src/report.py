@@ -0,0 +1,206 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import base64
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from bar_store import KTYPE_DAY
+
+# 每条曲线最多画的点数，和屏幕像素同一量级
+MAX_POINTS = 2000
+METHODS = ('lttb', 'minmax')
+
+STAT_LABELS = [
+    ('roi', 'Cumulative\nreturns'), ('cagr', 'Annual\nreturn'), ('sharpe', 'Sharpe\nratio'),
+    ('sortino', 'Sortino\nratio'), ('calmar', 'Calmar\nratio'), ('max_drawdown', 'Max\ndrawdown %'),
+    ('max_drawdown_len', 'Max drawdown\nbars'), ('sqn', 'SQN'), ('trades', 'Trades'),
+    ('benchmark_roi', 'Benchmark\nreturns'), ('excess_roi', 'Excess\nreturns'),
+]
+
+
+def _positions(index):
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(np.float64)
+    return np.arange(len(index), dtype=np.float64)
+
+
+def minmax_indices(values, buckets):
+    '''Positions of the min and max of each of ``buckets`` equal slices, plus both ends'''
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    width = -(-n // buckets)
+    padded = np.full(buckets * width, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, width)
+    offset = np.arange(buckets) * width
+    # 最后一段可能全是填充的 nan
+    valid = offset < n
+    lows = np.nanargmin(np.where(np.isnan(padded[valid]), np.inf, padded[valid]), axis=1) + offset[valid]
+    highs = np.nanargmax(np.where(np.isnan(padded[valid]), -np.inf, padded[valid]), axis=1) + offset[valid]
+    return np.unique(np.concatenate([[0, n - 1], lows, highs]))
+
+
+def lttb_indices(values, threshold, x=None):
+    '''Largest-Triangle-Three-Buckets: positions of ``threshold`` points keeping the visual shape'''
+    y = np.asarray(values, dtype=np.float64)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    result = np.empty(threshold, dtype=np.int64)
+    result[0] = a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # 下一个桶的平均点，最后一个桶用终点
+        if i + 2 < len(edges):
+            nxt_x = x[end:edges[i + 2]].mean()
+            nxt_y = y[end:edges[i + 2]].mean()
+        else:
+            nxt_x, nxt_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - nxt_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (nxt_y - y[a]))
+        a = start + int(np.argmax(area))
+        result[i + 1] = a
+    result[-1] = n - 1
+    return result
+
+
+def downsample(series, max_points=MAX_POINTS, method='lttb'):
+    '''``series`` cut down to about ``max_points`` points, unchanged when already shorter'''
+    if method not in METHODS:
+        raise ValueError('unknown downsample method %r, expected one of %s' % (method, ', '.join(METHODS)))
+    if max_points is None or len(series) <= max_points:
+        return series
+    if method == 'minmax':
+        index = minmax_indices(series.to_numpy(), max_points // 2)
+    else:
+        index = lttb_indices(series.to_numpy(), max_points, _positions(series.index))
+    return series.iloc[index]
+
+
+def _format(value):
+    if value is None:
+        return '-'
+    if isinstance(value, (int, np.integer)):
+        return str(value)
+    return '%.4f' % value
+
+
+def _figure(cumulative, drawdown, stats, prices=None, trades=None, title=None):
+    '''Stats table, optional price panel with the executions, cumulative returns over drawdown'''
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    rows = [(label, _format(stats[key])) for key, label in STAT_LABELS if key in stats]
+    panels = [1.0, 4.0] if prices is None else [1.0, 3.0, 3.0]
+    fig = Figure(figsize=(20, 3 * len(panels) + 2))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(len(panels), 1, gridspec_kw={'height_ratios': panels})
+    if title:
+        fig.suptitle(title, fontsize=14)
+
+    ax0 = axes[0]
+    ax0.set_axis_off()
+    table = ax0.table(cellText=[[value for _, value in rows]], colLabels=[label for label, _ in rows],
+                      bbox=(0, 0, 1, 1), cellLoc='right', colLoc='right', edges='open')
+    table.set_fontsize(13)
+
+    if prices is not None:
+        ax = axes[1]
+        ax.plot(prices.index, prices.to_numpy(), lw=1.0, color='#34495E', label='close')
+        if trades is not None and len(trades):
+            for side, marker, color in (('BUY', '^', '#27AE60'), ('SELL', 'v', '#C0392B')):
+                fills = trades[trades['side'] == side]
+                fills = fills[(fills['datetime'] >= prices.index.min()) & (fills['datetime'] <= prices.index.max())]
+                ax.scatter(fills['datetime'], fills['price'], marker=marker, color=color, s=60, label=side, zorder=3)
+        ax.set_xlim(prices.index.min(), prices.index.max())
+        ax.legend(fontsize=12, loc='upper left')
+
+    ax1 = axes[-1]
+    ax2 = ax1.twinx()
+    ax1.yaxis.set_ticks_position('right')  # 回撤在右侧
+    ax2.yaxis.set_ticks_position('left')  # 累计收益在左侧
+    ax1.fill_between(drawdown.index, drawdown.to_numpy(), 0, alpha=0.3, label='drawdown (right)')
+    ax2.plot(cumulative.index, cumulative.to_numpy(), color='#F1C40F', lw=3.0, label='cumret (left)')
+    ax2.set_xlim(cumulative.index.min(), cumulative.index.max())
+    h1, l1 = ax1.get_legend_handles_labels()
+    h2, l2 = ax2.get_legend_handles_labels()
+    ax2.legend(h1 + h2, l1 + l2, fontsize=12, loc='upper left')
+    fig.tight_layout()
+    return fig
+
+
+def render(equity, path, cash=None, pnlcomm=(), benchmark=None, prices=None, trades=None, title=None,
+           max_points=MAX_POINTS, method='lttb', dpi=100, periods=metrics.BARS_PER_YEAR[KTYPE_DAY]):
+    '''Write the report of an equity curve to ``path`` without a display.
+
+    ``.html`` gets the stats table and the chart inlined, anything else is
+    a PNG. The statistics come from ``metrics.compute`` on the full curve;
+    the equity, drawdown and ``prices`` (close of the traded data) lines are
+    downsampled to ``max_points`` so the drawing time does not grow with
+    the bars. ``trades`` is a ``TradeRecorder.frame``. Uses the Agg canvas
+    directly, never pyplot, so reports can be rendered from worker
+    processes or threads. ``periods`` is the bars per year of ``equity``.
+    Returns the statistics.
+    '''
+    cash = equity.iloc[0] if cash is None else cash
+    stats = metrics.compute(equity, cash, pnlcomm, benchmark, periods=periods)
+    dd, _ = metrics.drawdown(equity)
+    cumulative = downsample(equity / cash, max_points, method)
+    # 回撤用 min/max 保留每段的最深点
+    drawdown = downsample(-dd / 100.0, max_points, 'minmax')
+    if prices is not None:
+        prices = downsample(prices, max_points, method)
+    fig = _figure(cumulative, drawdown, stats, prices, trades, title)
+
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    if path.endswith('.html'):
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=dpi)
+        table = pd.DataFrame([dict((key, _format(value)) for key, value in stats.items()
+                                   if not isinstance(value, dict))]).T
+        with open(path, 'w') as f:
+            f.write('<html><head><meta charset="utf-8"><title>%s</title></head><body>\n' % (title or 'report'))
+            f.write(table.to_html(header=False))
+            f.write('\n<img src="data:image/png;base64,%s"/>\n</body></html>\n'
+                    % base64.b64encode(buf.getvalue()).decode('ascii'))
+    else:
+        fig.savefig(path, dpi=dpi)
+    return stats
+
+
+def _render_job(job):
+    path = job['path']
+    try:
+        return path, render(**job), None
+    except Exception as e:
+        return path, None, repr(e)
+
+
+def render_many(jobs, workers=None):
+    '''Render a list of ``render`` keyword dicts (a sweep) in worker processes.
+
+    Returns a DataFrame with one row per report: path, error and the
+    scalar statistics.
+    '''
+    if workers == 1:
+        done = [_render_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = list(pool.map(_render_job, jobs))
+    rows = []
+    for path, stats, error in done:
+        row = {'path': path, 'error': error}
+        row.update((key, value) for key, value in (stats or {}).items() if not isinstance(value, dict))
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -1,61 +1,138 @@
 import backtrader as bt
 import pandas as pd
 import datetime
+import contextlib
+import json
+import bar_store
+import metrics
+import profiling
+import report
 from my_sizer import FixedPerc
 from all_strategy import KDJ_Strategy
+from trade_log import TradeRecorder
 
 
-def runstrat(data_path, cash, benchmark_data_path=None, **plot_info):
-    cerebro = bt.Cerebro(cheat_on_open=True)
+# 各周期对应的 backtrader timeframe / compression
+TIMEFRAMES = {
+    bar_store.KTYPE_1M: (bt.TimeFrame.Minutes, 1),
+    bar_store.KTYPE_60M: (bt.TimeFrame.Minutes, 60),
+    bar_store.KTYPE_DAY: (bt.TimeFrame.Days, 1),
+    bar_store.KTYPE_WEEK: (bt.TimeFrame.Weeks, 1),
+    bar_store.KTYPE_MON: (bt.TimeFrame.Months, 1),
+}
+
+
+def runstrat(data_path, cash, benchmark_data_path=None, profile=None, trade_log=None, light=False,
+             timeframes=(), ktype=bar_store.KTYPE_DAY, **plot_info):
+    # profile: 'phases' / 'cprofile' / 'pyinstrument'，不传时读环境变量 RUNSTRAT_PROFILE
+    profiler = profiling.from_env(profile)
+    phase = profiler.phase if profiler else lambda name: contextlib.nullcontext()
+
+    # light: 回测时只记录净值，指标在结束后一次性计算
+    # plot_out: 不弹窗口，把报告写到 PNG / HTML
+    plot_out = plot_info.get('plot_out') if plot_info['is_plot'] else None
+    cerebro = bt.Cerebro(cheat_on_open=True, stdstats=not light or (plot_info['is_plot'] and not plot_out))
     cerebro.broker.set_cash(cash)
     comminfo = bt.commissions.CommInfo_Stocks_Perc(commission=0.0003, percabs=True)
 
     cerebro.broker.addcommissioninfo(comminfo)
 
-    data = pd.read_excel(data_path)
+    # timeframes: 例如 ('K_WEEK', 'K_MON')，由 data_path 的 ktype K 线重采样，给 KDJ_Strategy 做多周期确认
+    # K_60M 只能由分钟线导出（ktype='K_1M'）得到
+    for higher in timeframes:
+        bar_store.check_higher(higher, ktype)
+
     # 加载数据
-    data['datetime'] = data['time_key'].map(lambda x: datetime.datetime.strptime(x.split(' ')[0], '%Y-%m-%d'))
-    data = data.set_index('datetime')
-    df = bt.feeds.PandasData(dataname=data)
+    with phase('read_excel'):
+        data = bar_store.read_excel(data_path, ktype)
+    with phase('datetime_index'):
+        data = bar_store.set_datetime_index(data)
+    timeframe, compression = TIMEFRAMES[ktype]
+    df = bt.feeds.PandasData(dataname=data, timeframe=timeframe, compression=compression)
     cerebro.adddata(df)
 
-    cerebro.addstrategy(KDJ_Strategy)
+    for higher in timeframes:
+        with phase('resample'):
+            bars = bar_store.load_resampled(data_path, higher, base_ktype=ktype)
+        timeframe, compression = TIMEFRAMES[higher]
+        cerebro.adddata(bt.feeds.PandasData(dataname=bars, timeframe=timeframe, compression=compression), name=higher)
+
+    # trade_log: 交易记录输出路径（.csv / .parquet）
+    recorder = TradeRecorder()
+    cerebro.addstrategy(KDJ_Strategy, trade_log=recorder, timeframes=tuple(timeframes))
     cerebro.addsizer(FixedPerc)
-    # Add TimeReturn Analyzers for self and the benchmark data
-    cerebro.addanalyzer(bt.analyzers.TimeReturn, _name='alltime_roi',
-                        timeframe=bt.TimeFrame.NoTimeFrame)
-
-    if benchmark_data_path is not None:
-        start_date = data.index.min()
-        end_date = data.index.max()
-        data_benchmark = pd.read_excel(benchmark_data_path)
-        data_benchmark['datetime'] = data_benchmark['time_key'].map(
-            lambda x: datetime.datetime.strptime(x.split(' ')[0], '%Y-%m-%d'))
-        data_benchmark = data_benchmark[data_benchmark['datetime'].map(lambda x: x >= start_date and x <= end_date)]
-        data_benchmark = data_benchmark.set_index('datetime')
-        df_benchmark = bt.feeds.PandasData(dataname=data_benchmark)
-        cerebro.adddata(df_benchmark)
-
-        cerebro.addanalyzer(bt.analyzers.TimeReturn, data=df_benchmark, _name='benchmark',
+    if light or plot_out:
+        cerebro.addanalyzer(metrics.EquityRecorder, _name='equity')
+    if light:
+        if benchmark_data_path is not None:
+            with phase('benchmark_load'):
+                data_benchmark = bar_store.load_bars(benchmark_data_path, start=data.index.min().normalize(),
+                                                     end=data.index.max())
+    else:
+        # Add TimeReturn Analyzers for self and the benchmark data
+        cerebro.addanalyzer(bt.analyzers.TimeReturn, _name='alltime_roi',
                             timeframe=bt.TimeFrame.NoTimeFrame)
 
-    # Add TimeReturn Analyzers fot the annuyl returns
-    cerebro.addanalyzer(bt.analyzers.TimeReturn, timeframe=bt.TimeFrame.Years, _name='_TimeReturn')
-    # Add a SharpeRatio
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, timeframe=bt.TimeFrame.Years, riskfreerate=0.01)
+        if benchmark_data_path is not None:
+            # 日线基准从首根 K 线当天取起，分钟线的第一根 K 线前就有基准，不推迟开始交易
+            start_date = data.index.min().normalize()
+            end_date = data.index.max()
+            with phase('benchmark_load'):
+                data_benchmark = bar_store.load_bars(benchmark_data_path, start=start_date, end=end_date)
+            df_benchmark = bt.feeds.PandasData(dataname=data_benchmark)
+            cerebro.adddata(df_benchmark)
 
-    # Add SQN to qualify the trades
-    cerebro.addanalyzer(bt.analyzers.SQN)
-    cerebro.addobserver(bt.observers.DrawDown)
+            cerebro.addanalyzer(bt.analyzers.TimeReturn, data=df_benchmark, _name='benchmark',
+                                timeframe=bt.TimeFrame.NoTimeFrame)
 
-    results = cerebro.run()
+        # Add TimeReturn Analyzers fot the annuyl returns
+        cerebro.addanalyzer(bt.analyzers.TimeReturn, timeframe=bt.TimeFrame.Years, _name='_TimeReturn')
+        # Add a SharpeRatio
+        cerebro.addanalyzer(bt.analyzers.SharpeRatio, timeframe=bt.TimeFrame.Years, riskfreerate=0.01)
+
+        # Add SQN to qualify the trades
+        cerebro.addanalyzer(bt.analyzers.SQN)
+        cerebro.addobserver(bt.observers.DrawDown)
+
+    results = profiler.run(cerebro) if profiler else cerebro.run()
     st0 = results[0]
 
-    for anlyzer in st0.analyzers:
-        anlyzer.print()
+    with phase('analyzer_output'):
+        if light:
+            equity = st0.analyzers.equity
+            stats = metrics.compute(equity.equity(), equity.cash, equity.pnlcomm,
+                                    data_benchmark if benchmark_data_path is not None else None,
+                                    periods=metrics.periods_per_year(ktype))
+            for name, value in stats.items():
+                print('%s: %s' % (name, value))
+        else:
+            for anlyzer in st0.analyzers:
+                if not isinstance(anlyzer, metrics.EquityRecorder):
+                    anlyzer.print()
+
+    if plot_out:
+        with phase('plot'):
+            equity = st0.analyzers.equity
+            start, end = plot_info.get('plot_start'), plot_info.get('plot_end')
+            window = slice(start and pd.Timestamp(start), end and pd.Timestamp(end))
+            curve = equity.equity()
+            clipped = curve[window]
+            # 区间的收益从区间前一根 K 线的市值起算
+            first = curve.index.get_loc(clipped.index[0]) if len(clipped) else 0
+            cash = curve.iloc[first - 1] if first else equity.cash
+            report.render(clipped, plot_out, cash, equity.pnlcomm,
+                          data_benchmark[window] if benchmark_data_path is not None else None,
+                          prices=data['close'][window], trades=recorder.frame(), title=data_path,
+                          periods=metrics.periods_per_year(ktype))
+    elif plot_info['is_plot']:
+        with phase('plot'):
+            cerebro.plot(iplot=False, stdstats=False, start=plot_info['plot_start'], end=plot_info['plot_end'])
+
+    if trade_log is not None:
+        recorder.flush(trade_log)
 
-    if plot_info['is_plot']:
-        cerebro.plot(iplot=False, stdstats=False, start=plot_info['plot_start'], end=plot_info['plot_end'])
+    if profiler:
+        print('profile: %s' % json.dumps(profiler.save()))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BarStore, DEFAULT_ROOT, KTYPE_DAY
+from indicator_cache import crossover, macd
+from my_indicator import kdj
+from vector_backtest import kdj_signals
+
+COLUMNS = ['time_key', 'high', 'low', 'close']
+LOOKBACK = 1000
+
+
+def latest_signals(high, low, close, macd1=12, macd2=26, macdsig=9):
+    '''KDJ_Strategy / TheStrategy signals of the last bar, None if the history is too short'''
+    close = np.asarray(close, dtype=np.float64)
+    if len(close) < max(macd1, macd2) + macdsig + 1:
+        return None
+
+    _, k, d, j = kdj(high, low, close)
+    entry, exit_, _ = kdj_signals(k[-3:], d[-3:], j[-3:])
+    line, signal, _ = macd(close, macd1, macd2, macdsig)
+    cross = crossover(line, signal, max(macd1, macd2) + macdsig - 1)[0][-1]
+    gap0, gap1 = d[-1] - k[-1], d[-2] - k[-2]
+    return {
+        'close': close[-1],
+        'K': k[-1], 'D': d[-1], 'J': j[-1],
+        'gap_ratio': gap0 / gap1 if gap1 else np.nan,
+        'kdj_buy': bool(entry[-1]),
+        'kdj_sell': bool(exit_[-1]),
+        'macd_buy': bool(cross > 0 and line[-1] > 0),
+        'macd_sell': bool(cross < 0 and line[-1] < 0),
+    }
+
+
+def stream_signals(pages, lookback=LOOKBACK):
+    '''``latest_signals`` over an iterable of kline pages (``futu_util.iter_stock_k_line``).
+
+    Only the last ``lookback`` bars are kept while the pages go by. The EMA
+    based KDJ/MACD forget their seed long before that, so the signals match
+    the full history to float precision.
+    '''
+    tail = None
+    for page in pages:
+        page = page[COLUMNS]
+        tail = page if tail is None else pd.concat([tail, page], ignore_index=True)
+        tail = tail.iloc[-lookback:]
+    if tail is None:
+        return None
+    result = latest_signals(tail['high'].to_numpy(), tail['low'].to_numpy(), tail['close'].to_numpy())
+    if result is not None:
+        result['time_key'] = str(tail['time_key'].iloc[-1])
+    return result
+
+
+def _screen_one(root, ktype, lookback, code):
+    store = BarStore(root)
+    if not store.exists(code, ktype):
+        return None
+    bars = store.read_columns(code, ktype, COLUMNS)
+    if lookback:
+        bars = dict((name, values[-lookback:]) for name, values in bars.items())
+    result = latest_signals(bars['high'], bars['low'], bars['close'])
+    if result is not None:
+        result['code'] = code
+        result['time_key'] = str(bars['time_key'][-1])
+    return result
+
+
+def screen(stock_info, root=DEFAULT_ROOT, ktype=KTYPE_DAY, workers=1, lookback=None):
+    '''Evaluate the latest bar of every code in ``stock_info`` (``get_stock_info`` output).
+
+    Codes without cached bars are skipped. Buy candidates come first, ranked
+    by how far the D-K gap shrank on the last bar. ``lookback`` limits the
+    indicators to the last bars of each code, e.g. for long minute series.
+    '''
+    codes = list(stock_info['code'])
+    job = functools.partial(_screen_one, root, ktype, lookback)
+    if workers == 1:
+        rows = [job(code) for code in codes]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            rows = list(pool.map(job, codes, chunksize=max(1, len(codes) // 64)))
+
+    result = pd.DataFrame([row for row in rows if row is not None])
+    if result.empty:
+        return result
+    if 'name' in stock_info.columns:
+        result = result.merge(stock_info[['code', 'name']], on='code', how='left')
+    result['buy'] = result['kdj_buy'] | result['macd_buy']
+    result = result.sort_values(['buy', 'gap_ratio'], ascending=[False, True])
+    return result.reset_index(drop=True)
+
+
+def runscreen(args=None):
+    args = parse_args(args)
+    from futu import Market, SecurityType
+    import futu_util
+
+    stock_info = futu_util.get_stock_info(Market.HK, SecurityType.STOCK)
+    result = screen(stock_info, root=args.store, ktype=args.ktype, workers=args.workers,
+                    lookback=args.lookback)
+    if result.empty:
+        print('no cached bars for any of the %d codes in %s' % (len(stock_info), args.store))
+        return
+    print(result[result['buy']].head(args.top).to_string())
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Screen the HK market for KDJ/MACD signals on the latest bar')
+
+    parser.add_argument('--store', required=False, default=DEFAULT_ROOT,
+                        help='Bar store root directory')
+
+    parser.add_argument('--ktype', required=False, default=KTYPE_DAY,
+                        help='Kline type of the cached bars')
+
+    parser.add_argument('--workers', required=False, type=int, default=None,
+                        help='Worker processes, defaults to the cpu count')
+
+    parser.add_argument('--lookback', required=False, type=int, default=None,
+                        help='Only use the last bars of each code, all of them if not set')
+
+    parser.add_argument('--top', required=False, type=int, default=50,
+                        help='Number of candidates to print')
+
+    if pargs is not None:
+        return parser.parse_args(pargs)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    runscreen()
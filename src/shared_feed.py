@@ -0,0 +1,113 @@
+import array
+from multiprocessing import shared_memory
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+OHLCV = ('open', 'high', 'low', 'close', 'volume', 'openinterest')
+
+
+class SharedBars(object):
+    '''OHLCV columns plus the datetime index in one ``SharedMemory`` block.
+
+    The parent process ``create``s it once and hands the small picklable
+    ``descriptor`` to the workers, which ``attach`` to the same pages
+    instead of each loading (or unpickling) the bars. The block also holds
+    the backtrader datetime numbers, so ``SharedPandasData`` lines can be
+    views on it rather than buffers filled in every process.
+    Frames returned by ``frame`` are views, drop them before ``close``.
+    '''
+
+    def __init__(self, shm, columns, rows, owner):
+        self.shm = shm
+        self.columns = tuple(columns)
+        self.rows = rows
+        self.owner = owner
+        # row 0 is the datetime64[ns] index, row 1 the same times as backtrader
+        # numbers, one row per column after them
+        self.block = np.ndarray((len(self.columns) + 2, rows), dtype=np.float64, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, data):
+        columns = OHLCV  # 缺的列留 NaN，和 PandasData 没有这列时一样
+        rows = len(data)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, (len(columns) + 2) * rows * 8))
+        bars = cls(shm, columns, rows, owner=True)
+        bars.block[0].view(np.int64)[:] = data.index.values.astype('datetime64[ns]').view(np.int64)
+        # 与 PandasData._load 一样逐个 date2num，保证数值完全相同
+        bars.block[1] = [bt.date2num(dt) for dt in data.index.to_pydatetime()]
+        for i, name in enumerate(columns, 2):
+            bars.block[i] = data[name].to_numpy(dtype=np.float64) if name in data.columns else np.nan
+        return bars
+
+    @classmethod
+    def attach(cls, descriptor):
+        name, columns, rows = descriptor
+        return cls(shared_memory.SharedMemory(name=name), columns, rows, owner=False)
+
+    @property
+    def descriptor(self):
+        return self.shm.name, self.columns, self.rows
+
+    def frame(self):
+        index = pd.DatetimeIndex(self.block[0].view('datetime64[ns]'), name='datetime')
+        return pd.DataFrame(self.block[2:].T, index=index, columns=list(self.columns), copy=False)
+
+    def line(self, name):
+        '''Read-only view of one column, ``'datetime'`` for the backtrader numbers'''
+        row = 1 if name == 'datetime' else self.columns.index(name) + 2
+        values = self.block[row]
+        values.flags.writeable = False
+        return values
+
+    def close(self):
+        self.block = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SharedPandasData(bt.feeds.PandasData):
+    '''``PandasData`` reading from a ``SharedBars`` block (or its descriptor)
+    instead of a DataFrame private to the process.
+
+    Preloading points the lines at views on the block, so the bars take no
+    memory of their own in any process. With from/to dates or filters the
+    lines are loaded bar by bar as in ``PandasData``.
+    The views are dropped when the data stops, a block attached here from
+    a descriptor is closed then as well.
+    '''
+    params = (('shared', None),)
+
+    def __init__(self):
+        shared = self.p.shared
+        self._attached = not isinstance(shared, SharedBars)
+        if self._attached:
+            shared = SharedBars.attach(shared)
+        self.shared = shared
+        self.p.dataname = shared.frame()
+        super(SharedPandasData, self).__init__()
+
+    def preload(self):
+        if self.p.fromdate is not None or self.p.todate is not None or self._filters or self._tzinput:
+            return super(SharedPandasData, self).preload()
+        for name in self.lines.getlinealiases():
+            getattr(self.lines, name).array = self.shared.line(name)
+        self.home()
+
+    def stop(self):
+        super(SharedPandasData, self).stop()
+        # 先释放对共享内存的视图，否则 close 会报 BufferError
+        self.p.dataname = None
+        for line in self.lines:
+            line.array = array.array(str('d'))
+        if self._attached and self.shared is not None:
+            self.shared.close()
+            self.shared = None
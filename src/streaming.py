@@ -0,0 +1,108 @@
+import collections
+import math
+
+NAN = float('NaN')
+
+
+class RollingExtreme(object):
+    '''Rolling max (or min) over the last ``period`` values, amortized O(1) per value.
+
+    A monotonic deque keeps only the values that can still become the
+    extreme: every new value drops the ones it dominates from the back and
+    the front falls out once it leaves the window. NaN until ``period``
+    values were pushed.
+    '''
+
+    def __init__(self, period, highest=True):
+        self.period = period
+        self.highest = highest
+        self.count = 0
+        self._window = collections.deque()
+
+    def push(self, value):
+        window = self._window
+        if self.highest:
+            while window and window[-1][1] <= value:
+                window.pop()
+        else:
+            while window and window[-1][1] >= value:
+                window.pop()
+        window.append((self.count, value))
+        if window[0][0] <= self.count - self.period:
+            window.popleft()
+        self.count += 1
+        return window[0][1] if self.count >= self.period else NAN
+
+
+class StreamingEMA(object):
+    '''backtrader ``ExponentialSmoothing`` one value at a time: SMA seed over the
+    first ``period`` values, then the exponential recursion (see ``indicator_cache.ema``).'''
+
+    def __init__(self, period, alpha=None):
+        self.period = period
+        self.alpha = 2.0 / (1.0 + period) if alpha is None else alpha
+        self.alpha1 = 1.0 - self.alpha
+        self.value = NAN
+        self._seed = []
+
+    def push(self, value):
+        if self._seed is not None:
+            self._seed.append(value)
+            if len(self._seed) < self.period:
+                return NAN
+            self.value = math.fsum(self._seed) / self.period
+            self._seed = None
+            return self.value
+        self.value = self.value * self.alpha1 + value * self.alpha
+        return self.value
+
+
+class StreamingMACD(object):
+    '''macd, signal, histo of ``bt.indicators.MACDHisto``, updated per bar'''
+
+    def __init__(self, period_me1=12, period_me2=26, period_signal=9):
+        self.me1 = StreamingEMA(period_me1)
+        self.me2 = StreamingEMA(period_me2)
+        self.signal = StreamingEMA(period_signal)
+        self.start = max(period_me1, period_me2) - 1
+        self.count = 0
+
+    def push(self, close):
+        line = self.me1.push(close) - self.me2.push(close)
+        signal = self.signal.push(line) if self.count >= self.start else NAN
+        self.count += 1
+        return line, signal, line - signal
+
+
+class StreamingKDJ(object):
+    '''RSV/K/D/J of ``my_indicator.kdj`` updated per bar in O(1).
+
+    Highest/lowest come from monotonic deques, K and D follow the
+    ``CusExponentialSmoothing`` recursion seeded with ``first_k``/``first_d``.
+    '''
+
+    def __init__(self, period_me1=3, period_me2=3, period_signal=9, first_k=66.464, first_d=69.635):
+        self.highest = RollingExtreme(period_signal, highest=True)
+        self.lowest = RollingExtreme(period_signal, highest=False)
+        self.start_k = period_signal + period_me1 - 1
+        self.start_d = self.start_k + period_me2 - 1
+        self.alpha = 1 / 3
+        self.alpha1 = 1.0 - self.alpha
+        self.k = first_k
+        self.d = first_d
+        self.count = 0
+
+    def push(self, high, low, close):
+        i = self.count
+        self.count += 1
+        highest = self.highest.push(high)
+        lowest = self.lowest.push(low)
+        span = highest - lowest
+        rsv = 100 * ((close - lowest) / span) if span else NAN
+        if i < self.start_k:
+            return rsv, NAN, NAN, NAN
+        self.k = k = self.k * self.alpha1 + rsv * self.alpha
+        if i < self.start_d:
+            return rsv, k, NAN, NAN
+        self.d = d = self.d * self.alpha1 + k * self.alpha
+        return rsv, k, d, 3 * k - 2 * d
@@ -0,0 +1,312 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import bisect
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from live_signals import BUY, SELL
+from quote_client import DEFAULT_HOST, DEFAULT_PORT, RET_OK
+
+# same values as futu TrdEnv / TrdMarket / OrderType / OrderStatus
+TRD_ENV_SIMULATE = 'SIMULATE'
+TRD_ENV_REAL = 'REAL'
+TRD_MARKET_HK = 'HK'
+SECURITY_TYPE_STOCK = 'STOCK'
+ORDER_TYPE_MARKET = 'MARKET'
+FILLED_STATUSES = ('FILLED_ALL',)
+DEAD_STATUSES = ('CANCELLED_ALL', 'CANCELLED_PART', 'FAILED', 'DISABLED', 'DELETED')
+
+PHASES = ('signal_to_submit', 'submit_to_ack', 'ack_to_fill')
+
+
+class LatencyHistogram(object):
+    '''Log-spaced histogram of durations in seconds, 4 buckets per decade from 1us to 100s'''
+
+    BOUNDS = [1e-6 * 10 ** (i / 4.0) for i in range(33)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        '''Upper bound of the bucket holding the q-th percentile, capped at the largest duration seen'''
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99),
+                'max': self.max if self.count else None}
+
+
+class OrderRecord(object):
+    '''One order placed for a signal, with the timestamps of each step'''
+
+    def __init__(self, signal, qty):
+        self.signal = signal
+        self.code = signal.code
+        self.side = signal.side
+        self.qty = qty
+        self.order_id = None
+        self.status = 'QUEUED'
+        self.error = None
+        self.fill_price = None
+        self.t_signal = signal.created
+        self.t_submit = self.t_ack = self.t_fill = None
+
+    def as_dict(self):
+        return {'code': self.code, 'time_key': self.signal.time_key, 'side': self.side, 'qty': self.qty,
+                'order_id': self.order_id, 'status': self.status, 'fill_price': self.fill_price,
+                'error': self.error, 't_signal': self.t_signal, 't_submit': self.t_submit,
+                't_ack': self.t_ack, 't_fill': self.t_fill}
+
+
+class TradeExecutor(object):
+    '''Turns ``live_signals`` orders into ``OpenSecTradeContext`` market orders.
+
+    ``submit`` only queues the signal, a worker thread places the orders so
+    the quote push thread is never blocked on the trade API. Each signal
+    (code, time_key, side) is ordered once. Buys are sized like
+    ``FixedPerc`` on the account cash in whole lots, sells close the
+    position the account reports once the pending buys of the code are
+    filled (up to ``fill_timeout``). The lot size of each code comes from
+    ``get_stock_basicinfo`` on ``quote_client`` (the process wide one by
+    default) and is cached, a ``lot_size`` number is used for every code
+    instead. The fill comes back through the ``TradeOrderHandlerBase``
+    push; the time from signal to submit, submit to ack and ack to fill
+    goes to one ``LatencyHistogram`` per phase.
+
+    ``trd_env`` is ``TRD_ENV_SIMULATE`` (paper trading) or ``TRD_ENV_REAL``,
+    which needs the trade ``password`` to unlock. ``context_factory``
+    defaults to futu ``OpenSecTradeContext``, use
+    ``fake_futu.FakeTradeServer.trade_context`` with
+    ``handler_base=fake_futu.FakeTradeOrderHandlerBase`` to run offline.
+    '''
+
+    def __init__(self, trd_env=TRD_ENV_SIMULATE, password=None, perc=1, lot_size=None, on_fill=None,
+                 context_factory=None, handler_base=None, host=DEFAULT_HOST, port=DEFAULT_PORT, fill_timeout=10.0,
+                 quote_client=None):
+        if trd_env not in (TRD_ENV_SIMULATE, TRD_ENV_REAL):
+            raise ValueError('unknown trd_env %r' % (trd_env,))
+        self.trd_env = trd_env
+        self.password = password
+        self.perc = perc
+        self.lot_size = lot_size
+        self.quote_client = quote_client
+        self._lot_sizes = {}
+        self.on_fill = on_fill
+        self.fill_timeout = fill_timeout
+        self.context_factory = context_factory
+        self.handler_base = handler_base
+        self.host = host
+        self.port = port
+        self.histograms = dict((phase, LatencyHistogram()) for phase in PHASES)
+        self.records = []
+        self.positions = {}
+        self._seen = set()
+        self._by_id = {}
+        self._queue = queue.Queue()
+        self._lock = threading.RLock()
+        self._done = threading.Condition(self._lock)
+        self._ctx = None
+        self._worker = None
+
+    def _connect(self):
+        factory = self.context_factory
+        if factory is None:
+            from futu import OpenSecTradeContext
+            factory = OpenSecTradeContext
+        ctx = factory(filter_trdmarket=TRD_MARKET_HK, host=self.host, port=self.port)
+        ctx.set_handler(order_handler(self, self.handler_base))
+        if self.trd_env == TRD_ENV_REAL:
+            ret, err = ctx.unlock_trade(self.password)
+            if ret != RET_OK:
+                ctx.close()
+                raise IOError('unlock_trade failed: %s' % err)
+        return ctx
+
+    def start(self):
+        if self._worker is None:
+            self._ctx = self._connect()
+            self._worker = threading.Thread(target=self._run, name='trade-executor', daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        '''Place the queued orders, wait for their fills (up to ``timeout``) and disconnect'''
+        if self._worker is None:
+            return
+        self._queue.put(None)
+        self._worker.join()
+        self.wait(timeout)
+        self._worker = None
+        self._ctx.close()
+        self._ctx = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def submit(self, signal):
+        '''``LiveSignalEngine`` ``on_signal`` callback, flags are ignored'''
+        if signal.kind != 'order':
+            return None
+        key = (signal.code, signal.ktype, signal.time_key, signal.side)
+        with self._lock:
+            if key in self._seen:
+                return None
+            self._seen.add(key)
+            record = OrderRecord(signal, None)
+            self.records.append(record)
+        self._queue.put(record)
+        return record
+
+    def lot_size_of(self, code):
+        '''Shares per lot of ``code``, looked up once per code'''
+        if self.lot_size is not None:
+            return self.lot_size
+        if code not in self._lot_sizes:
+            client = self.quote_client
+            if client is None:
+                from quote_client import get_client
+                client = get_client()
+            ret, data = client.call('get_stock_basicinfo', TRD_MARKET_HK, SECURITY_TYPE_STOCK, [code])
+            if ret != RET_OK:
+                raise IOError(data)
+            data = data[data['code'] == code]
+            if not len(data):
+                raise IOError('no basic info for %s' % code)
+            self._lot_sizes[code] = int(data['lot_size'].iloc[0])
+        return self._lot_sizes[code]
+
+    def _held(self, code):
+        ret, data = self._ctx.position_list_query(code=code, trd_env=self.trd_env)
+        if ret != RET_OK:
+            raise IOError(data)
+        data = data[data['code'] == code]
+        # 有 can_sell_qty 时以可卖数量为准
+        return int(data['can_sell_qty' if 'can_sell_qty' in data.columns else 'qty'].sum())
+
+    def _quantity(self, record):
+        if record.side == SELL:
+            # 先等同一代码未成交的买单，否则卖出数量会漏掉它
+            with self._done:
+                self._done.wait_for(lambda: not any(
+                    r.code == record.code and r.side == BUY and r.status == 'SUBMITTED' for r in self.records),
+                    self.fill_timeout)
+            return self._held(record.code)
+        ret, data = self._ctx.accinfo_query(trd_env=self.trd_env)
+        if ret != RET_OK:
+            raise IOError(data)
+        cash = float(data['cash'].iloc[0])
+        lot_size = self.lot_size_of(record.code)
+        lots = int(self.perc * cash // (record.signal.price * lot_size))
+        return lots * lot_size
+
+    def _place(self, record):
+        try:
+            record.qty = self._quantity(record)
+        except Exception as e:
+            record.status, record.error = 'FAILED', str(e)
+            return
+        if not record.qty:
+            record.status = 'SKIPPED'
+            return
+
+        with self._lock:
+            record.t_submit = time.perf_counter()
+            ret, data = self._ctx.place_order(record.signal.price, record.qty, record.code, record.side,
+                                              order_type=ORDER_TYPE_MARKET, trd_env=self.trd_env)
+            record.t_ack = time.perf_counter()
+            self.histograms['signal_to_submit'].record(record.t_submit - record.t_signal)
+            self.histograms['submit_to_ack'].record(record.t_ack - record.t_submit)
+            if ret != RET_OK:
+                record.status, record.error = 'FAILED', str(data)
+                return
+            record.order_id = str(data['order_id'].iloc[0])
+            record.status = 'SUBMITTED'
+            self._by_id[record.order_id] = record
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self._place(record)
+            with self._done:
+                self._done.notify_all()
+
+    def on_order(self, data):
+        '''``TradeOrderHandlerBase`` push frame (order_id, order_status, dealt_qty, dealt_avg_price, ...)'''
+        filled = []
+        with self._done:
+            for row in data.to_dict('records'):
+                record = self._by_id.get(str(row['order_id']))
+                if record is None or record.t_fill is not None:
+                    continue
+                if row['order_status'] in FILLED_STATUSES:
+                    record.t_fill = time.perf_counter()
+                    record.status = row['order_status']
+                    record.fill_price = float(row['dealt_avg_price'])
+                    qty = int(row['dealt_qty'])
+                    sign = 1 if record.side == BUY else -1
+                    self.positions[record.code] = self.positions.get(record.code, 0) + sign * qty
+                    self.histograms['ack_to_fill'].record(record.t_fill - record.t_ack)
+                    filled.append(record)
+                elif row['order_status'] in DEAD_STATUSES:
+                    record.status = row['order_status']
+            self._done.notify_all()
+        if self.on_fill is not None:
+            for record in filled:
+                self.on_fill(record)
+
+    def _pending(self):
+        return any(record.status in ('QUEUED', 'SUBMITTED') for record in self.records)
+
+    def wait(self, timeout=None):
+        '''Block until every submitted signal is filled, skipped or failed, False on timeout'''
+        with self._done:
+            return self._done.wait_for(lambda: not self._pending(), timeout)
+
+    def latency_report(self):
+        return dict((phase, self.histograms[phase].summary()) for phase in PHASES)
+
+    def orders(self):
+        return pd.DataFrame([record.as_dict() for record in self.records])
+
+
+def order_handler(executor, handler_base=None):
+    if handler_base is None:
+        from futu import TradeOrderHandlerBase
+        handler_base = TradeOrderHandlerBase
+
+    class OrderHandler(handler_base):
+        def on_recv_rsp(self, rsp_pb):
+            ret, data = super(OrderHandler, self).on_recv_rsp(rsp_pb)
+            if ret == RET_OK:
+                executor.on_order(data)
+            return ret, data
+
+    return OrderHandler()
@@ -0,0 +1,86 @@
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+SIDES = ('BUY', 'SELL', 'TRADE')
+BUY, SELL, TRADE = range(3)
+VALUES = ('price', 'value', 'comm', 'pnl', 'pnlcomm')
+
+
+class TradeRecorder(object):
+    '''Columnar buffer of order executions and closed trades.
+
+    ``order``/``trade`` only store numbers into preallocated arrays (doubled
+    when full); dates stay as backtrader floats until ``frame``. The text of
+    the old ``log`` calls comes from ``render``, the table from ``flush``.
+    '''
+
+    def __init__(self, capacity=256):
+        self.size = 0
+        self._dt = np.empty(capacity)
+        self._side = np.empty(capacity, dtype=np.int8)
+        self._values = np.full((len(VALUES), capacity), np.nan)
+
+    def _next_row(self):
+        i = self.size
+        if i == len(self._dt):
+            capacity = 2 * i
+            self._dt = np.resize(self._dt, capacity)
+            self._side = np.resize(self._side, capacity)
+            values = np.full((len(VALUES), capacity), np.nan)
+            values[:, :i] = self._values
+            self._values = values
+        self.size = i + 1
+        return i
+
+    def order(self, dt, isbuy, price, value, comm):
+        '''An executed order, ``dt`` is ``data.datetime[0]``'''
+        i = self._next_row()
+        self._dt[i] = dt
+        self._side[i] = BUY if isbuy else SELL
+        self._values[0, i] = price
+        self._values[1, i] = value
+        self._values[2, i] = comm
+
+    def trade(self, dt, pnl, pnlcomm):
+        i = self._next_row()
+        self._dt[i] = dt
+        self._side[i] = TRADE
+        self._values[3, i] = pnl
+        self._values[4, i] = pnlcomm
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.size = 0
+        self._values[:] = np.nan
+
+    def frame(self):
+        n = self.size
+        data = {'datetime': [bt.num2date(x) for x in self._dt[:n]],
+                'side': np.array(SIDES)[self._side[:n]]}
+        for name, values in zip(VALUES, self._values[:, :n]):
+            data[name] = values
+        return pd.DataFrame(data)
+
+    def render(self):
+        '''The lines the strategies used to print, one per event'''
+        lines = []
+        for dt, side, values in zip(self._dt[:self.size], self._side[:self.size], self._values[:, :self.size].T):
+            price, value, comm, pnl, pnlcomm = values
+            if side == TRADE:
+                txt = 'OPERATION PROFIT, GROSS %.2f, NET %.2f' % (pnl, pnlcomm)
+            else:
+                txt = '%s EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' % (SIDES[side], price, value, comm)
+            lines.append('%s, %s' % (bt.num2date(dt).date().isoformat(), txt))
+        return '\n'.join(lines)
+
+    def flush(self, path):
+        '''Write the events to ``path``, Parquet for ``.parquet`` and CSV otherwise'''
+        data = self.frame()
+        if path.endswith('.parquet'):
+            data.to_parquet(path, index=False)
+        else:
+            data.to_csv(path, index=False)
+        return data
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from metrics import summary
+from my_indicator import kdj
+
+
+def _shift(values, n=1):
+    out = np.full(len(values), np.nan)
+    out[n:] = values[:-n]
+    return out
+
+
+def kdj_signals(k, d, j):
+    '''Per-bar conditions of ``KDJ_Strategy.next`` as bool arrays.
+
+    entry: the D-K gap is positive, shrank to less than half and is below 5
+    exit: J >= 90 with a >10% drop or two consecutive >5% drops
+    no_rise: J did not rise, used to cancel a predicted cross
+    '''
+    j1, j2 = _shift(j), _shift(j, 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gap0 = d - k
+        gap1 = _shift(gap0)
+        entry = (gap0 > 0) & (gap1 > 0) & (gap0 / gap1 < 0.5) & (gap0 < 5)
+        drop1 = (j - j1) / j1
+        drop2 = (j1 - j2) / j2
+        exit_ = (j >= 90) & ((drop1 < -0.10) | ((drop1 < -0.05) & (drop2 < -0.05)))
+    return entry, exit_, j <= j1
+
+
+def kdj_strategy_minperiod(macd1=12, macd2=26, macdsig=9, period_me1=3, period_me2=3, period_signal=9):
+    '''Bars before ``KDJ_Strategy.next`` is first called (its MACD and KDJ crossovers)'''
+    return max(max(macd1, macd2) + macdsig, period_signal + period_me1 + period_me2 - 1)
+
+
+def backtest_kdj(bars, cash=50000, commission=0.0003, perc=1, riskfreerate=0.01,
+                 macd1=12, macd2=26, macdsig=9, **kdj_params):
+    '''Fast path of ``KDJ_Strategy`` under ``cheat_on_open`` with ``FixedPerc``.
+
+    The signals are computed as array operations, only the position and the
+    pending buy/sell flags go through a per-bar loop. Orders fill at the
+    open of the bar after the signal, sized on that bar's close like the
+    backtrader path. Returns (trades, equity, stats); stats has the keys of
+    ``param_sweep.run_once``.
+    '''
+    open_ = bars['open'].to_numpy(dtype=np.float64)
+    low = bars['low'].to_numpy(dtype=np.float64)
+    close = bars['close'].to_numpy(dtype=np.float64)
+    _, k, d, j = kdj(bars['high'], low, close, **kdj_params)
+    entry, exit_, no_rise = (x.tolist() for x in kdj_signals(k, d, j))
+    start = kdj_strategy_minperiod(macd1, macd2, macdsig, **kdj_params) - 1
+
+    open_l, low_l, close_l = open_.tolist(), low.tolist(), close.tolist()
+    start_cash = float(cash)
+    equity = np.full(len(close_l), start_cash)
+    trades = []
+    buy_flag = sell_flag = predict_cross = False
+    size = 0
+    entry_i = entry_price = entry_comm = None
+
+    for i in range(start, len(close_l)):
+        # next_open
+        held = size
+        if buy_flag and open_l[i] > low_l[i - 1]:
+            buy_flag = False
+            qty = int(perc * cash // close_l[i])
+            cost = qty * open_l[i]
+            comm = cost * commission
+            if qty and cash - cost - comm >= 0.0:
+                size, cash = qty, cash - cost - comm
+                entry_i, entry_price, entry_comm = i, open_l[i], comm
+        if sell_flag:
+            if held:
+                value = held * open_l[i]
+                comm = value * commission
+                cash += value - comm
+                pnl = held * (open_l[i] - entry_price)
+                trades.append((bars.index[entry_i], entry_price, bars.index[i], open_l[i],
+                               held, pnl, pnl - entry_comm - comm))
+                size = 0
+            sell_flag = False
+
+        # next
+        if predict_cross:
+            if no_rise[i]:
+                sell_flag = True
+            predict_cross = False
+        if not size:
+            if entry[i]:
+                buy_flag = True
+                predict_cross = True
+        elif exit_[i]:
+            sell_flag = True
+
+        equity[i] = cash + size * close_l[i]
+
+    trades = pd.DataFrame(trades, columns=['entry_dt', 'entry_price', 'exit_dt', 'exit_price',
+                                           'size', 'pnl', 'pnlcomm'])
+    equity = pd.Series(equity, index=bars.index, name='value')
+    # 整条曲线都算进去，warm-up 的 bar 也在：backtrader 的分析器在 prenext 里同样会记录，
+    # warm-up 跨年时按年的收益（sharpe）才一致
+    stats = summary(equity, trades, start_cash, riskfreerate)
+    return trades, equity, stats
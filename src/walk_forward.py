@@ -0,0 +1,275 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import functools
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import bar_store
+import metrics
+from indicator_cache import IndicatorCache
+from param_sweep import STRATEGIES, _search_params, run_once
+
+WalkForward = collections.namedtuple('WalkForward', 'folds equity pnlcomm stats')
+
+# bars and indicator cache of the current worker process, set by the initializer
+_bars = None
+_cache = None
+
+
+def folds(n, train, test, step=None, anchored=False):
+    '''(train_start, train_stop, test_start, test_stop) bar positions of the rolling windows.
+
+    Each test window follows its train window, the windows move by ``step``
+    bars (``test`` by default, so the test windows tile the history).
+    ``anchored`` keeps every train window starting at bar 0.
+    '''
+    step = step or test
+    result = []
+    start = 0
+    while start + train + test <= n:
+        result.append((0 if anchored else start, start + train, start + train, start + train + test))
+        start += step
+    return result
+
+
+def _sha(values):
+    return hashlib.sha1(np.ascontiguousarray(values, dtype=np.float64).data).hexdigest()
+
+
+class WindowCache(object):
+    '''``IndicatorCache`` front for backtests on windows of one bar history.
+
+    The cached indicators of a window run ask for their values on the
+    window's lines; this computes them once on the whole history instead
+    and hands out the window's slice, so overlapping folds and every params
+    set with the same indicator params share one computation. The
+    indicators only look back, a slice of the full run is the window's
+    series already warmed up by the bars before it. Inputs are matched to
+    the full history by value: the price columns and the lines this cache
+    returned before, plus the numbers given in place of a line
+    (``CrossOver`` against 90). Anything else, a line that is only flat
+    over the window included, is computed on the window alone.
+    '''
+
+    def __init__(self, bars, cache=None):
+        self.columns = [bars[name].to_numpy(dtype=np.float64) for name in bars.columns
+                        if pd.api.types.is_numeric_dtype(bars[name])]
+        self.rows = len(bars)
+        self.cache = cache if cache is not None else IndicatorCache()
+        self.offset = 0
+        self._derived = {}
+
+    def window(self, offset):
+        '''Set the position of the window's first bar in the full history'''
+        self.offset = offset
+        return self
+
+    def _full(self, values):
+        n, offset = len(values), self.offset
+        if n and values.strides == (0,):
+            # 数字常量（indicator_cache.line_values），整段历史都是同一个值
+            return np.full(self.rows, values[0])
+        for full in self.columns:
+            if np.array_equal(full[offset:offset + n], values, equal_nan=True):
+                return full
+        return self._derived.get((offset, n, _sha(values)))
+
+    def get(self, name, inputs, params, compute):
+        full = [self._full(values) for values in inputs]
+        if any(values is None for values in full):
+            return self.cache.get(name, inputs, params, compute)
+
+        n, offset = len(inputs[0]), self.offset
+        result = []
+        for values in self.cache.get(name, full, params, compute):
+            window = values[offset:offset + n]
+            self._derived[(offset, n, _sha(window))] = values
+            result.append(window)
+        return tuple(result)
+
+    @property
+    def hits(self):
+        return self.cache.hits
+
+    @property
+    def misses(self):
+        return self.cache.misses
+
+
+def _init_worker(data_path, start, end, ktype, cache_root):
+    global _bars, _cache
+    _bars = bar_store.load_bars(data_path, start=start, end=end, ktype=ktype)
+    _cache = WindowCache(_bars, IndicatorCache(root=cache_root))
+
+
+def _run_window(strategy, run_kwargs, job):
+    fold, lo, hi, params, equity = job
+    result = run_once(_bars.iloc[lo:hi], strategy, params, cache=_cache.window(lo), equity=equity, **run_kwargs)
+    result['fold'] = fold
+    return result
+
+
+def stitch(curves, cash):
+    '''Chain the test equity curves, each one continuing from the value the previous one ended at'''
+    parts = []
+    level = cash
+    for curve in curves:
+        if not len(curve):
+            continue
+        parts.append(curve / cash * level)
+        level = parts[-1].iloc[-1]
+    return pd.concat(parts) if parts else pd.Series(dtype=np.float64, name='value')
+
+
+def walk_forward(data_path, strategy, params_list, train, test, step=None, anchored=False, workers=None,
+                 start=None, end=None, sortby='roi', cache_root=None, cash=50000, ktype=bar_store.KTYPE_DAY,
+                 **run_kwargs):
+    '''Optimize ``strategy`` on each train window, trade the winner on the test window after it.
+
+    All the (fold, params) train runs go through one process pool, then the
+    winners (highest ``sortby``) run on their test windows in the same way.
+    Each worker loads the bars once and keeps one ``WindowCache``;
+    ``cache_root`` adds the ``.npz`` disk tier so the workers also share
+    the indicators between them. Returns the folds table, the stitched
+    out-of-sample equity curve, the net pnl of its trades and its
+    ``metrics.compute`` statistics with the bars per year of ``ktype``.
+    '''
+    index = bar_store.load_bars(data_path, start=start, end=end, ktype=ktype).index
+    n = len(index)
+    windows = folds(n, train, test, step, anchored)
+    if not windows:
+        raise ValueError('%d bars are not enough for a %d bar train and %d bar test window' % (n, train, test))
+
+    workers = workers or os.cpu_count()
+    run_kwargs['cash'] = cash
+    job = functools.partial(_run_window, strategy, run_kwargs)
+    train_jobs = [(i, lo, hi, params, False) for i, (lo, hi, _, _) in enumerate(windows) for params in params_list]
+    chunksize = max(1, len(train_jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(data_path, start, end, ktype, cache_root)) as pool:
+        trained = pd.DataFrame(list(pool.map(job, train_jobs, chunksize=chunksize)))
+        best = trained.sort_values(sortby, ascending=False, na_position='last').groupby('fold', sort=True).head(1)
+        best = best.sort_values('fold')
+        names = list(params_list[0]) if params_list else []
+        test_jobs = [(row.fold, windows[row.fold][2], windows[row.fold][3],
+                      dict((name, getattr(row, name)) for name in names), True)
+                     for row in best.itertuples(index=False)]
+        tested = list(pool.map(job, test_jobs))
+
+    rows = []
+    for (train_row, result) in zip(best.to_dict('records'), tested):
+        lo, hi, test_lo, test_hi = windows[result['fold']]
+        row = {'fold': result['fold'], 'train_start': index[lo], 'train_end': index[hi - 1],
+               'test_start': index[test_lo], 'test_end': index[test_hi - 1]}
+        row.update((name, train_row[name]) for name in names)
+        row['train_' + sortby] = train_row[sortby]
+        row.update(('test_' + key, result[key]) for key in ('roi', 'sharpe', 'sqn', 'trades'))
+        rows.append(row)
+
+    equity = stitch([result['equity'] for result in tested], cash)
+    pnlcomm = [pnl for result in tested for pnl in result['pnlcomm']]
+    stats = metrics.compute(equity, cash, pnlcomm, periods=metrics.periods_per_year(ktype))
+    return WalkForward(pd.DataFrame(rows), equity, pnlcomm, stats)
+
+
+def runwalkforward(args=None):
+    args = parse_args(args)
+    params_list = _search_params(args)
+
+    result = walk_forward(args.data, STRATEGIES[args.strategy], params_list, args.train, args.test,
+                          step=args.step, anchored=args.anchored, workers=args.workers,
+                          start=args.fromdate, end=args.todate, sortby=args.sortby, cache_root=args.cache_root,
+                          cash=args.cash, ktype=args.ktype, commission=args.commperc, perc=args.cashalloc)
+    print(result.folds.to_string(index=False))
+    for name, value in result.stats.items():
+        print('%s: %s' % (name, value))
+    if args.out:
+        result.folds.to_csv(args.out, index=False)
+    if args.report:
+        import report
+        report.render(result.equity, args.report, args.cash, result.pnlcomm, title='walk-forward %s' % args.data,
+                      periods=metrics.periods_per_year(args.ktype))
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Walk-forward optimization for KDJ_Strategy / TheStrategy')
+
+    parser.add_argument('--data', required=False, default='../data/kj_tx.xlsx',
+                        help='Futu kline xlsx export to run on')
+
+    parser.add_argument('--strategy', required=False, default='kdj',
+                        choices=STRATEGIES.keys(), help='Strategy to optimize')
+
+    parser.add_argument('--param', required=False, action='append',
+                        help=('Search space of a strategy param, repeatable. '
+                              'name=v1,v2,v3 for a list, name=low:high for a range '
+                              '(ranges need --random)'))
+
+    parser.add_argument('--random', required=False, type=int, default=0,
+                        help='Number of random draws instead of the full grid')
+
+    parser.add_argument('--seed', required=False, type=int, default=None,
+                        help='Seed of the random search')
+
+    parser.add_argument('--ktype', required=False, default=bar_store.KTYPE_DAY,
+                        help='Kline type of the export')
+
+    parser.add_argument('--fromdate', required=False, default=None,
+                        help='Starting date in YYYY-MM-DD format')
+
+    parser.add_argument('--todate', required=False, default=None,
+                        help='Ending date in YYYY-MM-DD format')
+
+    parser.add_argument('--train', required=False, type=int, default=500,
+                        help='Bars in each train window')
+
+    parser.add_argument('--test', required=False, type=int, default=125,
+                        help='Bars in each test window')
+
+    parser.add_argument('--step', required=False, type=int, default=None,
+                        help='Bars between two folds, defaults to --test')
+
+    parser.add_argument('--anchored', required=False, action='store_true',
+                        help='Start every train window at the first bar')
+
+    parser.add_argument('--workers', required=False, type=int, default=None,
+                        help='Worker processes, defaults to the cpu count')
+
+    parser.add_argument('--cache-root', required=False, default=None,
+                        help='Directory of .npz indicator files shared by the workers')
+
+    parser.add_argument('--cash', required=False, type=float, default=50000,
+                        help='Cash to start with')
+
+    parser.add_argument('--cashalloc', required=False, type=float, default=1,
+                        help='Perc (abs) of cash to allocate for ops')
+
+    parser.add_argument('--commperc', required=False, type=float, default=0.0003,
+                        help='Perc (abs) commision in each operation')
+
+    parser.add_argument('--sortby', required=False, default='roi',
+                        help='Train result column picking the params of each fold')
+
+    parser.add_argument('--out', required=False, default=None,
+                        help='Write the folds table to this csv')
+
+    parser.add_argument('--report', required=False, default=None,
+                        help='Write the out-of-sample report to this .png / .html')
+
+    if pargs is not None:
+        return parser.parse_args(pargs)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    runwalkforward()
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# 策略模块都是 src 下的平铺模块，和直接在 src 里运行时一样导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    '''A src/ + data/ tree, cwd in src so the ../data bar store lands in it'''
+    os.makedirs(str(tmp_path / 'src'))
+    os.makedirs(str(tmp_path / 'data'))
+    monkeypatch.chdir(str(tmp_path / 'src'))
+    return tmp_path
+
+
+@pytest.fixture
+def periods(monkeypatch):
+    '''``periods`` of every ``metrics.compute`` call'''
+    import metrics
+    calls = []
+    compute = metrics.compute
+
+    def recording(*args, **kwargs):
+        calls.append(kwargs.get('periods'))
+        return compute(*args, **kwargs)
+    monkeypatch.setattr(metrics, 'compute', recording)
+    return calls
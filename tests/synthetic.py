@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+
+def make_bars(n, seed=0, code='HK.00700', freq='B', start='2010-01-01'):
+    '''Random walk bars with the columns of a Futu kline export, datetime indexed.
+
+    Daily by default, ``freq`` is a pandas frequency for other ktypes.
+    '''
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n)))
+    index = pd.date_range(start, periods=n, freq=freq, name='datetime')
+    return pd.DataFrame({
+        'code': code, 'time_key': index.strftime('%Y-%m-%d %H:%M:%S'),
+        'open': open_, 'close': close, 'high': high, 'low': low,
+        'volume': rng.integers(1000, 10000, n), 'turnover': 1e6, 'last_close': np.roll(close, 1),
+    }, index=index)
+
+
+def write_export(path, bars):
+    '''Save ``bars`` as a Futu kline xlsx export'''
+    bars.to_excel(path, index=False)
+    return str(path)
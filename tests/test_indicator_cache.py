@@ -0,0 +1,89 @@
+import backtrader as bt
+import numpy as np
+import pytest
+
+from indicator_cache import IndicatorCache
+from kdj_strategy import KDJ_Strategy
+from macd_strategy import TheStrategy
+from my_indicator import kdj
+from my_sizer import FixedPerc
+from synthetic import make_bars
+from test_vector_backtest import CASH, COMMISSION, Fills
+
+
+def counting(compute):
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return compute(*args, **kwargs)
+    wrapper.calls = calls
+    return wrapper
+
+
+def test_memory_tier_counts_and_evicts():
+    bars = make_bars(500)
+    inputs = [bars[name].to_numpy() for name in ('high', 'low', 'close')]
+    other = [values[1:] for values in inputs]
+    cache = IndicatorCache(maxsize=1)
+    compute = counting(kdj)
+
+    first = cache.get('kdj', inputs, {}, compute)
+    assert cache.get('kdj', inputs, {}, compute) is first
+    assert (cache.hits, cache.misses, len(compute.calls)) == (1, 1, 1)
+    assert not first[0].flags.writeable
+
+    cache.get('kdj', inputs, {'period_signal': 5}, compute)
+    cache.get('kdj', other, {}, compute)
+    assert (cache.hits, cache.misses) == (1, 3)
+    # maxsize 1: the first entry was evicted and is computed again
+    cache.get('kdj', inputs, {}, compute)
+    assert (cache.hits, cache.misses, cache.disk_hits) == (1, 4, 0)
+
+
+def test_disk_tier(tmp_path):
+    bars = make_bars(500)
+    inputs = [bars[name].to_numpy() for name in ('high', 'low', 'close')]
+    expected = IndicatorCache(root=str(tmp_path)).get('kdj', inputs, {}, kdj)
+
+    cache = IndicatorCache(root=str(tmp_path))
+    compute = counting(kdj)
+    values = cache.get('kdj', inputs, {}, compute)
+    assert not compute.calls
+    assert (cache.hits, cache.disk_hits, cache.misses) == (1, 1, 0)
+    for value, expected_value in zip(values, expected):
+        np.testing.assert_array_equal(value, expected_value)
+
+    cache.get('kdj', inputs, {}, compute)
+    assert (cache.hits, cache.disk_hits, cache.misses) == (2, 1, 0)
+
+
+def run_cerebro(bars, strategy, runonce, cache):
+    cerebro = bt.Cerebro(runonce=runonce, cheat_on_open=True, stdstats=False)
+    cerebro.broker.set_cash(CASH)
+    cerebro.broker.addcommissioninfo(bt.commissions.CommInfo_Stocks_Perc(commission=COMMISSION, percabs=True))
+    cerebro.adddata(bt.feeds.PandasData(dataname=bars))
+    cerebro.addstrategy(strategy, indicator_cache=cache)
+    cerebro.addsizer(FixedPerc)
+    cerebro.addanalyzer(Fills, _name='fills')
+    strategy = cerebro.run()[0]
+    return strategy.analyzers.fills.fills, cerebro.broker.getvalue()
+
+
+@pytest.mark.parametrize('runonce', [True, False], ids=['runonce', 'next'])
+@pytest.mark.parametrize('strategy', [KDJ_Strategy, TheStrategy])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_cached_strategy_matches_uncached(seed, strategy, runonce):
+    bars = make_bars(1500, seed)
+    fills, value = run_cerebro(bars, strategy, runonce, None)
+    cache = IndicatorCache()
+    assert len(fills)
+    assert run_cerebro(bars, strategy, runonce, cache) == (fills, value)
+    hits, misses = cache.hits, cache.misses
+    assert run_cerebro(bars, strategy, runonce, cache) == (fills, value)
+    if runonce:
+        # the second run takes every indicator from memory
+        assert misses > 0 and cache.misses == misses
+        assert cache.hits == hits + misses + hits
+    else:
+        assert cache.hits == cache.misses == 0
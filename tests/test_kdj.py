@@ -0,0 +1,209 @@
+import backtrader as bt
+import numpy as np
+import pytest
+
+import my_indicator
+from synthetic import make_bars
+
+
+class BaselineSmoothing(bt.indicators.Average):
+    '''The pre-kernel ``CusExponentialSmoothing`` loop, with a ``next`` doing the same arithmetic'''
+    params = (('alpha', None), ('first_value', 0), ('period', 3))
+
+    def __init__(self):
+        self.alpha1 = 1.0 - self.p.alpha
+        super(BaselineSmoothing, self).__init__()
+
+    def nextstart(self):
+        # 和 once 一样：minperiod 那根留空，下一根才从 first_value 开始
+        self.prev = self.p.first_value
+
+    def next(self):
+        self.line[0] = self.prev = self.prev * self.alpha1 + self.data[0] * self.p.alpha
+
+    def oncestart(self, start, end):
+        pass
+
+    def once(self, start, end):
+        darray = self.data.array
+        larray = self.line.array
+        prev = self.p.first_value
+        for i in range(start, end):
+            larray[i] = prev = prev * self.alpha1 + darray[i] * self.p.alpha
+
+
+class BaselineKDJ(bt.Indicator):
+    '''KDJ built from the backtrader Highest/Lowest/DivByZero lines, as before the kernels'''
+    lines = ('RSV', 'K', 'D', 'J',)
+    params = (('period_me1', 3), ('period_me2', 3), ('period_signal', 9),)
+
+    def __init__(self):
+        high = bt.indicators.Highest(self.data.high, period=self.p.period_signal)
+        low = bt.indicators.Lowest(self.data.low, period=self.p.period_signal)
+        self.l.RSV = 100 * bt.DivByZero(self.data.close - low, high - low, zero=float('nan'))
+        self.l.K = BaselineSmoothing(self.l.RSV, period=self.p.period_me1, alpha=1 / 3, first_value=66.464)
+        self.l.D = BaselineSmoothing(self.l.K, period=self.p.period_me2, alpha=1 / 3, first_value=69.635)
+        self.l.J = 3 * self.l.K - 2 * self.l.D
+
+
+class BothKDJ(bt.Strategy):
+    def __init__(self):
+        self.baseline = BaselineKDJ(self.data)
+        self.kernel = my_indicator.KDJ(self.data)
+
+    def stop(self):
+        self.result = [(np.array(a.array), np.array(b.array))
+                       for a, b in zip(self.baseline.lines, self.kernel.lines)]
+
+
+@pytest.mark.parametrize('runonce', [True, False], ids=['runonce', 'next'])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_kernel_kdj_matches_baseline(seed, runonce):
+    cerebro = bt.Cerebro(runonce=runonce, stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(dataname=make_bars(3000, seed)))
+    cerebro.addstrategy(BothKDJ)
+    strategy = cerebro.run()[0]
+
+    for name, (baseline, kernel) in zip(BaselineKDJ.lines.getlinealiases(), strategy.result):
+        assert len(baseline) == len(kernel) == 3000
+        np.testing.assert_allclose(kernel, baseline, rtol=1e-12, atol=1e-9, equal_nan=True, err_msg=name)
+
+
+class BaselinePinNine(bt.indicators.PeriodN):
+    '''The pre-kernel ``PinNine.once`` loop, counter started at 0'''
+    params = (('cond', 'up'), ('period', 3))
+    lines = ('nine',)
+
+    def oncestart(self, start, end):
+        pass
+
+    def once(self, start, end):
+        darray = self.data.array
+        larray = self.line.array
+        flag_i = 0
+        for i in range(start, end):
+            now_c = darray[i]
+            if i <= 4:
+                larray[i] = 0
+            else:
+                ref_c = darray[i - 4]
+                my_cond = now_c > ref_c if self.p.cond == 'up' else now_c < ref_c
+                if my_cond:
+                    if flag_i <= 8:
+                        flag_i += 1
+                    elif flag_i == 9:
+                        flag_i = 1
+                else:
+                    flag_i = 0
+                larray[i] = flag_i if 5 <= flag_i <= 9 else 0
+
+
+class BaselineOnceSmoothing(BaselineSmoothing):
+    '''``BaselineSmoothing`` with the ``first_value=None`` seed of ``CusExponentialSmoothing.once``'''
+
+    def once(self, start, end):
+        darray = self.data.array
+        larray = self.line.array
+        prev = self.p.first_value
+        if prev is None:
+            prev = larray[start - 1]
+        for i in range(start, end):
+            larray[i] = prev = prev * self.alpha1 + darray[i] * self.p.alpha
+
+
+class BothOnce(bt.Strategy):
+    params = (('pairs', ()),)
+
+    def __init__(self):
+        self.pairs = [(baseline(self.data.close, **kwargs), kernel(self.data.close, **kwargs))
+                      for baseline, kernel, kwargs in self.p.pairs]
+
+    def stop(self):
+        self.result = [(np.array(a.array), np.array(b.array)) for a, b in self.pairs]
+
+
+@pytest.fixture(params=[True, False], ids=['numba', 'python'])
+def has_numba(request, monkeypatch):
+    import my_kernel
+    if request.param and not my_kernel.HAS_NUMBA:
+        pytest.skip('numba is not installed')
+    monkeypatch.setattr(my_kernel, 'HAS_NUMBA', request.param)
+    return request.param
+
+
+def run_once_pairs(seed, pairs):
+    cerebro = bt.Cerebro(runonce=True, stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(dataname=make_bars(3000, seed)))
+    cerebro.addstrategy(BothOnce, pairs=pairs)
+    return cerebro.run()[0].result
+
+
+@pytest.mark.parametrize('cond', ['up', 'down'])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_pin_nine_matches_baseline(has_numba, seed, cond):
+    pairs = [(BaselinePinNine, my_indicator.PinNine, {'cond': cond})]
+    (baseline, kernel), = run_once_pairs(seed, pairs)
+    assert np.nanmax(kernel) == 9
+    np.testing.assert_array_equal(kernel, baseline)
+
+
+class SeededSmoothing(my_indicator.CusExponentialSmoothing):
+    '''SMA seed written by ``oncestart``, the value ``first_value=None`` starts from'''
+
+    def oncestart(self, start, end):
+        bt.indicators.Average.once(self, start, end)
+
+
+class SeededBaselineSmoothing(BaselineOnceSmoothing):
+    def oncestart(self, start, end):
+        bt.indicators.Average.once(self, start, end)
+
+
+@pytest.mark.parametrize('first_value', [0, 66.464])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_exp_smoothing_matches_baseline(has_numba, seed, first_value):
+    kwargs = {'period': 3, 'alpha': 1 / 3, 'first_value': first_value}
+    pairs = [(BaselineOnceSmoothing, my_indicator.CusExponentialSmoothing, kwargs)]
+    (baseline, kernel), = run_once_pairs(seed, pairs)
+    assert not np.isnan(kernel[3:]).any()
+    np.testing.assert_array_equal(kernel, baseline)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_exp_smoothing_seeded_from_line(has_numba, seed):
+    kwargs = {'period': 5, 'alpha': 0.2, 'first_value': None}
+    pairs = [(SeededBaselineSmoothing, SeededSmoothing, kwargs)]
+    (baseline, kernel), = run_once_pairs(seed, pairs)
+    assert not np.isnan(kernel[4:]).any()
+    np.testing.assert_array_equal(kernel, baseline)
+
+
+class BothExtremes(bt.Strategy):
+    params = (('period', 9),)
+
+    def __init__(self):
+        period = self.p.period
+        self.pairs = [
+            (bt.indicators.Highest(self.data.high, period=period),
+             my_indicator.RollingExtremum(self.data.high, period=period)),
+            (bt.indicators.Lowest(self.data.low, period=period),
+             my_indicator.RollingExtremum(self.data.low, period=period, highest=False)),
+        ]
+
+    def stop(self):
+        self.result = [(np.array(a.array), np.array(b.array)) for a, b in self.pairs]
+
+
+@pytest.mark.parametrize('runonce', [True, False], ids=['runonce', 'next'])
+@pytest.mark.parametrize('period', [1, 9, 30])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_rolling_extremum_matches_highest_lowest(seed, period, runonce):
+    cerebro = bt.Cerebro(runonce=runonce, stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(dataname=make_bars(2000, seed)))
+    cerebro.addstrategy(BothExtremes, period=period)
+    strategy = cerebro.run()[0]
+
+    for baseline, extremum in strategy.result:
+        assert len(extremum) == 2000
+        assert not np.isnan(extremum[period - 1:]).any()
+        np.testing.assert_array_equal(extremum, baseline)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import vector_backtest
+from fake_futu import FakeCurKlineHandlerBase, FakeOpenD
+from live_signals import BUY, SELL, LiveSignalEngine
+from my_indicator import kdj
+from quote_client import QuoteClient
+from synthetic import make_bars
+
+CODE = 'HK.00700'
+
+
+class RecordingEngine(LiveSignalEngine):
+    '''Keeps K/D/J of every closed bar'''
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingEngine, self).__init__(*args, **kwargs)
+        self.kdj = []
+
+    def _close_bar(self, state):
+        super(RecordingEngine, self)._close_bar(state)
+        self.kdj.append((state.K, state.D, state.J))
+
+
+def replay(bars, updates):
+    server = FakeOpenD()
+    signals = []
+    engine = RecordingEngine(on_signal=signals.append)
+    with QuoteClient(context_factory=server.quote_context) as client:
+        engine.subscribe(client, [CODE], 'K_DAY', handler_base=FakeCurKlineHandlerBase)
+        server.replay(CODE, 'K_DAY', bars, updates=updates)
+        engine.flush()
+    return engine, signals
+
+
+@pytest.mark.parametrize('updates', [2, 4])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_replay_matches_backtest(seed, updates):
+    bars = make_bars(1200, seed, code=CODE)
+    engine, signals = replay(bars, updates)
+
+    _, k, d, j = kdj(bars['high'], bars['low'], bars['close'])
+    np.testing.assert_allclose(np.array(engine.kdj), np.column_stack([k, d, j]),
+                               rtol=1e-12, atol=1e-9, equal_nan=True)
+
+    # perc 0.5 leaves room for any gap at the open, no order is rejected for margin
+    trades, _, _ = vector_backtest.backtest_kdj(bars, perc=0.5)
+    expected = []
+    for trade in trades.itertuples(index=False):
+        expected.append((trade.entry_dt, BUY, trade.entry_price))
+        expected.append((trade.exit_dt, SELL, trade.exit_price))
+    orders = [(signal.time_key, signal.side, signal.price) for signal in signals if signal.kind == 'order']
+    assert len(expected)
+    # a last buy without its sell is not a closed trade
+    assert len(orders) - len(expected) in (0, 1)
+    assert all(side == BUY for _, side, _ in orders[len(expected):])
+    for (time_key, side, price), (dt, side_v, price_v) in zip(orders, expected):
+        assert (time_key, side) == (dt.strftime('%Y-%m-%d %H:%M:%S'), side_v)
+        assert price == price_v
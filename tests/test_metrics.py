@@ -0,0 +1,62 @@
+import backtrader as bt
+import pytest
+
+import metrics
+from kdj_strategy import KDJ_Strategy
+from my_sizer import FixedPerc
+from synthetic import make_bars
+from test_vector_backtest import CASH, COMMISSION
+
+
+def run_analyzers(bars, benchmark):
+    cerebro = bt.Cerebro(cheat_on_open=True, stdstats=False)
+    cerebro.broker.set_cash(CASH)
+    cerebro.broker.addcommissioninfo(bt.commissions.CommInfo_Stocks_Perc(commission=COMMISSION, percabs=True))
+    cerebro.adddata(bt.feeds.PandasData(dataname=bars))
+    bench = bt.feeds.PandasData(dataname=benchmark)
+    cerebro.adddata(bench)
+    cerebro.addstrategy(KDJ_Strategy)
+    cerebro.addsizer(FixedPerc)
+    cerebro.addanalyzer(metrics.EquityRecorder, _name='equity')
+    cerebro.addanalyzer(bt.analyzers.TimeReturn, _name='alltime_roi', timeframe=bt.TimeFrame.NoTimeFrame)
+    cerebro.addanalyzer(bt.analyzers.TimeReturn, data=bench, _name='benchmark', timeframe=bt.TimeFrame.NoTimeFrame)
+    cerebro.addanalyzer(bt.analyzers.TimeReturn, _name='years', timeframe=bt.TimeFrame.Years)
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, timeframe=bt.TimeFrame.Years, riskfreerate=0.01)
+    cerebro.addanalyzer(bt.analyzers.SQN)
+    cerebro.addanalyzer(bt.analyzers.DrawDown)
+    return cerebro.run()[0].analyzers
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_compute_matches_the_analyzers(seed):
+    bars = make_bars(2000, seed)
+    benchmark = make_bars(2000, seed + 100, code='HK.800000')
+    analyzers = run_analyzers(bars, benchmark)
+    equity = analyzers.equity
+    stats = metrics.compute(equity.equity(), equity.cash, equity.pnlcomm, benchmark)
+
+    assert stats['roi'] == pytest.approx(next(iter(analyzers.alltime_roi.get_analysis().values())), rel=1e-12)
+    assert stats['benchmark_roi'] == pytest.approx(
+        next(iter(analyzers.benchmark.get_analysis().values())), rel=1e-12)
+    years = analyzers.years.get_analysis()
+    assert list(stats['annual_returns']) == [str(dt.year) for dt in years]
+    assert list(stats['annual_returns'].values()) == pytest.approx(list(years.values()), rel=1e-9, abs=1e-12)
+    assert stats['sharpe'] == pytest.approx(analyzers.sharperatio.get_analysis()['sharperatio'], rel=1e-9)
+    sqn = analyzers.sqn.get_analysis()
+    assert stats['trades'] == sqn['trades'] > 1
+    assert stats['sqn'] == pytest.approx(sqn['sqn'], rel=1e-9)
+    drawdown = analyzers.drawdown.get_analysis()
+    assert stats['max_drawdown'] == pytest.approx(drawdown['max']['drawdown'], rel=1e-9)
+    assert stats['max_drawdown_len'] == drawdown['max']['len']
+
+
+def test_periods_scale_sortino_and_cagr():
+    equity = make_bars(500)['close'] * 10
+    cash = float(equity.iloc[0])
+    day = metrics.compute(equity, cash)
+    week = metrics.compute(equity, cash, periods=metrics.periods_per_year('K_WEEK'))
+    assert day['roi'] == week['roi']
+    assert week['cagr'] == pytest.approx((1 + day['roi']) ** (52 / 500.0) - 1)
+    assert week['sortino'] == pytest.approx(day['sortino'] * (52 / 252.0) ** 0.5)
+    with pytest.raises(ValueError):
+        metrics.periods_per_year('K_5M')
@@ -0,0 +1,22 @@
+import pytest
+
+import param_sweep
+import walk_forward
+
+
+def test_grid_and_random_search():
+    args = param_sweep.parse_args(['--param', 'macd1=8,12', '--param', 'macd2=26,30'])
+    assert param_sweep._search_params(args) == [
+        {'macd1': 8, 'macd2': 26}, {'macd1': 8, 'macd2': 30},
+        {'macd1': 12, 'macd2': 26}, {'macd1': 12, 'macd2': 30}]
+
+    args = param_sweep.parse_args(['--param', 'macd1=8:12', '--random', '5', '--seed', '1'])
+    params_list = param_sweep._search_params(args)
+    assert len(params_list) == 5
+    assert all(8 <= params['macd1'] <= 12 for params in params_list)
+
+
+@pytest.mark.parametrize('run', [param_sweep.runsweep, walk_forward.runwalkforward])
+def test_range_without_random_is_rejected(run):
+    with pytest.raises(ValueError, match='--random'):
+        run(['--param', 'macd1=8:12', '--param', 'macd2=26,30'])
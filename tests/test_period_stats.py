@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import futu_util
+from period_stats import period_key, period_stats
+from synthetic import make_bars
+
+
+def old_get_month_std(stock):
+    '''futu_util.get_month_std before period_stats'''
+    stock['date_ym'] = stock['time_key'].map(lambda x: x.split('-')[0] + '-' + x.split('-')[1])
+    stock['month_std'] = stock.groupby('date_ym')['close'].transform(np.std)
+    stock['month_mean'] = stock.groupby('date_ym')['close'].transform(np.mean)
+    stock['month_cv'] = stock['month_std'] / stock['month_mean']
+    return stock[['code', 'date_ym', 'month_mean', 'month_std', 'month_cv']].drop_duplicates().reset_index().drop(
+        'index', axis=1)
+
+
+def reference(bars, keys, ddof=0):
+    '''mean/std/cv per code and key, one group at a time'''
+    rows = []
+    for (code, key), close in bars.groupby([bars['code'], keys], sort=False)['close']:
+        std = np.std(close.to_numpy(), ddof=ddof) if len(close) > ddof else np.nan
+        rows.append((code, key, close.mean(), std, std / close.mean()))
+    return pd.DataFrame(rows, columns=['code', 'key', 'mean', 'std', 'cv'])
+
+
+def assert_stats(stats, expected):
+    assert stats['code'].tolist() == expected['code'].tolist()
+    for name in ('mean', 'std', 'cv'):
+        np.testing.assert_allclose(stats[name], expected[name], rtol=1e-12, equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_get_month_std_matches_the_old_one(seed):
+    bars = make_bars(1000, seed).reset_index(drop=True)
+    expected = old_get_month_std(bars.copy())
+    pd.testing.assert_frame_equal(futu_util.get_month_std(bars.copy()), expected, check_dtype=False, rtol=1e-12)
+
+
+def test_week_keys():
+    bars = make_bars(300, freq='D')
+    stats = period_stats(bars, 'week')
+    # W-SUN weeks run Monday to Sunday, like the ISO calendar
+    iso = bars.index.isocalendar()
+    expected = reference(bars, (iso['year'] * 100 + iso['week']).to_numpy())
+    assert_stats(stats, expected)
+    # 2010-01-01 is a Friday
+    assert stats['period'].iloc[0] == '2009-12-28/2010-01-03'
+    assert stats['period'].iloc[1] == '2010-01-04/2010-01-10'
+
+
+def test_quarter_keys():
+    bars = make_bars(600)
+    stats = period_stats(bars, 'quarter')
+    expected = reference(bars, (bars.index.year * 10 + (bars.index.month - 1) // 3 + 1).to_numpy())
+    assert_stats(stats, expected)
+    assert stats['period'].tolist()[:5] == ['2010Q1', '2010Q2', '2010Q3', '2010Q4', '2011Q1']
+
+
+def test_codes_are_grouped_apart():
+    first = make_bars(400, 0, code='HK.00700')
+    second = make_bars(400, 1, code='HK.00005')
+    # interleaved bars, as a bar store query over many codes returns them
+    bars = pd.concat([first, second]).sort_index(kind='stable').reset_index(drop=True)
+    stats = period_stats(bars, 'month')
+    assert stats[['code', 'period']].drop_duplicates().shape[0] == len(stats)
+    for code, frame in (('HK.00700', first), ('HK.00005', second)):
+        alone = period_stats(frame.reset_index(drop=True), 'month')
+        mine = stats[stats['code'] == code].reset_index(drop=True)
+        assert mine['period'].tolist() == alone['period'].tolist()
+        assert_stats(mine, alone)
+
+
+@pytest.mark.parametrize('ddof', [0, 1])
+def test_ddof_with_single_bar_periods(ddof):
+    bars = make_bars(6)
+    # one bar in January, the others in February
+    bars.index = pd.DatetimeIndex(['2010-01-29', '2010-02-01', '2010-02-02', '2010-02-03', '2010-02-04',
+                                   '2010-02-05'], name='datetime')
+    bars['time_key'] = bars.index.strftime('%Y-%m-%d %H:%M:%S')
+    stats = period_stats(bars, 'month', ddof=ddof)
+    assert stats['period'].tolist() == ['2010-01', '2010-02']
+    if ddof == 0:
+        assert stats['std'].iloc[0] == 0.0 and stats['cv'].iloc[0] == 0.0
+    else:
+        assert np.isnan(stats['std'].iloc[0]) and np.isnan(stats['cv'].iloc[0])
+    assert stats['std'].iloc[1] == pytest.approx(np.std(bars['close'].iloc[1:].to_numpy(), ddof=ddof), rel=1e-12)
+
+
+def test_keys_from_the_index_or_time_key():
+    bars = make_bars(100)
+    from_index = period_key(bars.index, 'month')
+    from_strings = period_key(bars['time_key'], 'month')
+    assert (from_index == from_strings).all()
+    assert period_stats(bars.drop(columns='time_key'), 'month').equals(period_stats(bars, 'month'))
+    with pytest.raises(ValueError):
+        period_key(bars.index, 'day')
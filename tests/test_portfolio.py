@@ -0,0 +1,53 @@
+import backtrader as bt
+import numpy as np
+import pytest
+
+import portfolio
+from kdj_strategy import KDJ_Strategy
+from my_sizer import CashSplit, FixedPerc
+from portfolio_strategy import PortfolioKDJ
+from synthetic import make_bars
+
+CASH = 1e8  # 足够多的现金，各代码的买入互不影响
+
+
+class Fills(bt.Analyzer):
+    def start(self):
+        self.fills = []
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.fills.append((order.data._name, order.data.datetime.datetime(0), order.isbuy(),
+                               order.executed.price))
+
+
+def run(frames, strategy, sizer, **kwargs):
+    cerebro = bt.Cerebro(cheat_on_open=True, stdstats=False)
+    cerebro.broker.set_cash(CASH)
+    for name, frame in frames.items():
+        cerebro.adddata(bt.feeds.PandasData(dataname=frame), name=name)
+    cerebro.addstrategy(strategy, **kwargs)
+    cerebro.addsizer(sizer, perc=0.3)
+    cerebro.addanalyzer(Fills, _name='fills')
+    return cerebro.run()[0].analyzers.fills.fills
+
+
+def test_halted_bars_trade_like_the_code_alone():
+    rng = np.random.default_rng(5)
+    a = make_bars(1500, 0, 'A')
+    a = a[rng.random(len(a)) > 0.02]
+    b = make_bars(1500, 1, 'B').iloc[200:]  # 晚上市，再加随机停牌
+    b = b[rng.random(len(b)) > 0.05]
+    frames = {'A': a, 'B': b}
+
+    aligned, halted = portfolio.align(frames)
+    assert np.isnan(aligned['B']['close'].iloc[0])
+    assert np.isnan(aligned['B']['open'].to_numpy()[halted['B']]).all()
+    fills = run(aligned, PortfolioKDJ, CashSplit, halted=halted)
+
+    for name, frame in frames.items():
+        alone = run({name: frame}, KDJ_Strategy, FixedPerc, printlog=False)
+        mine = [fill for fill in fills if fill[0] == name]
+        assert len(alone)
+        assert [fill[:3] for fill in mine] == [fill[:3] for fill in alone]
+        assert [fill[3] for fill in mine] == pytest.approx([fill[3] for fill in alone], rel=1e-12)
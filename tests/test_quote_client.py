@@ -0,0 +1,100 @@
+import pytest
+
+import quote_client
+from fake_futu import RET_ERROR, FakeOpenD
+from quote_client import QuoteClient
+from synthetic import make_bars
+
+futu_util = pytest.importorskip('futu_util')
+
+CODE = 'HK.00700'
+
+
+@pytest.fixture
+def server():
+    server = FakeOpenD(trading_days=['2020-04-01', '2020-04-02'])
+    server.add_bars(CODE, 'K_DAY', make_bars(120, code=CODE).reset_index(drop=True))
+    return server
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    client = QuoteClient(context_factory=server.quote_context)
+    monkeypatch.setattr(quote_client, '_client', None)
+    quote_client.set_client(client)
+    yield client
+    client.close()
+
+
+def test_connects_lazily(server, client):
+    assert server.connections == client.connects == 0
+    assert not client.is_healthy()
+    ctx = client.context
+    assert client.context is ctx
+    assert server.connections == client.connects == 1
+    assert client.is_healthy()
+
+
+def test_futu_util_calls_share_one_connection(server, client):
+    futu_util.is_trade_today()
+    futu_util.get_stock_info('HK', 'STOCK')
+    data = futu_util.get_stock_k_line(CODE, None, None, 'K_DAY')
+    assert len(data) == 120
+    # 120 bars in pages of 50
+    assert server.requests['request_history_kline'] == 3
+    assert server.connections == 1
+
+
+def test_reconnects_after_opend_drops(server, client):
+    first = client.context
+    server.drop_connections()
+    assert not client.is_healthy()
+    ret, days = client.call('request_trading_days', start='2020-04-01', end='2020-04-02')
+    assert ret == quote_client.RET_OK and len(days) == 2
+    assert client.context is not first and not first.alive
+    assert server.connections == 2
+
+    # a failing request on a healthy connection is not retried
+    ret, _, _ = client.call('request_history_kline', 'HK.99999')
+    assert ret != quote_client.RET_OK
+    assert server.connections == 2
+
+
+def test_process_client_closes_at_exit(server, monkeypatch):
+    registered = []
+    monkeypatch.setattr(quote_client.atexit, 'register', registered.append)
+    monkeypatch.setattr(quote_client, '_client', None)
+    client = quote_client.get_client()
+    assert quote_client.get_client() is client
+    assert registered == [client.close]
+
+    client.context_factory = server.quote_context
+    ctx = client.context
+    registered[0]()
+    assert not ctx.alive
+    assert client._ctx is None
+
+
+class FailingPage(object):
+    '''Quote context failing ``request_history_kline`` from the ``fail_at``-th page on'''
+
+    def __init__(self, ctx, fail_at):
+        self.ctx = ctx
+        self.fail_at = fail_at
+        self.pages = 0
+
+    def __getattr__(self, name):
+        return getattr(self.ctx, name)
+
+    def request_history_kline(self, *args, **kwargs):
+        self.pages += 1
+        if self.pages > self.fail_at:
+            return RET_ERROR, 'too many requests', None
+        return self.ctx.request_history_kline(*args, **kwargs)
+
+
+@pytest.mark.parametrize('fail_at', [0, 1])
+def test_failed_page_raises(server, client, fail_at):
+    client.context_factory = lambda **kwargs: FailingPage(server.quote_context(**kwargs), fail_at)
+    with pytest.raises(IOError, match='too many requests'):
+        futu_util.get_stock_k_line(CODE, None, None, 'K_DAY')
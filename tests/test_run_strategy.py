@@ -0,0 +1,37 @@
+import os
+
+import pandas as pd
+import pytest
+
+import metrics
+from run_strategy import runstrat
+from synthetic import make_bars, write_export
+
+
+@pytest.mark.parametrize('ktype, freq', [('K_DAY', 'B'), ('K_WEEK', 'W-FRI'), ('K_MON', 'ME')])
+def test_light_and_report_stats_use_the_ktype_periods(workdir, periods, ktype, freq):
+    path = write_export(workdir / 'data' / 'bars.xlsx', make_bars(400, freq=freq))
+    runstrat(path, 50000, light=True, ktype=ktype, is_plot=False)
+    runstrat(path, 50000, ktype=ktype, is_plot=True, plot_out=str(workdir / 'report.png'),
+             plot_start=None, plot_end=None)
+    assert periods == [metrics.periods_per_year(ktype)] * 2
+    assert os.path.exists(str(workdir / 'report.png'))
+
+
+@pytest.mark.parametrize('ktype, n, freq, start, timeframes', [
+    ('K_WEEK', 1000, 'W-FRI', '2010-01-01', ()),
+    ('K_WEEK', 1000, 'W-FRI', '2010-01-01', ('K_MON',)),
+    ('K_1M', 3000, 'min', '2010-01-04 09:30:30', ()),
+    ('K_1M', 3000, 'min', '2010-01-04 09:30:30', ('K_60M',)),
+])
+def test_daily_benchmark_leaves_the_trades_alone(workdir, ktype, n, freq, start, timeframes):
+    # the daily benchmark ticks between the bars of data0 and is no confirmation input
+    path = write_export(workdir / 'data' / 'bars.xlsx', make_bars(n, freq=freq, start=start))
+    benchmark = write_export(workdir / 'data' / 'benchmark.xlsx', make_bars(6000, 5, code='HK.800000'))
+    without = str(workdir / 'without.csv')
+    runstrat(path, 50000, ktype=ktype, timeframes=timeframes, trade_log=without, is_plot=False)
+    bench = str(workdir / 'bench.csv')
+    runstrat(path, 50000, benchmark, ktype=ktype, timeframes=timeframes, trade_log=bench, is_plot=False)
+    trades = pd.read_csv(without)
+    assert len(trades)
+    assert pd.read_csv(bench).equals(trades)
@@ -0,0 +1,71 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import backtrader as bt
+import pytest
+
+from kdj_strategy import KDJ_Strategy
+from macd_strategy import TheStrategy
+from param_sweep import run_once
+from shared_feed import SharedBars, SharedPandasData
+from synthetic import make_bars
+
+ROWS = 50000
+
+
+@pytest.mark.parametrize('strategy', [KDJ_Strategy, TheStrategy])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_shared_feed_matches_pandas_data(seed, strategy):
+    bars = make_bars(3000, seed)
+    expected = run_once(bars, strategy, {}, equity=True)
+    with SharedBars.create(bars) as shared:
+        result = run_once(shared, strategy, {}, equity=True)
+    assert expected['trades']
+    for name in ('roi', 'sharpe', 'sqn', 'trades'):
+        assert result[name] == expected[name]
+    assert result['equity'].equals(expected['equity'])
+
+
+def rss_anon():
+    '''Resident private (anonymous) memory of this process in bytes, None off Linux'''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+def private_growth(descriptor, shared=True):
+    '''Private memory a preloaded run over the block adds to the worker'''
+    bars = None
+    if shared:
+        data = SharedPandasData(shared=descriptor)
+    else:
+        bars = SharedBars.attach(descriptor)
+        data = bt.feeds.PandasData(dataname=bars.frame().copy())
+    before = rss_anon()
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(data)
+    cerebro.addstrategy(bt.Strategy)
+    cerebro.run()
+    growth = rss_anon() - before
+    if bars is not None:
+        del data, cerebro
+        bars.close()
+    return growth
+
+
+@pytest.mark.skipif(rss_anon() is None, reason='needs /proc/self/status')
+def test_worker_memory_stays_flat_with_more_workers():
+    line_buffers = 7 * 8 * ROWS  # what preloading PandasData keeps in every process
+    # spawn: a forked worker could reuse heap freed by earlier tests and hide the growth
+    context = multiprocessing.get_context('spawn')
+    with SharedBars.create(make_bars(ROWS)) as shared:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            assert pool.submit(private_growth, shared.descriptor, False).result() > line_buffers / 2
+        for workers in (1, 2, 4):
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                growth = list(pool.map(private_growth, [shared.descriptor] * workers))
+            assert max(growth) < line_buffers / 4, (workers, growth)
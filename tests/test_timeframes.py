@@ -0,0 +1,75 @@
+import backtrader as bt
+import pytest
+
+import bar_store
+from kdj_strategy import KDJ_Strategy
+from my_sizer import FixedPerc
+from synthetic import make_bars
+from test_vector_backtest import CASH, COMMISSION, Fills
+
+
+def run_with(datas, **kwargs):
+    cerebro = bt.Cerebro(cheat_on_open=True, stdstats=False)
+    cerebro.broker.set_cash(CASH)
+    cerebro.broker.addcommissioninfo(bt.commissions.CommInfo_Stocks_Perc(commission=COMMISSION, percabs=True))
+    for data in datas:
+        cerebro.adddata(data, name=data.p.name)
+    cerebro.addstrategy(KDJ_Strategy, **kwargs)
+    cerebro.addsizer(FixedPerc)
+    cerebro.addanalyzer(Fills, _name='fills')
+    strategy = cerebro.run()[0]
+    return strategy.analyzers.fills.fills, cerebro.broker.getvalue()
+
+
+HIGHER = (bar_store.KTYPE_WEEK, bar_store.KTYPE_MON)
+
+
+def higher_datas(bars):
+    return [bt.feeds.PandasData(dataname=bar_store.resample_bars(bars, bar_store.KTYPE_WEEK),
+                                timeframe=bt.TimeFrame.Weeks, name=bar_store.KTYPE_WEEK),
+            bt.feeds.PandasData(dataname=bar_store.resample_bars(bars, bar_store.KTYPE_MON),
+                                timeframe=bt.TimeFrame.Months, name=bar_store.KTYPE_MON)]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_unconfirmed_higher_timeframes_keep_single_timeframe_trades(seed):
+    bars = make_bars(3000, seed)
+    single = run_with([bt.feeds.PandasData(dataname=bars)])
+    multi = run_with([bt.feeds.PandasData(dataname=bars)] + higher_datas(bars), timeframes=HIGHER,
+                     confirm=False)
+    assert len(single[0])
+    assert multi == single
+
+
+def test_confirm_filters_buys():
+    bars = make_bars(3000, 0)
+    single, _ = run_with([bt.feeds.PandasData(dataname=bars)])
+    confirmed, _ = run_with([bt.feeds.PandasData(dataname=bars)] + higher_datas(bars), timeframes=HIGHER)
+    assert sum(isbuy for _, isbuy, _, _ in confirmed) < sum(isbuy for _, isbuy, _, _ in single)
+
+
+def test_lower_timeframe_data_is_rejected():
+    bars = make_bars(300, 0)
+    lower = bt.feeds.PandasData(dataname=bars, timeframe=bt.TimeFrame.Minutes, compression=60,
+                                name=bar_store.KTYPE_60M)
+    with pytest.raises(ValueError):
+        run_with([bt.feeds.PandasData(dataname=bars), lower], timeframes=(bar_store.KTYPE_60M,))
+
+
+def test_other_datas_are_not_confirmation_inputs():
+    bars = make_bars(3000, 0, freq='min', start='2010-01-04 09:30:30')
+    minutes = dict(timeframe=bt.TimeFrame.Minutes, compression=1)
+    # a daily benchmark is a higher timeframe than minute bars, but not one to confirm with
+    benchmark = bt.feeds.PandasData(dataname=make_bars(10, 5, code='HK.800000', start='2010-01-04'))
+    single = run_with([bt.feeds.PandasData(dataname=bars, **minutes)])
+    with_benchmark = run_with([bt.feeds.PandasData(dataname=bars, **minutes), benchmark])
+    assert sum(isbuy for _, isbuy, _, _ in single[0])
+    assert with_benchmark == single
+
+
+def test_resample_needs_a_higher_timeframe():
+    bar_store.check_higher(bar_store.KTYPE_60M, bar_store.KTYPE_1M)
+    with pytest.raises(ValueError):
+        bar_store.check_higher(bar_store.KTYPE_60M, bar_store.KTYPE_DAY)
+    with pytest.raises(ValueError):
+        bar_store.check_higher(bar_store.KTYPE_DAY, bar_store.KTYPE_DAY)
@@ -0,0 +1,89 @@
+import time
+
+import pandas as pd
+import pytest
+
+from fake_futu import FakeOpenD, FakeTradeOrderHandlerBase, FakeTradeServer
+from live_signals import BUY, SELL, Signal
+from quote_client import QuoteClient
+from trade_executor import PHASES, LatencyHistogram, TradeExecutor
+
+STOCK_INFO = pd.DataFrame({'code': ['HK.00700', 'HK.00005'], 'name': ['TENCENT', 'HSBC'], 'lot_size': [100, 400]})
+
+
+def signal(code, time_key, side, price):
+    return Signal(code, 'K_DAY', time_key, 'order', side, price, time.perf_counter())
+
+
+@pytest.fixture
+def opend():
+    return FakeOpenD(stock_info=STOCK_INFO)
+
+
+def executor_for(server, opend, **kwargs):
+    return TradeExecutor(context_factory=server.trade_context, handler_base=FakeTradeOrderHandlerBase,
+                         quote_client=QuoteClient(context_factory=opend.quote_context), **kwargs)
+
+
+def test_percentile_is_capped_at_the_max():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None
+    for seconds in [0.001] * 5 + [0.006] * 5:
+        histogram.record(seconds)
+    assert histogram.percentile(50) <= 0.001 * 10 ** 0.25
+    assert histogram.percentile(90) == histogram.percentile(99) == histogram.max == 0.006
+    summary = histogram.summary()
+    assert summary['count'] == 10 and summary['mean'] == pytest.approx(0.0035)
+
+
+def test_buys_in_whole_lots_and_sells_the_broker_position(opend):
+    server = FakeTradeServer(cash=100000.0)
+    server.positions['HK.00005'] = 1200  # bought outside the executor
+    with executor_for(server, opend, perc=0.5) as executor:
+        executor.submit(signal('HK.00700', '2020-04-01 00:00:00', BUY, 10.0))
+        assert executor.wait(5)
+        executor.submit(signal('HK.00700', '2020-04-02 00:00:00', BUY, 30.0))
+        executor.submit(signal('HK.00700', '2020-04-02 00:00:00', BUY, 30.0))  # same signal again
+        executor.submit(signal('HK.00005', '2020-04-02 00:00:00', SELL, 40.0))
+        assert executor.wait(5)
+        executor.submit(signal('HK.00700', '2020-04-03 00:00:00', SELL, 12.0))
+        assert executor.wait(5)
+
+    orders = executor.orders()
+    # 0.5 * 100000 // (10 * 100) = 50 lots, then 0.5 * 50000 // (30 * 100) = 8 lots
+    assert orders[['code', 'side', 'qty', 'status']].values.tolist() == [
+        ['HK.00700', BUY, 5000, 'FILLED_ALL'],
+        ['HK.00700', BUY, 800, 'FILLED_ALL'],
+        ['HK.00005', SELL, 1200, 'FILLED_ALL'],
+        ['HK.00700', SELL, 5800, 'FILLED_ALL'],
+    ]
+    assert server.positions == {'HK.00700': 0, 'HK.00005': 0}
+    # the lot size of each code is looked up once
+    assert opend.requests['get_stock_basicinfo'] == 1
+
+
+def test_sell_waits_for_the_pending_buy(opend):
+    server = FakeTradeServer(cash=100000.0, fill_delay=0.05)
+    with executor_for(server, opend, lot_size=100) as executor:
+        executor.submit(signal('HK.00700', '2020-04-01 00:00:00', BUY, 10.0))
+        executor.submit(signal('HK.00700', '2020-04-02 00:00:00', SELL, 11.0))
+        assert executor.wait(5)
+    assert executor.orders()['qty'].tolist() == [10000, 10000]
+    assert 'get_stock_basicinfo' not in opend.requests
+
+
+def test_records_the_latency_of_every_phase(opend):
+    server = FakeTradeServer(cash=100000.0, ack_delay=0.002, fill_delay=0.01)
+    fills = []
+    with executor_for(server, opend, lot_size=100, on_fill=fills.append) as executor:
+        for day in range(1, 4):
+            executor.submit(signal('HK.00700', '2020-04-0%d 00:00:00' % day, BUY, 10.0))
+        assert executor.wait(5)
+
+    report = executor.latency_report()
+    assert len(fills) == 3
+    for phase in PHASES:
+        assert report[phase]['count'] == 3
+        assert 0 <= report[phase]['p50'] <= report[phase]['p99'] <= report[phase]['max']
+    assert report['submit_to_ack']['max'] >= 0.002
+    assert report['ack_to_fill']['max'] >= 0.01
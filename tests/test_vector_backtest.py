@@ -0,0 +1,71 @@
+import backtrader as bt
+import pandas as pd
+import pytest
+
+import vector_backtest
+from kdj_all_strategy import TheStrategy
+from kdj_strategy import KDJ_Strategy
+from my_sizer import FixedPerc
+from param_sweep import run_once
+from synthetic import make_bars
+
+CASH = 50000
+COMMISSION = 0.0003
+
+
+class Fills(bt.Analyzer):
+    '''(datetime, is buy, price, size) of every completed order'''
+
+    def start(self):
+        self.fills = []
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.fills.append((order.data.datetime.datetime(0), order.isbuy(),
+                               order.executed.price, abs(order.executed.size)))
+
+
+def run_cerebro(bars, strategy, perc):
+    cerebro = bt.Cerebro(cheat_on_open=True, stdstats=False)
+    cerebro.broker.set_cash(CASH)
+    cerebro.broker.addcommissioninfo(bt.commissions.CommInfo_Stocks_Perc(commission=COMMISSION, percabs=True))
+    cerebro.adddata(bt.feeds.PandasData(dataname=bars))
+    cerebro.addstrategy(strategy)
+    cerebro.addsizer(FixedPerc, perc=perc)
+    cerebro.addanalyzer(Fills, _name='fills')
+    strategy = cerebro.run()[0]
+    return strategy.analyzers.fills.fills, cerebro.broker.getvalue()
+
+
+@pytest.mark.parametrize('strategy', [TheStrategy, KDJ_Strategy])
+@pytest.mark.parametrize('perc', [1, 0.5])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_backtest_kdj_matches_cerebro(seed, perc, strategy):
+    bars = make_bars(3000, seed)
+    fills, value = run_cerebro(bars, strategy, perc)
+    trades, equity, _ = vector_backtest.backtest_kdj(bars, cash=CASH, commission=COMMISSION, perc=perc)
+
+    assert len(trades)
+    expected = []
+    for trade in trades.itertuples(index=False):
+        expected.append((trade.entry_dt, True, trade.entry_price, trade.size))
+        expected.append((trade.exit_dt, False, trade.exit_price, trade.size))
+    # 最后一笔买入可能还没有卖出，不在 trades 里
+    assert len(fills) - len(expected) in (0, 1)
+    assert all(isbuy for _, isbuy, _, _ in fills[len(expected):])
+    for (dt, isbuy, price, size), (dt_v, isbuy_v, price_v, size_v) in zip(fills, expected):
+        assert (dt, isbuy, size) == (dt_v.to_pydatetime(), isbuy_v, size_v)
+        assert price == pytest.approx(price_v, rel=1e-12)
+    assert value == pytest.approx(equity.iloc[-1], rel=1e-9)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_backtest_kdj_stats_with_warmup_over_year_end(seed):
+    # warm-up 的 35 根 K 线跨年，按年收益要把 warm-up 也算进去才和分析器一致
+    bars = make_bars(600, seed)
+    bars.index = pd.bdate_range('2010-12-10', periods=len(bars), name='datetime')
+    expected = run_once(bars, KDJ_Strategy, {}, cash=CASH, commission=COMMISSION)
+    _, _, stats = vector_backtest.backtest_kdj(bars, cash=CASH, commission=COMMISSION)
+    assert stats['trades'] == expected['trades']
+    for key in ('roi', 'sharpe', 'sqn'):
+        assert stats[key] == pytest.approx(expected[key], rel=1e-9), key
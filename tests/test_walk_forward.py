@@ -0,0 +1,63 @@
+import backtrader as bt
+import numpy as np
+import pytest
+
+import metrics
+from kdj_strategy import KDJ_Strategy
+from macd_strategy import TheStrategy
+from synthetic import make_bars, write_export
+from walk_forward import WindowCache, folds, walk_forward
+
+
+def test_folds_tile_the_history():
+    assert folds(10, 4, 3) == [(0, 4, 4, 7), (3, 7, 7, 10)]
+    assert folds(10, 4, 3, anchored=True) == [(0, 4, 4, 7), (0, 7, 7, 10)]
+    assert folds(6, 4, 3) == []
+
+
+def test_folds_with_a_step_other_than_test():
+    assert folds(12, 4, 2, step=3) == [(0, 4, 4, 6), (3, 7, 7, 9), (6, 10, 10, 12)]
+    assert folds(12, 4, 2, step=3, anchored=True) == [(0, 4, 4, 6), (0, 7, 7, 9), (0, 10, 10, 12)]
+    # overlapping test windows
+    assert folds(8, 4, 3, step=1) == [(0, 4, 4, 7), (1, 5, 5, 8)]
+
+
+def indicator_lines(strategy):
+    '''Every line of every indicator of ``strategy``, in ``__init__`` order'''
+    return [np.array(line.array) for ind in strategy.getindicators() for line in ind.lines]
+
+
+def run_lines(bars, strategy, cache):
+    cerebro = bt.Cerebro(cheat_on_open=True, stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(dataname=bars))
+    cerebro.addstrategy(strategy, indicator_cache=cache)
+    return indicator_lines(cerebro.run()[0])
+
+
+@pytest.mark.parametrize('strategy', [KDJ_Strategy, TheStrategy])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_window_run_matches_the_full_history(seed, strategy):
+    bars = make_bars(1500, seed)
+    # backtrader's own indicators over the whole history
+    full = run_lines(bars, strategy, None)
+    cache = WindowCache(bars)
+    misses = None
+    for lo, hi, test_lo, test_hi in folds(len(bars), 600, 300, step=200):
+        for start, stop in ((lo, hi), (test_lo, test_hi)):
+            window = run_lines(bars.iloc[start:stop], strategy, cache.window(start))
+            assert len(window) == len(full)
+            for values, expected in zip(window, full):
+                assert not np.isnan(values[-1])
+                np.testing.assert_allclose(values, expected[start:stop], rtol=1e-9, atol=1e-9, equal_nan=True)
+            misses = cache.misses if misses is None else misses
+    # the first window computed every indicator on the full history, the others only took slices
+    assert cache.misses == misses
+    assert cache.hits > misses
+
+
+def test_walk_forward_stats_use_the_ktype_periods(workdir, periods):
+    path = write_export(workdir / 'data' / 'weekly.xlsx', make_bars(600, freq='W-FRI'))
+    result = walk_forward(path, KDJ_Strategy, [{'macd1': 8}, {'macd1': 12}], 200, 100, workers=1,
+                          ktype='K_WEEK')
+    assert len(result.folds) == 4
+    assert periods == [metrics.periods_per_year('K_WEEK')]